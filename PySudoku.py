@@ -1,20 +1,71 @@
 import sys, os, random, pygame
-sys.path.append(os.path.join("objects"))
-import SudokuSquare
-from GameResources import *
+from objects import SudokuSquare
+from objects.GameResources import *
 
 digits = '123456789'
 rows = 'ABCDEFGHI'
+backgroundPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "images", "sudoku-board-bare.jpg")
 
 
-def play(values_list):
+def squareOffsets(x, y):
+    """The top left corner of the square in column x and row y of the board image."""
+    if x in (0, 1, 2):  startX = (x * 57) + 38
+    if x in (3, 4, 5):  startX = (x * 57) + 99
+    if x in (6, 7, 8):  startX = (x * 57) + 159
+
+    if y in (0, 1, 2):  startY = (y * 57) + 35
+    if y in (3, 4, 5):  startY = (y * 57) + 100
+    if y in (6, 7, 8):  startY = (y * 57) + 165
+    return startX, startY
+
+
+def boxNumber(string_number):
+    """The number a box shows: its digit once solved, None while it has several candidates."""
+    if len(string_number) > 1 or string_number == '' or string_number == '.':
+        return None
+    return int(string_number)
+
+
+def startBoard():
+    """Set up the display and draw the empty board on it.
+    Returns:
+        The screen, the background image, and a dict of the squares by box, made once and
+        updated in place frame after frame.
+    """
     pygame.init()
 
 
     size = width, height = 700, 700
     screen = pygame.display.set_mode(size)
 
-    background_image = pygame.image.load("./images/sudoku-board-bare.jpg").convert()
+    background_image = pygame.image.load(backgroundPath).convert()
+
+    theSquares = {}
+    for y in range(9):
+        for x in range(9):
+            startX, startY = squareOffsets(x, y)
+            theSquares[rows[y] + digits[x]] = SudokuSquare.SudokuSquare(None, startX, startY, "N", x, y)
+
+    screen.blit(background_image, (0, 0))
+    for square in theSquares.values():
+        square.draw()
+    return screen, background_image, theSquares
+
+
+def showChanges(theSquares, values, background_image):
+    """Redraw the squares whose number differs in values, and return the rects redrawn."""
+    return [theSquares[box].draw(background_image) for box,string_number in values.items()
+            if theSquares[box].setNumber(boxNumber(string_number or ''))]
+
+
+def play(values_list):
+    """Show each board of values_list in turn in a window, five a second.
+
+    values_list may also hold dicts of the boxes that changed since the frame before, mapped to
+    their new digit or None, as made by solution_recording.frame_changes.
+    """
+    screen, background_image, theSquares = startBoard()
+    pygame.display.flip()
 
     clock = pygame.time.Clock()
 
@@ -24,34 +75,10 @@ def play(values_list):
 
     for values in values_list:
         pygame.event.pump()
-        theSquares = []
-        initXLoc = 0
-        initYLoc = 0
-        startX, startY, editable, number = 0, 0, "N", 0
-        for y in range(9):
-            for x in range(9):
-                if x in (0, 1, 2):  startX = (x * 57) + 38
-                if x in (3, 4, 5):  startX = (x * 57) + 99
-                if x in (6, 7, 8):  startX = (x * 57) + 159
-
-                if y in (0, 1, 2):  startY = (y * 57) + 35
-                if y in (3, 4, 5):  startY = (y * 57) + 100
-                if y in (6, 7, 8):  startY = (y * 57) + 165
-                col = digits[x]
-                row = rows[y]
-                string_number = values[row + col]
-                if len(string_number) > 1 or string_number == '' or string_number == '.':
-                    number = None
-                else:
-                    number = int(string_number)
-                theSquares.append(SudokuSquare.SudokuSquare(number, startX, startY, editable, x, y))
-
-        screen.blit(background_image, (0, 0))
-        for num in theSquares:
-            num.draw()
-
-        pygame.display.flip()
-        pygame.display.update()
+        # Only the squares whose number changed since the last frame are redrawn and updated.
+        dirty = showChanges(theSquares, values, background_image)
+        if dirty:
+            pygame.display.update(dirty)
         clock.tick(5)
 
     # leave game showing until closed by user
@@ -61,6 +88,22 @@ def play(values_list):
                 pygame.quit()
                 quit()
 
+
+def renderFrames(values_list):
+    """Draw the frames of values_list, as for play, without a window, e.g., on a machine with no display.
+
+    Unless SDL_VIDEODRIVER says otherwise, pygame's dummy video driver is used, so the board is
+    drawn on an offscreen surface.
+    Yields:
+        The surface of the board after each frame. It is the same surface every time, redrawn in
+        place, so save or copy it before asking for the next frame.
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    screen, background_image, theSquares = startBoard()
+    for values in values_list:
+        showChanges(theSquares, values, background_image)
+        yield screen
+
 if __name__ == "__main__":
     main()
     sys.exit()
\ No newline at end of file
@@ -2,23 +2,19 @@ import pygame
 
 from pygame import *
 
-def AAfilledRoundedRect(surface,rect,color,radius=0.4):
+# Surfaces built once and blitted on every draw: rounded rectangles by size, color and radius,
+# fonts by name and size, and finished squares by number and colors.
+roundedRects = {}
+fonts = {}
+squareSurfaces = {}
 
-    """
-    AAfilledRoundedRect(surface,rect,color,radius=0.4)
-
-    surface : destination
-    rect    : rectangle
-    color   : rgb or rgba
-    radius  : 0 <= radius <= 1
-    """
 
-    rect         = Rect(rect)
+def roundedRectSurface(size, color, radius=0.4):
+    """A new surface of the given size holding an antialiased rounded rectangle."""
+    rect         = Rect((0, 0), size)
     color        = Color(*color)
     alpha        = color.a
     color.a      = 0
-    pos          = rect.topleft
-    rect.topleft = 0,0
     rectangle    = Surface(rect.size,SRCALPHA)
 
     circle       = Surface([min(rect.size)*3]*2,SRCALPHA)
@@ -38,23 +34,57 @@ def AAfilledRoundedRect(surface,rect,color,radius=0.4):
 
     rectangle.fill(color,special_flags=BLEND_RGBA_MAX)
     rectangle.fill((255,255,255,alpha),special_flags=BLEND_RGBA_MIN)
+    return rectangle
+
+
+def AAfilledRoundedRect(surface,rect,color,radius=0.4):
+
+    """
+    AAfilledRoundedRect(surface,rect,color,radius=0.4)
+
+    surface : destination
+    rect    : rectangle
+    color   : rgb or rgba
+    radius  : 0 <= radius <= 1
+
+    The rectangle is only drawn the first time a size, color and radius is asked for, and
+    blitted from the cache after that.
+    """
 
-    return surface.blit(rectangle,pos)
+    rect = Rect(rect)
+    key = (rect.size, tuple(Color(*color)), radius)
+    rectangle = roundedRects.get(key)
+    if rectangle is None:
+        rectangle = roundedRects[key] = roundedRectSurface(rect.size, color, radius)
+    return surface.blit(rectangle, rect.topleft)
+
+
+def getFont(name='opensans', size=21):
+    font = fonts.get((name, size))
+    if font is None:
+        font = fonts[(name, size)] = pygame.font.SysFont(name, size)
+    return font
+
+
+def squareSurface(number, color, textColor=(255, 255, 255)):
+    """The finished surface of a square: its rounded rectangle with its number, built once per
+    number and colors."""
+    key = (number, color, textColor)
+    square = squareSurfaces.get(key)
+    if square is None:
+        square = Surface((45, 40), SRCALPHA)
+        AAfilledRoundedRect(square, (0, 0, 45, 40), color)
+        square.blit(getFont().render(number, 1, textColor), (17, 4))
+        squareSurfaces[key] = square
+    return square
 
 class SudokuSquare:
     """A sudoku square class."""
     def __init__(self, number=None, offsetX=0, offsetY=0, edit="Y", xLoc=0, yLoc=0):
-        if number != None:
-            number = str(number)
-            self.color = (2, 204, 186)
-        else:
-            number = ""
-            self.color = (255, 255, 255)
-        # print("FONTS", pygame.font.get_fonts())
-        self.font = pygame.font.SysFont('opensans', 21)
-        self.text = self.font.render(number, 1, (255, 255, 255))
-        self.textpos = self.text.get_rect()
-        self.textpos = self.textpos.move(offsetX + 17, offsetY + 4)
+        self.rect = Rect(offsetX, offsetY, 45, 40)
+        self.font = getFont()
+        self.number = False  # Nothing shown yet, so that setNumber always sets the surfaces.
+        self.setNumber(number)
 
         # self.collide = pygame.Surface((25, 22))
         # self.collide = self.collide.convert()
@@ -70,12 +100,26 @@ class SudokuSquare:
         self.offsetX = offsetX
         self.offsetY = offsetY
 
-    def draw(self):
+    def setNumber(self, number):
+        """Show number (None for an empty square) from the next draw on. Returns whether it changed."""
+        if number == self.number:
+            return False
+        self.number = number
+        if number != None:
+            self.color = (2, 204, 186)
+        else:
+            self.color = (255, 255, 255)
+        self.surface = squareSurface("" if number == None else str(number), self.color)
+        return True
+
+    def draw(self, background=None):
+        """Draw the square, over the part of background under it if given, and return the rect drawn."""
         screen = pygame.display.get_surface()
-        AAfilledRoundedRect(screen, (self.offsetX, self.offsetY, 45, 40), self.color)
+        if background is not None:
+            screen.blit(background, self.rect, self.rect)
 
         # screen.blit(self.collide, self.collideRect)
-        screen.blit(self.text, self.textpos)
+        return screen.blit(self.surface, self.rect)
 
 
     def checkCollide(self, collision):
@@ -104,7 +148,7 @@ class SudokuSquare:
             number = ""
         
         if self.edit == "Y":
-            self.text = self.font.render(number, 1, (0, 0, 0))
+            self.surface = squareSurface(number, self.color, (0, 0, 0))
             self.draw()
             return 0
         else:
@@ -1,30 +1,78 @@
 from solution_utils import *
+import solution_bitmask
+import solution_budget
+import solution_dlx
+import solution_utils
+import solution_recording
 
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+from itertools import combinations, compress, islice
+from operator import ne
+from time import perf_counter
 
 
-assignments = []
 only_choice_uses = 0
 naked_twins_uses = 0
 hidden_twins_uses = 0
 search_invocations = 0
+unit_visits = 0  # Number of units scanned by only_choice, naked_twins and hidden_twins.
+board_copies = 0  # Number of boards copied by search to try a digit.
+
+
+def __getattr__(name):
+    # units and peers are built on first use in solution_utils, so `import *` cannot bring them in.
+    if name in ('units', 'peers'):
+        return getattr(solution_utils, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+class RecordedValues(dict):
+    """A values dictionary whose changes through assign_value are told to a recorder.
+
+    See solution_recording for the recorders. Plain dicts are never recorded.
+    """
+    __slots__ = ('recorder',)
+
+    def __init__(self, values, recorder=None):
+        super().__init__(values)
+        self.recorder = recorder
+
+    def copy(self):
+        return RecordedValues(self, self.recorder)
 
 
 def assign_value(values, box, value):
     """
     Please use this function to update your values dictionary!
-    Assigns a value to a given box. If it updates the board record it.
+    Assigns a value to a given box. If the board has a recorder, the change is recorded.
     """
+    if isinstance(values, RecordedValues) and values.recorder is not None:
+        values.recorder.record(values, box, value)
     values[box] = value
-    if len(value) == 1:
-        assignments.append(values.copy())
     return values
 
 
-def naked_twins(values):
+def units_of(*boxes, geometry=diagonal_geometry):
+    """The units of geometry that contain any of boxes, in unitlist order. All units if no boxes are given."""
+    global unit_visits
+
+    if boxes:
+        boxes = set(boxes)
+        unit_subset = [unit for unit in geometry.unitlist if not boxes.isdisjoint(unit)]
+    else:
+        unit_subset = geometry.unitlist
+
+    unit_visits += len(unit_subset)
+    return unit_subset
+
+
+def naked_twins(values, *boxes, geometry=diagonal_geometry):
     """Eliminate values using the naked twins strategy.
     Args:
         values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        boxes: if given, only the units containing these boxes are checked.
+        geometry(Geometry): the units and peers of the Sudoku variant; see solution_utils.geometry.
 
     Returns:
         the values dictionary with the naked twins eliminated from peers.
@@ -32,7 +80,7 @@ def naked_twins(values):
     global naked_twins_uses
 
     # For each unit, propagate the naked-twins constraint.
-    for unit in unitlist:
+    for unit in units_of(*boxes, geometry=geometry):
         # 1) Find all instances of naked twins.
         twins_index = defaultdict(list)
         # twins_index is a mapping from pairs of digits to boxes that contain only those pairs of digits.
@@ -63,18 +111,20 @@ def naked_twins(values):
 
 ### Personalization
 
-def hidden_twins(values):
+def hidden_twins(values, *boxes, geometry=diagonal_geometry):
     """Eliminate values using the hidden twins strategy.
 
     Args:
         values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        boxes: if given, only the units containing these boxes are checked.
+        geometry(Geometry): the units and peers of the Sudoku variant; see solution_utils.geometry.
     Returns:
         the values dictionary with the hidden twins eliminated from peers.
     """
     global hidden_twins_uses
 
     # For each unit, propagate the hidden-twins constraint.
-    for unit in unitlist:
+    for unit in units_of(*boxes, geometry=geometry):
         # 1) Find all instances of hidden twins.
         #   An instance of Hidden Twins exists in a unit when two digits are
         #   permissible in exactly the same two boxes, and only in those two
@@ -108,7 +158,199 @@ def hidden_twins(values):
     return values
 
 
-def sudoku_strategies(values):
+@lru_cache(maxsize=None)
+def unit_intersections(geometry):
+    """The pairs of units that share two or more boxes, for pointing_pairs and box_line_reduction.
+    Args:
+        geometry(Geometry): the units of the Sudoku variant.
+    Returns:
+        A tuple of (block, line, shared) triples, where block is a unit that fits in a square (a
+        square, or e.g. an extra Windoku unit), line is a row, column or diagonal, and shared is the
+        frozenset of boxes they have in common.
+    """
+    def is_block(unit):
+        return (len({box[0] for box in unit}) <= geometry.size and
+                len({box[1:] for box in unit}) <= geometry.size)
+
+    blocks = [unit for unit in geometry.unitlist if is_block(unit)]
+    lines = [unit for unit in geometry.unitlist if not is_block(unit)]
+    return tuple((block, line, frozenset(block).intersection(line))
+                 for block in blocks for line in lines if len(frozenset(block).intersection(line)) >= 2)
+
+
+def remove_confined_digits(values, intersections, boxes, geometry, written=None):
+    """For each (unit, other, shared) in intersections, if the places for a digit in unit all lie in
+    shared, then the digit must go in one of those places, so remove it from the rest of other.
+    The boxes changed are added to written, if given.
+    """
+    for unit, other, shared in intersections:
+        if boxes and boxes.isdisjoint(unit) and boxes.isdisjoint(other):
+            continue
+        for digit in geometry.digits:
+            places = [box for box in unit if digit in values[box]]
+            if len(places) >= 2 and shared.issuperset(places):
+                for box in other:
+                    if box not in shared and digit in values[box]:
+                        assign_value(values, box, values[box].replace(digit, ''))
+                        if written is not None:
+                            written.add(box)
+
+    return values
+
+
+def pointing_pairs(values, *boxes, geometry=diagonal_geometry, written=None):
+    """Eliminate values using the pointing pairs (and triples) strategy.
+
+    If the places for a digit in a square all lie on one row, column or diagonal, the digit
+    cannot go anywhere else on that line.
+
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        boxes: if given, only the squares and lines containing these boxes are checked.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        written(set): if given, the boxes changed are added to it. They may lie beyond the peers
+            of boxes, so propagate asks for them (see wide_strategies).
+    Returns:
+        the values dictionary with the pointed-at digits eliminated from the rest of the lines.
+    """
+    return remove_confined_digits(values, unit_intersections(geometry), set(boxes), geometry, written)
+
+
+def box_line_reduction(values, *boxes, geometry=diagonal_geometry, written=None):
+    """Eliminate values using the box/line reduction strategy, the converse of pointing_pairs.
+
+    If the places for a digit on a row, column or diagonal all lie in one square, the digit
+    cannot go anywhere else in that square.
+
+    Args and return value as for pointing_pairs.
+    """
+    intersections = tuple((line, block, shared) for block,line,shared in unit_intersections(geometry))
+    return remove_confined_digits(values, intersections, set(boxes), geometry, written)
+
+
+def naked_subsets(values, *boxes, geometry=diagonal_geometry, k=3):
+    """Eliminate values using the naked subsets strategy, which generalizes naked twins.
+
+    If k boxes of a unit have only k digits between them, those digits must go in those boxes,
+    so they are removed from the other boxes of the unit.
+
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        boxes: if given, only the units containing these boxes are checked.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        k(int): the size of the subsets.
+    Returns:
+        the values dictionary with the naked subsets eliminated from their units.
+    """
+    for unit in units_of(*boxes, geometry=geometry):
+        candidates = [box for box in unit if 2 <= len(values[box]) <= k]
+        for subset in combinations(candidates, k):
+            digits = set().union(*(values[box] for box in subset))
+            if len(digits) == k:
+                for box in unit:
+                    if box not in subset and not digits.isdisjoint(values[box]):
+                        assign_value(values, box, ''.join(d for d in values[box] if d not in digits))
+
+    return values
+
+
+def hidden_subsets(values, *boxes, geometry=diagonal_geometry, k=3):
+    """Eliminate values using the hidden subsets strategy, which generalizes hidden twins.
+
+    If k digits can only go in the same k boxes of a unit, those boxes must hold those digits, so
+    every other digit is removed from them.
+
+    Args and return value as for naked_subsets.
+    """
+    for unit in units_of(*boxes, geometry=geometry):
+        places = {digit: [box for box in unit if digit in values[box]] for digit in geometry.digits}
+        candidates = [digit for digit in geometry.digits if 2 <= len(places[digit]) <= k]
+        for subset in combinations(candidates, k):
+            subset_places = set().union(*(places[digit] for digit in subset))
+            if len(subset_places) == k:
+                for box in subset_places:
+                    new_vals = ''.join(d for d in values[box] if d in subset)
+                    if new_vals != values[box]:
+                        assign_value(values, box, new_vals)
+
+    return values
+
+
+def naked_triples(values, *boxes, geometry=diagonal_geometry):
+    return naked_subsets(values, *boxes, geometry=geometry, k=3)
+
+
+def naked_quads(values, *boxes, geometry=diagonal_geometry):
+    return naked_subsets(values, *boxes, geometry=geometry, k=4)
+
+
+def hidden_triples(values, *boxes, geometry=diagonal_geometry):
+    return hidden_subsets(values, *boxes, geometry=geometry, k=3)
+
+
+def hidden_quads(values, *boxes, geometry=diagonal_geometry):
+    return hidden_subsets(values, *boxes, geometry=geometry, k=4)
+
+
+def fish(values, geometry=diagonal_geometry, k=2, written=None):
+    """Eliminate values using the fish strategies: X-Wing for k=2, Swordfish for k=3.
+
+    If the places for a digit on each of k rows all lie in the same k columns, the digit must go
+    in those columns on those rows, so it is removed from the rest of the k columns; and likewise
+    with rows and columns swapped.
+
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        geometry(Geometry): the rows and columns of the board.
+        k(int): the number of rows (or columns) in the fish.
+        written(set): if given, the boxes changed are added to it.
+    Returns:
+        the values dictionary with the digits eliminated from the covered columns (or rows).
+    """
+    rows, cols = geometry.rows, geometry.cols
+    for lines, crossing, cross_box in ((rows, cols, lambda line, other: line + other),
+                                       (cols, rows, lambda line, other: other + line)):
+        for digit in geometry.digits:
+            # Maps each line with 2 to k places for the digit to the crossing lines of those places.
+            covers = {}
+            for line in lines:
+                places = [other for other in crossing if digit in values[cross_box(line, other)]]
+                if 2 <= len(places) <= k:
+                    covers[line] = places
+
+            for subset in combinations(covers, k):
+                covered = set().union(*(covers[line] for line in subset))
+                if len(covered) == k:
+                    for line in lines:
+                        if line not in subset:
+                            for other in covered:
+                                box = cross_box(line, other)
+                                if digit in values[box]:
+                                    assign_value(values, box, values[box].replace(digit, ''))
+                                    if written is not None:
+                                        written.add(box)
+
+    return values
+
+
+def x_wing(values, *boxes, geometry=diagonal_geometry, written=None):
+    """The fish strategy with two rows or columns. Always checks the whole board."""
+    return fish(values, geometry, k=2, written=written)
+
+
+def swordfish(values, *boxes, geometry=diagonal_geometry, written=None):
+    """The fish strategy with three rows or columns. Always checks the whole board."""
+    return fish(values, geometry, k=3, written=written)
+
+
+def apply_strategy(strategy, values, boxes, geometry, written=None):
+    """Call strategy on values and boxes, passing written on to it if it is one of wide_strategies."""
+    if written is not None and strategy in wide_strategies:
+        return strategy(values, *boxes, geometry=geometry, written=written)
+    return strategy(values, *boxes, geometry=geometry)
+
+
+def sudoku_strategies(values, *boxes, geometry=diagonal_geometry, profiler=None, strategies=None, written=None):
     """Use all Sudoku strategies to eliminate possibilities and assign digits.
     This is where constraint propagation happens.
 
@@ -117,69 +359,152 @@ def sudoku_strategies(values):
 
     Args:
         values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        boxes: if given, each strategy only looks at these boxes and the units containing them.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        profiler: if given, told the time taken and the candidates removed by each strategy; see
+            solution_profiling.
+        strategies: the strategies to call, in order. Defaults to default_strategies. If this is a
+            StrategySchedule, the schedule decides which strategies to call instead.
+        written(set): if given, the wide strategies add the boxes they change to it.
 
     Returns:
         the values dictionary.
     """
+    if isinstance(strategies, StrategySchedule):
+        return strategies.run(values, *boxes, geometry=geometry, profiler=profiler, written=written)
     # strategies = (eliminate, only_choice)
     # strategies = (eliminate, only_choice, naked_twins)
-    strategies = (eliminate, only_choice, naked_twins, hidden_twins)
+    strategies = strategies or default_strategies
+
+    if profiler is None:
+        for strat in strategies:
+            values = apply_strategy(strat, values, boxes, geometry, written)
+        return values
 
+    candidates = sum(map(len, values.values()))
     for strat in strategies:
-        values = strat(values)
+        t0 = perf_counter()
+        values = apply_strategy(strat, values, boxes, geometry, written)
+        seconds = perf_counter() - t0
+        remaining = sum(map(len, values.values()))
+        profiler.strategy(strat.__name__, seconds, candidates - remaining)
+        candidates = remaining
 
     return values
 
+
+class StrategySchedule:
+    """Run strategies from cheapest to costliest, only escalating when the cheaper ones stall.
+
+    Rather than calling every strategy once per pass, run calls the first strategy until it stops
+    removing candidates, then the next one, and goes back to the first whenever a strategy removes
+    something, so a costly strategy only runs once the cheaper ones can do no more. A strategy
+    other than the first that removes nothing `patience` times in a row is skipped the next
+    `backoff` times it would have run. The first strategy is never skipped and always runs last,
+    which is what catches two boxes of a unit left with the same digit, so it should be eliminate.
+
+    A schedule keeps the recent history of one solve; solve makes a new one for every solve.
+    """
+
+    def __init__(self, strategies=None, patience=2, backoff=4):
+        self.strategies = tuple(strategies or default_strategies)
+        self.patience = patience
+        self.backoff = backoff
+        self.idle = [0] * len(self.strategies)  # Calls in a row that removed nothing, per strategy.
+        self.skips = [0] * len(self.strategies)  # Calls left to skip, per strategy.
+
+    def run(self, values, *boxes, geometry=diagonal_geometry, profiler=None, written=None):
+        """Call the strategies on values until none removes a candidate or a box is left empty.
+        Args and return value as for sudoku_strategies.
+        """
+        strategies, idle, skips = self.strategies, self.idle, self.skips
+        candidates = sum(map(len, values.values()))
+        i = 0
+        while i < len(strategies):
+            if skips[i]:
+                skips[i] -= 1
+                i += 1
+                continue
+
+            t0 = perf_counter()
+            values = apply_strategy(strategies[i], values, boxes, geometry, written)
+            seconds = perf_counter() - t0
+            lengths = list(map(len, values.values()))
+            remaining = sum(lengths)
+            if profiler is not None:
+                profiler.strategy(strategies[i].__name__, seconds, candidates - remaining)
+
+            if remaining < candidates:
+                if 0 in lengths:  # Invalid state; reduce_puzzle will return False.
+                    return values
+                candidates = remaining
+                idle[i] = 0
+                i = 0
+            else:
+                idle[i] += 1
+                if i and idle[i] >= self.patience:
+                    idle[i] = 0
+                    skips[i] = self.backoff
+                i += 1
+
+        return values
+
 ###
 
 
-def grid_values(grid):
+def grid_values(grid, geometry=diagonal_geometry):
     """
     Convert grid into a dict of {square: char} with '123456789' for empties.
     Args:
-        grid(string) - A grid in string form.
+        grid(string) - A grid in string form, with '.' or '0' for empties.
+        geometry(Geometry) - The board the grid is for. Boards larger than 9x9 use the digits
+            '123456789ABCDEFG...' (geometry.digits), and their grids have one character per box.
     Returns:
         A grid in dictionary form
             Keys: The boxes, e.g., 'A1'
             Values: The value in each box, e.g., '8'. If the box has no value, then the value will be '123456789'.
     """
-    assert len(grid) == 81, "Input grid must be a string of length 81 (9x9)"
-    return {box: (digits if val == '.' else val) for box,val in zip(boxes, grid)}
+    n_boxes = len(geometry.boxes)
+    assert len(grid) == n_boxes, "Input grid must be a string of length {0} ({1}x{1})".format(n_boxes, len(geometry.rows))
+    return {box: (geometry.digits if val in '.0' else val) for box,val in zip(geometry.boxes, grid)}
 
 
-def display(values):
+def display(values, geometry=diagonal_geometry):
     """
     Display the values as a 2-D grid.
     Args:
         values(dict): The sudoku in dictionary form
+        geometry(Geometry): The board the values are for.
     """
-    width = 1+max(len(values[s]) for s in boxes)
-    line = '+'.join(['-'*(width*3)]*3)
-    for r in rows:
-        print(''.join(values[r+c].center(width)+('|' if c in '36' else '')
-                      for c in cols))
-        if r in 'CF': print(line)
+    size = geometry.size
+    width = 1+max(len(values[s]) for s in geometry.boxes)
+    line = '+'.join(['-'*(width*size)]*size)
+    for i,r in enumerate(geometry.rows, 1):
+        print(''.join(values[r+c].center(width)+('|' if j % size == 0 and j < len(geometry.cols) else '')
+                      for j,c in enumerate(geometry.cols, 1)))
+        if i % size == 0 and i < len(geometry.rows): print(line)
     return
 
 
-def eliminate(values, *boxes):
+def eliminate(values, *boxes, geometry=diagonal_geometry):
     boxes = boxes or values.keys()
     filled_in_digits = ((box, values[box]) for box in boxes if len(values[box]) == 1)
 
     for box,digit in filled_in_digits:
-        for peer in peers[box]:
-            new_vals = values[peer].replace(digit, '')
-            assign_value(values, peer, new_vals)
-            # If values[peer] is empty, then we're in an invalid state.
+        for peer in geometry.peers[box]:
+            if digit in values[peer]:
+                new_vals = values[peer].replace(digit, '')
+                assign_value(values, peer, new_vals)
+                # If values[peer] is empty, then we're in an invalid state.
 
     return values
 
 
-def only_choice(values):
+def only_choice(values, *boxes, geometry=diagonal_geometry):
     global only_choice_uses
 
-    for u in unitlist:
-        for d in digits:
+    for u in units_of(*boxes, geometry=geometry):
+        for d in geometry.digits:
             d_places = [box for box in u if d in values[box]]
 
             if len(d_places) == 1:
@@ -193,12 +518,66 @@ def only_choice(values):
     return values
 
 
-def reduce_puzzle(values):
+# The strategies solve can be asked for by name, roughly from cheapest to costliest. Strategies
+# are called as strategy(values, *boxes, geometry=geometry) and return values; see register_strategy.
+strategy_registry = {strat.__name__: strat for strat in (
+    eliminate, only_choice, naked_twins, hidden_twins, pointing_pairs, box_line_reduction,
+    naked_triples, hidden_triples, x_wing, naked_quads, hidden_quads, swordfish)}
+
+# The strategies that may change boxes beyond the boxes they are asked to check and their peers.
+# They take a written keyword argument, a set to add every box they change to; see propagate.
+wide_strategies = {pointing_pairs, box_line_reduction, x_wing, swordfish}
+
+# The strategies used unless others are asked for, cheapest first.
+default_strategies = (eliminate, only_choice, naked_twins, hidden_twins)
+
+
+def register_strategy(strategy, name=None, wide=False):
+    """Add a strategy to strategy_registry, under its function name by default, and return it.
+
+    A strategy takes values, any number of boxes and a geometry keyword argument, removes
+    candidates with assign_value, and returns values. When boxes are given it must check at least
+    the units containing them, and it may check more. It may only change those boxes and their
+    peers, unless it is wide: then it also takes a written keyword argument, and adds every box it
+    changes to that set when it is not None.
+    """
+    strategy_registry[name or strategy.__name__] = strategy
+    if wide:
+        wide_strategies.add(strategy)
+    return strategy
+
+
+def resolve_strategies(strategies):
+    """The tuple of strategy functions for strategies, a sequence of functions or registry names."""
+    return tuple(strategy_registry[strat] if isinstance(strat, str) else strat for strat in strategies)
+
+
+def reduce_puzzle(values, incremental=False, changed=(), geometry=diagonal_geometry, profiler=None, strategies=None):
+    """Propagate constraints until the board stalls.
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        incremental(bool): use propagate, which only re-checks boxes around the boxes that changed,
+            instead of sweeping every strategy over the whole board on every pass.
+        changed: the boxes that changed since the board last stalled. Only used when incremental;
+            by default every box is considered changed.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        profiler, strategies: if given, passed on to sudoku_strategies.
+    Returns:
+        the values dictionary. False if the board is in an invalid state.
+    """
+    if incremental:
+        return propagate(values, *changed, geometry=geometry, profiler=profiler, strategies=strategies)
+
+    if isinstance(strategies, StrategySchedule):  # The schedule runs until the board stalls.
+        values = strategies.run(values, geometry=geometry, profiler=profiler)
+        return False if any(len(vals) == 0 for vals in values.values()) else values
+
     stalled = False
+    solved_values_after = sum(len(vals) == 1 for vals in values.values())
 
     while not stalled:
-        solved_values_before = sum(len(vals) == 1 for vals in values.values())
-        vaues = sudoku_strategies(values)  # Use Sudoku strategies to solve for boxes and propagate constraints.
+        solved_values_before = solved_values_after
+        values = sudoku_strategies(values, geometry=geometry, profiler=profiler, strategies=strategies)  # Use Sudoku strategies to solve for boxes and propagate constraints.
         solved_values_after = sum(len(vals) == 1 for vals in values.values())
 
         # If no new values were added, stop the loop.
@@ -211,96 +590,555 @@ def reduce_puzzle(values):
     return values
 
 
-def search(values):
-    global search_invocations
+def propagate(values, *changed, geometry=diagonal_geometry, profiler=None, strategies=None):
+    """Worklist-driven constraint propagation.
+
+    Rather than sweeping every strategy over all units on each pass, keep a worklist of the boxes
+    whose values shrank. Each pass runs the strategies only on those boxes and the units containing
+    them, and the boxes that shrink during the pass become the next worklist. Unlike reduce_puzzle's
+    sweep, which stops once no new box is solved, this runs until no box shrinks at all.
+
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        changed: the boxes to start from. Every box if none are given.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        profiler, strategies: if given, passed on to sudoku_strategies.
+    Returns:
+        the values dictionary. False if the board is in an invalid state.
+    """
+    changed = changed or tuple(values)
+
+    peers = geometry.peers
+    while changed:
+        # Strategies only write to the changed boxes and their peers, so only those can shrink,
+        # except for the wide strategies, which report the boxes they change in written.
+        touched = set(changed)
+        touched.update(*map(peers.__getitem__, changed))
+        touched = sorted(touched)
+        before = list(map(values.__getitem__, touched))
+        written = set()
+        values = sudoku_strategies(values, *changed, geometry=geometry, profiler=profiler, strategies=strategies,
+                                   written=written)
+        changed = list(compress(touched, map(ne, before, map(values.__getitem__, touched))))
+        changed += sorted(written.difference(touched))
+
+        # Sanity check, return False if there is a box with zero available values:
+        if any(len(values[box]) == 0 for box in changed):
+            return False
+
+    return values
+
+
+class Branching:
+    """How search branches: the box to branch on, and the order to try its digits in.
+
+    This base policy is the branching search uses when none is given: the box with the fewest
+    candidates (MRV), ties broken by box name, and its digits in ascending order. A policy may
+    keep state across the nodes of a solve, so solve makes a new one for every solve when asked
+    for a policy by name.
+    """
+
+    def choose(self, values, geometry):
+        """The unsolved box to branch on."""
+        _, best_box = min((len(vals), box) for box,vals in values.items() if len(vals) > 1)
+        return best_box
+
+    def order(self, values, box, geometry):
+        """The digits of box, in the order to try them."""
+        return values[box]
+
+    def failed(self, boxes, geometry):
+        """Called when the boxes just assigned (the branch box of the parent node) lead to an invalid board."""
+
+
+class DegreeBranching(Branching):
+    """MRV, with ties broken by the most unsolved peers (the degree heuristic), then by box name."""
+
+    def choose(self, values, geometry):
+        fewest = min(len(vals) for vals in values.values() if len(vals) > 1)
+        _, best_box = min((-sum(len(values[peer]) > 1 for peer in geometry.peers[box]), box)
+                          for box,vals in values.items() if len(vals) == fewest)
+        return best_box
+
+
+class LeastConstrainingValue(Branching):
+    """MRV, trying first the digits left in the fewest unsolved peers, which rule out the fewest candidates."""
+
+    def order(self, values, box, geometry):
+        peers = [values[peer] for peer in geometry.peers[box] if len(values[peer]) > 1]
+        return sorted(values[box], key=lambda digit: (sum(digit in vals for vals in peers), digit))
+
+
+class WeightedDegree(Branching):
+    """dom/wdeg: the box with the fewest candidates per unit weight, where every unit starts with
+    a weight of 1 and gains 1 whenever assigning one of its boxes leaves an invalid board. Boxes in
+    units that keep failing are branched on first, so the search fails early where it fails at all.
+    """
+
+    def __init__(self):
+        self.weights = defaultdict(lambda: 1)  # Maps each unit to its weight.
+
+    def choose(self, values, geometry):
+        weights = self.weights
+        _, best_box = min((len(vals) / sum(weights[unit] for unit in geometry.units[box]), box)
+                          for box,vals in values.items() if len(vals) > 1)
+        return best_box
+
+    def failed(self, boxes, geometry):
+        for box in boxes:
+            for unit in geometry.units[box]:
+                self.weights[unit] += 1
+
+
+# The branching policies solve can be asked for by name.
+branching_policies = {'mrv': Branching, 'degree': DegreeBranching, 'lcv': LeastConstrainingValue,
+                      'wdeg': WeightedDegree}
+
+
+def resolve_branching(branching):
+    """A new branching policy for a name in branching_policies, or branching itself if it is a policy."""
+    return branching_policies[branching]() if isinstance(branching, str) else branching
+
+
+class DeadEnds:
+    """A bounded table of reduced boards that search has proven to have no solution.
+
+    A board is dead whatever path reached it, so search prunes a board found in the table without
+    searching it again. The branches of one search place different digits in a box, so no board is
+    reached twice within one tree; the table pays off when it is shared by the solves of related
+    grids, e.g., variants of one puzzle with a few clues removed. The least recently used boards are
+    evicted first.
+
+    Attributes:
+        maxsize(int): the most boards kept.
+        hits, stores, evictions(int): boards pruned, added and evicted.
+    """
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self.boards = OrderedDict()
+        self.hits = self.stores = self.evictions = 0
+
+    @staticmethod
+    def key(values, geometry):
+        return geometry, tuple(values.values())
+
+    def __contains__(self, key):
+        if key in self.boards:
+            self.boards.move_to_end(key)
+            self.hits += 1
+            return True
+        return False
+
+    def add(self, key):
+        self.boards[key] = None
+        self.stores += 1
+        if len(self.boards) > self.maxsize:
+            self.boards.popitem(last=False)
+            self.evictions += 1
+
+
+def search(values, incremental=False, changed=(), geometry=diagonal_geometry, profiler=None, depth=0,
+           strategies=None, budget=None, branching=None, dead_ends=None):
+    global search_invocations, board_copies
     search_invocations += 1
+    if profiler is not None:
+        profiler.node(depth)
+    if budget is not None:
+        budget.node(depth)
 
     # First, reduce the puzzle using the previous function.
-    values = reduce_puzzle(values)
+    values = reduce_puzzle(values, incremental, changed, geometry, profiler, strategies)
 
     if values is False:  # Base case: board in invalid state.
+        if branching is not None:
+            branching.failed(changed, geometry)
         return False
     elif all(len(vals) == 1 for vals in values.values()):  # Base case: board solved.
         return values
 
-    # Choose one of the unfilled squares with the fewest possibilities.
-    _, best_box = min((len(vals), box) for box,vals in values.items() if len(vals) > 1)
+    if dead_ends is not None:
+        key = dead_ends.key(values, geometry)
+        if key in dead_ends:
+            return False
+
+    if branching is None:
+        # Choose one of the unfilled squares with the fewest possibilities.
+        _, best_box = min((len(vals), box) for box,vals in values.items() if len(vals) > 1)
+        digits = values[best_box]
+    else:
+        best_box = branching.choose(values, geometry)
+        digits = branching.order(values, best_box, geometry)
 
     # Now use recursion to solve each one of the resulting sudokus, and if one returns a
     # value (not False), return that answer! Otherwise, return False.
-    for digit in values[best_box]:
+    for digit in digits:
         new_sudoku = values.copy()
+        board_copies += 1
         assign_value(new_sudoku, best_box, digit)
-        solution = search(new_sudoku)
+        solution = search(new_sudoku, incremental, [best_box], geometry,  # The parent board had stalled.
+                          profiler, depth + 1, strategies, budget, branching, dead_ends)
 
         if solution is not False:
             return solution
+        if profiler is not None:
+            profiler.backtrack(depth)
 
+    if dead_ends is not None:
+        dead_ends.add(key)
     return False
 
 
-def solve(grid):
+class TrailedValues(RecordedValues):
+    """A values dictionary that logs the old value of the boxes it overwrites to an undo trail.
+
+    This lets search_in_place change one board in place and roll it back when a branch fails,
+    instead of copying the whole board for every digit it tries. The trail is a flat list of
+    alternating boxes and old values, and each box is logged at most once per checkpoint, so a
+    level of the search costs at most 81 trail entries and allocates nothing per write.
+    """
+    __slots__ = ('trail', 'level', 'logged_at')
+
+    def __init__(self, values, recorder=None):
+        super().__init__(values, recorder)
+        self.trail = []  # [box, old_value, box, old_value, ...], oldest first.
+        self.level = 0  # Incremented by every checkpoint, and never reused.
+        self.logged_at = {}  # Maps each box to the level at which its old value was last logged.
+
+    def __setitem__(self, box, value):
+        old_value = self[box]
+        if old_value != value:
+            if self.logged_at.get(box) != self.level:
+                self.logged_at[box] = self.level
+                self.trail.append(box)
+                self.trail.append(old_value)
+            dict.__setitem__(self, box, value)
+
+    def checkpoint(self):
+        """Start a new level of the trail and return a mark that undo can roll back to."""
+        self.level += 1
+        return len(self.trail)
+
+    def undo(self, mark):
+        """Roll the board back to the state it was in when checkpoint returned mark."""
+        trail = self.trail
+        while len(trail) > mark:
+            old_value = trail.pop()
+            dict.__setitem__(self, trail.pop(), old_value)
+        self.level += 1  # Boxes written after an undo must be logged again.
+        if self.recorder is not None:
+            self.recorder.sync(self)
+
+
+def search_in_place(values, incremental=False, changed=(), geometry=diagonal_geometry, profiler=None, depth=0,
+                    strategies=None, budget=None, branching=None, dead_ends=None):
+    """Same search as `search`, but on a single board that is rolled back on failure.
+    Args:
+        values(TrailedValues): the board, which is changed in place.
+        incremental(bool), changed, geometry(Geometry), profiler, strategies: as for reduce_puzzle.
+        depth(int): the depth of this board in the search tree, for the profiler.
+        budget: a solution_budget.Budget to report every node to, or None.
+        branching(Branching): the branching policy, or None for the default one.
+        dead_ends(DeadEnds): a table of dead boards to prune and add to, or None.
+    Returns:
+        values, solved. False if no solution exists, in which case values is rolled back.
+    """
+    global search_invocations
+    search_invocations += 1
+    if profiler is not None:
+        profiler.node(depth)
+    if budget is not None:
+        budget.node(depth)
+    mark = values.checkpoint()
+
+    # First, reduce the puzzle. The strategies change values in place.
+    if reduce_puzzle(values, incremental, changed, geometry, profiler, strategies) is False:  # Base case: board in invalid state.
+        if branching is not None:
+            branching.failed(changed, geometry)
+        values.undo(mark)
+        return False
+    elif all(len(vals) == 1 for vals in values.values()):  # Base case: board solved.
+        return values
+
+    if dead_ends is not None:
+        key = dead_ends.key(values, geometry)
+        if key in dead_ends:
+            values.undo(mark)
+            return False
+
+    if branching is None:
+        # Choose one of the unfilled squares with the fewest possibilities.
+        _, best_box = min((len(vals), box) for box,vals in values.items() if len(vals) > 1)
+        digits = values[best_box]
+    else:
+        best_box = branching.choose(values, geometry)
+        digits = branching.order(values, best_box, geometry)
+
+    # Try each digit on the same board, rolling back to branch_mark whenever a branch fails.
+    branch_mark = values.checkpoint()
+    for digit in digits:
+        assign_value(values, best_box, digit)
+
+        if search_in_place(values, incremental, [best_box], geometry, profiler, depth + 1, strategies,
+                           budget, branching, dead_ends) is not False:
+            return values
+
+        values.undo(branch_mark)
+        if profiler is not None:
+            profiler.backtrack(depth)
+
+    if dead_ends is not None:
+        dead_ends.add(key)
+    values.undo(mark)
+    return False
+
+
+backends = ('propagation', 'dlx', 'numpy')
+
+
+def solve(grid, bitmask=False, incremental=False, trail=False, recorder=None, geometry=diagonal_geometry,
+          profiler=None, strategies=None, adaptive=False, backend='propagation', max_nodes=None, deadline=None,
+          budget=None, branching=None, dead_ends=None):
     """
     Find the solution to a Sudoku grid.
     Args:
         grid(string): a string representing a sudoku grid.
             Example: '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
+        bitmask(bool): solve with the bitmask engine in solution_bitmask instead of string-valued
+            dicts. Boards solved this way are not recorded, except by recorder.finish.
+        incremental(bool): propagate constraints from a worklist of changed boxes (see propagate)
+            instead of sweeping the whole board. Ignored by the bitmask engine.
+        trail(bool): search with search_in_place, which undoes failed branches on one board
+            instead of copying the board for each branch. Ignored by the bitmask engine.
+        recorder: one of the recorders in solution_recording, to record the boards of this solve
+            for visualize_assignments. By default nothing is recorded.
+        geometry(Geometry): the units and peers of the Sudoku variant, from solution_utils.geometry.
+            Defaults to diagonal Sudoku; use standard_geometry for standard Sudoku.
+        profiler: a solution_profiling.StrategyProfiler, to add up the time and the candidates
+            removed per strategy and the nodes and backtracks of the search. Off by default.
+        strategies: the strategies to propagate constraints with, cheapest first, as functions or as
+            names in strategy_registry. Defaults to default_strategies. Ignored by the bitmask engine.
+        adaptive(bool): schedule the strategies with a StrategySchedule, which only runs costly
+            strategies once the cheap ones stall, instead of running them all on every pass.
+            Ignored by the bitmask engine.
+        backend(string): 'propagation' to search with constraint propagation as above, or 'dlx'
+            to solve the grid as an exact-cover problem with Dancing Links (see solution_dlx), in
+            which case bitmask, incremental, trail, strategies and adaptive are ignored, and
+            boards are not recorded except by recorder.finish. 'numpy' runs the vectorized
+            engine of solution_numpy, which needs NumPy and pays off on batches of grids (see
+            solution_batch.solve_many), on a batch of one; the same options are ignored, and the
+            profiler too.
+        max_nodes(int): stop once the search has visited this many boards.
+        deadline(float): stop once the solve has taken this many seconds.
+        budget: a solution_budget.Budget to bound the search with instead of max_nodes and
+            deadline, e.g., to cancel the solve from another thread.
+        branching: the branching policy of the search, as a name in branching_policies ('mrv',
+            'degree', 'lcv' or 'wdeg') or a Branching. Defaults to MRV with ties broken by box
+            name. Ignored by the bitmask engine and the other backends.
+        dead_ends: a DeadEnds table of boards proven dead, to share between solves, or the size of
+            one to make for this solve. Off by default. Ignored as branching is.
     Returns:
         The dictionary representation of the final sudoku grid. False if no solution exists.
+    Raises:
+        solution_budget.BudgetExceeded: if the search ran out of its budget before finishing,
+            with the statistics of the search so far.
+    """
+    if backend not in backends:
+        raise ValueError('unknown backend {!r}; expected one of {}'.format(backend, ', '.join(backends)))
+    values = grid_values(grid, geometry)
+    if strategies is not None:
+        strategies = resolve_strategies(strategies)
+    if adaptive:
+        strategies = StrategySchedule(strategies)
+    if budget is None and (max_nodes is not None or deadline is not None):
+        budget = solution_budget.Budget(max_nodes, deadline)
+    if branching is not None:
+        branching = resolve_branching(branching)
+    if isinstance(dead_ends, int):
+        dead_ends = DeadEnds(dead_ends)
+    if backend == 'dlx':
+        solution = solution_dlx.solve_values(values, geometry, profiler, budget)
+    elif backend == 'numpy':
+        import solution_numpy  # Imported on first use, as NumPy is slow to import.
+        solution = solution_numpy.solve_values(values, geometry, budget)
+    elif bitmask:
+        solution = solution_bitmask.solve_values(values, geometry, profiler, budget)
+    elif trail:
+        solution = search_in_place(TrailedValues(values, recorder), incremental, geometry=geometry, profiler=profiler,
+                                   strategies=strategies, budget=budget, branching=branching, dead_ends=dead_ends)
+    elif recorder is not None:
+        solution = search(RecordedValues(values, recorder), incremental, geometry=geometry, profiler=profiler,
+                          strategies=strategies, budget=budget, branching=branching, dead_ends=dead_ends)
+    else:
+        solution = search(values, incremental, geometry=geometry, profiler=profiler, strategies=strategies,
+                          budget=budget, branching=branching, dead_ends=dead_ends)
+
+    if recorder is not None:
+        recorder.finish(solution)
+    return solution and dict(solution)
+
+
+def count_solutions(grid, limit=2, geometry=diagonal_geometry, backend='propagation'):
+    """
+    Count the solutions of a Sudoku grid, stopping as soon as limit of them are found.
+    Args:
+        grid(string): a string representing a sudoku grid, as for solve.
+        limit(int): the most solutions to count; None to count them all.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        backend(string): 'propagation' to count with the search of the bitmask engine, or 'dlx'
+            to count with Dancing Links. Neither builds a values dictionary per solution. 'numpy'
+            counts as 'propagation' does.
+    Returns:
+        The number of solutions, at most limit.
     """
-    return search(grid_values(grid))
-
-
-def benchmark():
-    from time import time
-    global unitlist, units, peers
-    unitlist = row_units + column_units + square_units
-    units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
-    peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
-
-    overall_time = 0
-    n_iterations = 10
-    hardest = [  # From http://norvig.com/hardest.txt
-        '85...24..72......9..4.........1.7..23.5...9...4...........8..7..17..........36.4.',
-        '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..',
-        '12..4......5.69.1...9...5.........7.7...52.9..3......2.9.6...5.4..9..8.1..3...9.4',
-        '...57..3.1......2.7...234......8...4..7..4...49....6.5.42...3.....7..9....18.....',
-        '7..1523........92....3.....1....47.8.......6............9...5.6.4.9.7...8....6.1.',
-        '1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..',
-        '1...34.8....8..5....4.6..21.18......3..1.2..6......81.52..7.9....6..9....9.64...2',
-        '...92......68.3...19..7...623..4.1....1...7....8.3..297...8..91...5.72......64...',
-        '.6.5.4.3.1...9...8.........9...5...6.4.6.2.7.7...4...5.........4...8...1.5.2.3.4.',
-        '7.....4...2..7..8...3..8.799..5..3...6..2..9...1.97..6...3..9...3..4..6...9..1.35',
-        '....7..2.8.......6.1.2.5...9.54....8.........3....85.1...3.2.8.4.......9.7..6....'
-    ]
-
-    for _ in range(n_iterations):
-        t0 = time()
-        for grid in hardest:
-            solve(grid)
-        overall_time += (time() - t0)
-
-    average_time = overall_time / n_iterations
+    if backend not in backends:
+        raise ValueError('unknown backend {!r}; expected one of {}'.format(backend, ', '.join(backends)))
+    values = grid_values(grid, geometry)
+    if backend == 'dlx':
+        return sum(1 for _ in islice(solution_dlx.ExactCover(values, geometry).solutions(), limit))
+    return solution_bitmask.count_solutions(solution_bitmask.cells_from_values(values, geometry), geometry, limit)
+
+
+def is_unique(grid, geometry=diagonal_geometry, backend='propagation'):
+    """Whether a Sudoku grid has exactly one solution, i.e., is a well-formed puzzle."""
+    return count_solutions(grid, 2, geometry, backend) == 1
+
+
+def benchmark(bitmask=False, incremental=False, trail=False, adaptive=False, backend='propagation', corpus='hardest'):
+    """Benchmark solve on one of the corpora in puzzles/ with solution_benchmark, and print a report.
+
+    With incremental=True the corpus is also run with full sweeps, to show how many unit visits
+    the worklist saves. See solution_benchmark for the full suite and for comparing saved runs.
+    """
+    import solution_benchmark
+
+    options = {name: True for name,value in (('bitmask', bitmask), ('incremental', incremental), ('trail', trail),
+                                             ('adaptive', adaptive)) if value}
+    if backend != 'propagation':
+        options['backend'] = backend
+    results = solution_benchmark.run([corpus], memory=True, **options)
+    print()
+    solution_benchmark.report(results)
+
+    if incremental and not bitmask:
+        visits = results['corpora'][corpus]['counters']['unit_visits']
+        sweep = solution_benchmark.run([corpus], repeat=1, warmup=0, trail=trail, adaptive=adaptive)
+        sweep_visits = sweep['corpora'][corpus]['counters']['unit_visits']
+        print('unit_visits: {}; with full sweeps: {}; saved: {:.1%}'.format(visits, sweep_visits,
+                                                                           1 - visits / sweep_visits))
+
+
+def benchmark_backends(corpora=None):
+    """Benchmark the constraint-propagation search against the Dancing Links backend on the
+    corpora in puzzles/ (all of them by default), and print the change in each metric.
+    """
+    import solution_benchmark
+
+    propagation = solution_benchmark.run(corpora)
+    dlx = solution_benchmark.run(corpora, backend='dlx')
     print()
-    print('Benchmarking: average of {} seconds to solve all 11 Sudoku grids.'.format(average_time))
+    for results in (propagation, dlx):
+        solution_benchmark.report(results)
+    changes, _ = solution_benchmark.compare(propagation, dlx, threshold=float('inf'))
+    print('\npropagation -> dlx:')
+    for name,metric,old,new,change in changes:
+        if metric in solution_benchmark.latency_metrics + solution_benchmark.throughput_metrics + ('search_invocations',):
+            print('{:>9} {:>20}: {:>12.6g} -> {:>12.6g} ({:+.1%})'.format(name, metric, old, new, change))
+
+
+def benchmark_strategies(corpus='hardest'):
+    """Report how far each strategy in strategy_registry, added to default_strategies, cuts down
+    search_invocations on one of the corpora in puzzles/, and what it costs in time.
+    """
+    import solution_benchmark
+
+    print()
+    extras = [None] + [name for name,strat in strategy_registry.items() if strat not in default_strategies]
+    for name in extras:
+        strategies = [strat.__name__ for strat in default_strategies] + ([name] if name else [])
+        results = solution_benchmark.run([corpus], repeat=1, strategies=strategies)['corpora'][corpus]
+        print('{:>18}: {:4d} search invocations, {:7.1f} puzzles per second'.format(
+            '+ ' + name if name else 'default strategies', results['counters']['search_invocations'],
+            results['puzzles_per_second']))
+
+
+def benchmark_branching(corpus='hardest'):
+    """Report the search_invocations and the time of each policy in branching_policies on one of
+    the corpora in puzzles/, and of the default policy with a DeadEnds table shared by the corpus.
+    """
+    import solution_benchmark
+
+    print()
+    for name in list(branching_policies) + ['mrv + dead_ends']:
+        options = {'dead_ends': DeadEnds()} if name == 'mrv + dead_ends' else {'branching': name}
+        # No warm-up pass, which would fill the table with the dead ends of the timed pass.
+        results = solution_benchmark.run([corpus], repeat=1, warmup=0, **options)['corpora'][corpus]
+        print('{:>16}: {:4d} search invocations, {:7.1f} puzzles per second'.format(
+            name, results['counters']['search_invocations'], results['puzzles_per_second']))
 
-    print('only_choice_uses: {}; naked_twins_uses: {}; hidden_twins_uses: {}'.format(only_choice_uses // n_iterations,
-                                                                                     naked_twins_uses // n_iterations,
-                                                                                     hidden_twins_uses // n_iterations))
-    print('search_invocations: {}'.format(search_invocations // n_iterations))
 
-    unitlist = row_units + column_units + square_units + diagonal_units
-    units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
-    peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
+def benchmark_parallel(corpus='hardest', workers=None):
+    """Compare the latency of the bitmask search of each puzzle of one of the corpora in puzzles/
+    with that of solution_parallel, which splits the search of a puzzle over a pool of workers.
+    """
+    import solution_benchmark
+    import solution_parallel
+
+    grids = solution_benchmark.load_corpus(corpus)
+    geometry = solution_benchmark.corpora[corpus][1]
+    print()
+    with solution_parallel.ParallelSolver(workers) as solver:
+        for name,solve_one in (('sequential', lambda grid: solve(grid, bitmask=True, geometry=geometry)),
+                               ('parallel ({} workers)'.format(solver.workers), lambda grid: solver.solve(grid, geometry))):
+            seconds = []
+            for grid in grids:
+                t0 = perf_counter()
+                solve_one(grid)
+                seconds.append(perf_counter() - t0)
+            seconds.sort()
+            print('{:>22}: p50 {:.5f}, p95 {:.5f}, max {:.5f} seconds per puzzle'.format(
+                name, solution_benchmark.percentile(seconds, 0.50), solution_benchmark.percentile(seconds, 0.95),
+                seconds[-1]))
+
+
+def benchmark_sizes(n_puzzles=5, blank_fraction=0.4, sizes=(2, 3, 4, 5)):
+    """Report how solve time scales with board size, from 4x4 up to 25x25.
+
+    The puzzles are standard (non-diagonal) boards made by blanking a fraction of the boxes of a
+    patterned full grid with its digits shuffled, using a fixed seed so that runs are comparable.
+    """
+    from random import Random
+
+    print()
+    for size in sizes:
+        geometry = solution_utils.geometry(size=size)
+        side = len(geometry.digits)
+        rng = Random(size)
+        grids = []
+        for _ in range(n_puzzles):
+            shuffled = rng.sample(geometry.digits, side)
+            full = [shuffled[(size*(r % size) + r//size + c) % side] for r in range(side) for c in range(side)]
+            for i in rng.sample(range(side*side), int(blank_fraction*side*side)):
+                full[i] = '.'
+            grids.append(''.join(full))
+
+        for bitmask in (False, True):
+            t0 = perf_counter()
+            for grid in grids:
+                solve(grid, bitmask=bitmask, geometry=geometry)
+            average_time = (perf_counter() - t0) / n_puzzles
+            print('{0}x{0} ({1}): average of {2:.5f} seconds per grid.'.format(
+                side, 'bitmask' if bitmask else 'strings', average_time))
 
 
 if __name__ == '__main__':
     diag_sudoku_grid = '2.............62....1....7...6..8...3...9...7...6..4...4....8....52.............3'
-    display(solve(diag_sudoku_grid))
+    recorder = solution_recording.DeltaRecorder()
+    display(solve(diag_sudoku_grid, recorder=recorder))
 
     try:
         from visualize import visualize_assignments
-        visualize_assignments(assignments)
+        visualize_assignments(recorder)
 
     except SystemExit:
         pass
@@ -0,0 +1,191 @@
+"""Solve many grids at once, or count their solutions, fanned out over a pool of worker processes.
+
+Grids are sent to the workers in chunks, and each worker sends back compact solution strings rather
+than values dictionaries to keep inter-process traffic small. Each chunk also sends back how much it
+moved the strategy counters in solution (or solution_bitmask), so the counters for a batch can be
+combined without relying on the module globals of any one process. The Dancing Links backend only
+counts search_invocations. The NumPy backend solves each chunk as one vectorized batch (see
+solution_numpy), and counts the strategies of the bitmask search that finishes the boards it cannot.
+With max_nodes or deadline in the options, every grid gets its own budget (see solution_budget), and
+a grid that runs out of it gets budget_exceeded in place of a solution.
+"""
+import solution
+import solution_bitmask
+import solution_budget
+import solution_dlx
+import solution_utils
+
+from collections import Counter, deque
+from itertools import islice
+from time import perf_counter
+import os
+
+
+counter_names = ('only_choice_uses', 'naked_twins_uses', 'hidden_twins_uses', 'search_invocations')
+
+budget_exceeded = '?'  # The solution of a grid whose search ran out of budget.
+
+
+def solution_string(values, geometry=solution_utils.diagonal_geometry):
+    """The grid string (81 characters for 9x9) of a solved values dictionary, or None if there is no solution."""
+    return ''.join(values[box] for box in geometry.boxes) if values else None
+
+
+def counters_module(options, counting=False):
+    """The module whose counters solving (or counting solutions) with options moves."""
+    if options.get('backend') == 'dlx':
+        return solution_dlx
+    return solution_bitmask if counting or options.get('bitmask') or options.get('backend') == 'numpy' else solution
+
+
+def solve_chunk(grids, options):
+    """Solve a list of grids in this process.
+    Args:
+        grids(list): grids in the string form accepted by solution.solve.
+        options(dict): keyword arguments for solution.solve.
+    Returns:
+        A triple of the list of solution strings (None where there is no solution, and
+        budget_exceeded where the budget ran out), the list of seconds taken to solve each grid,
+        and a dict of how much solving them increased each of the counters in counter_names.
+    """
+    module = counters_module(options)
+    geometry = options.get('geometry', solution_utils.diagonal_geometry)
+    before = [getattr(module, name, 0) for name in counter_names]
+    solutions, seconds = [], []
+    if options.get('backend') == 'numpy':
+        import solution_numpy  # Imported on first use, as NumPy is slow to import.
+
+        # The chunk is solved as one batch, so each grid is charged an equal share of its time.
+        t0 = perf_counter()
+        solutions = solution_numpy.solve_grids(grids, geometry, options.get('max_nodes'), options.get('deadline'))
+        solutions = [budget_exceeded if isinstance(sol, solution_budget.BudgetExceeded) else sol for sol in solutions]
+        seconds = [(perf_counter() - t0) / len(grids)] * len(grids)
+    else:
+        for grid in grids:
+            t0 = perf_counter()
+            try:
+                solutions.append(solution_string(solution.solve(grid, **options), geometry))
+            except solution_budget.BudgetExceeded:
+                solutions.append(budget_exceeded)
+            seconds.append(perf_counter() - t0)
+    counters = {name: getattr(module, name, 0) - start for name,start in zip(counter_names, before)}
+    return solutions, seconds, counters
+
+
+def count_chunk(grids, options):
+    """Count the solutions of a list of grids in this process.
+    Args:
+        grids(list): grids in the string form accepted by solution.count_solutions.
+        options(dict): keyword arguments for solution.count_solutions, e.g. limit=2.
+    Returns:
+        A triple as for solve_chunk, with the number of solutions of each grid in place of its
+        solution string.
+    """
+    module = counters_module(options, counting=True)
+    before = [getattr(module, name, 0) for name in counter_names]
+    counts, seconds = [], []
+    for grid in grids:
+        t0 = perf_counter()
+        counts.append(solution.count_solutions(grid, **options))
+        seconds.append(perf_counter() - t0)
+    counters = {name: getattr(module, name, 0) - start for name,start in zip(counter_names, before)}
+    return counts, seconds, counters
+
+
+def chunked(iterable, size):
+    """Yield successive lists of size items from iterable; the last one may be shorter."""
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def solve_many(grids, workers=None, chunksize=64, ordered=True, counters=None, timed=False, **options):
+    """Solve an iterable of grids across a pool of worker processes.
+
+    Grids are read from the iterable lazily, and at most two chunks per worker are in flight at a
+    time, so an arbitrarily long iterable is solved in bounded memory.
+
+    Args:
+        grids: an iterable of grids in the string form accepted by solution.solve.
+        workers(int): number of worker processes. Defaults to the number of CPUs. With workers=0
+            the grids are solved in this process.
+        chunksize(int): number of grids sent to a worker at a time.
+        ordered(bool): yield solutions in input order. Otherwise yield (index, solution) pairs as
+            soon as their chunk is finished, where index is the position of the grid in the input.
+        counters(Counter): if given, the strategy counters of every chunk are added to it.
+        timed(bool): yield (solution, seconds) pairs in place of solutions, where seconds is the
+            time the worker took to solve the grid.
+        options: keyword arguments for solution.solve, e.g. bitmask=True.
+    Yields:
+        81-character solution strings, or None where a grid has no solution.
+    """
+    return map_chunks(solve_chunk, grids, workers, chunksize, ordered, counters, timed, options)
+
+
+def count_many(grids, workers=None, chunksize=64, ordered=True, counters=None, timed=False, limit=2, **options):
+    """Count the solutions of an iterable of grids across a pool of worker processes.
+
+    Args as for solve_many, and limit is passed on to solution.count_solutions. With the default
+    limit of 2, a count of 1 means the grid is a well-formed puzzle.
+    Yields:
+        The number of solutions of each grid, up to limit, in place of solution strings.
+    """
+    return map_chunks(count_chunk, grids, workers, chunksize, ordered, counters, timed, dict(options, limit=limit))
+
+
+def map_chunks(function, grids, workers, chunksize, ordered, counters, timed, options):
+    """Run function(chunk, options) on chunks of grids, as described for solve_many, and yield its results."""
+    chunks = chunked(grids, chunksize)
+    if counters is None:
+        counters = Counter()
+
+    def results(start, outputs, seconds):
+        for i,sol in enumerate(outputs):
+            if timed:
+                sol = (sol, seconds[i])
+            yield sol if ordered else (start + i, sol)
+
+    if workers == 0:
+        start = 0
+        for chunk in chunks:
+            outputs, seconds, chunk_counters = function(chunk, options)
+            counters.update(chunk_counters)
+            yield from results(start, outputs, seconds)
+            start += len(chunk)
+        return
+
+    # Imported here, as multiprocessing takes longer to import than the solver itself.
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = 2 * workers
+
+    with ProcessPoolExecutor(workers) as executor:
+        def submit(start, chunk):
+            future = executor.submit(function, chunk, options)
+            future.start = start  # Index of the chunk's first grid in the input.
+            return future
+
+        pending = deque() if ordered else set()
+        add = pending.append if ordered else pending.add
+        start = 0
+        for chunk in islice(chunks, max_pending):
+            add(submit(start, chunk))
+            start += len(chunk)
+
+        while pending:
+            if ordered:
+                done = [pending.popleft()]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                pending -= done
+
+            for future in done:
+                outputs, seconds, chunk_counters = future.result()
+                counters.update(chunk_counters)
+                for chunk in islice(chunks, 1):  # Refill the pool before yielding.
+                    add(submit(start, chunk))
+                    start += len(chunk)
+                yield from results(future.start, outputs, seconds)
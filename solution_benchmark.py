@@ -0,0 +1,292 @@
+"""Benchmark suite for the solver.
+
+Solves the corpora bundled in puzzles/ and reports, for each corpus, the per-puzzle latency
+(p50, p95 and max), the number of puzzles solved per second, and the strategy counters, which are
+reset before every run so that repeated runs report the same numbers. With --profile, an extra
+untimed pass reports the time and the candidates removed per strategy (see solution_profiling). With --startup,
+the run also times how long a fresh interpreter takes to import each of startup_modules, which short-lived
+CLI runs and worker processes pay every time. Results can be saved as JSON and two saved runs compared,
+flagging any corpus (or import) that got slower.
+
+Usage:
+    python solution_benchmark.py run [--corpus NAME ...] [--repeat N] [--warmup N] [--profile] [--startup] [--out FILE] ...
+    python solution_benchmark.py compare BASELINE.json CURRENT.json [--threshold 0.1]
+"""
+import solution
+import solution_batch
+import solution_profiling
+import solution_utils
+from solution_utils import percentile
+
+from time import perf_counter
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tracemalloc
+
+
+puzzles_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'puzzles')
+
+# Maps each corpus to its file in puzzles_dir and the Sudoku variant of its puzzles.
+corpora = {
+    'easy': ('easy.txt', solution_utils.standard_geometry),
+    'hard': ('hard.txt', solution_utils.standard_geometry),
+    'hardest': ('hardest.txt', solution_utils.standard_geometry),
+    '17clue': ('17clue.txt', solution_utils.standard_geometry),
+    'diagonal': ('diagonal.txt', solution_utils.diagonal_geometry),
+}
+
+counter_names = ('only_choice_uses', 'naked_twins_uses', 'hidden_twins_uses', 'search_invocations',
+                 'unit_visits', 'board_copies')
+
+# The modules whose cold import time --startup measures.
+startup_modules = ('solution', 'solution_batch', 'solution_cli', 'solution_service', 'visualize')
+
+# Latency metrics, where higher is worse, and throughput metrics, where lower is worse.
+latency_metrics = ('p50', 'p95', 'max')
+throughput_metrics = ('puzzles_per_second',)
+
+
+def load_corpus(name):
+    """The grids of a corpus, one per non-blank line of its file; lines starting with '#' are comments."""
+    filename, _ = corpora[name]
+    with open(os.path.join(puzzles_dir, filename)) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def reset_counters(module):
+    for name in counter_names:
+        if hasattr(module, name):
+            setattr(module, name, 0)
+
+
+def read_counters(module):
+    return {name: getattr(module, name) for name in counter_names if hasattr(module, name)}
+
+
+def run_corpus(name, repeat=3, warmup=1, memory=False, profile=False, **options):
+    """Benchmark solution.solve on one corpus.
+    Args:
+        name(string): the corpus, one of corpora.
+        repeat(int): timed passes over the corpus. Each puzzle's latency is its fastest pass.
+        warmup(int): untimed passes over the corpus before the timed ones.
+        memory(bool): also make a pass under tracemalloc to measure the peak memory of a solve.
+        profile(bool): also make a pass with a StrategyProfiler, whose profile is kept under 'profile'.
+        options: keyword arguments for solution.solve, e.g. incremental=True.
+    Returns:
+        A dictionary of the corpus's results, ready to be saved as JSON.
+    """
+    grids = load_corpus(name)
+    geometry = corpora[name][1]
+    module = solution_batch.counters_module(options)
+
+    for _ in range(warmup):
+        for grid in grids:
+            solution.solve(grid, geometry=geometry, **options)
+
+    reset_counters(module)
+    latencies = [float('inf')] * len(grids)
+    total_time = 0
+    n_solved = 0
+    for _ in range(repeat):
+        n_solved = 0
+        for i,grid in enumerate(grids):
+            t0 = perf_counter()
+            solved = solution.solve(grid, geometry=geometry, **options)
+            seconds = perf_counter() - t0
+            latencies[i] = min(latencies[i], seconds)
+            total_time += seconds
+            n_solved += bool(solved)
+    counters = {name: count // repeat for name,count in read_counters(module).items()}
+
+    latencies.sort()
+    results = {
+        'n_puzzles': len(grids),
+        'n_solved': n_solved,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'max': latencies[-1],
+        'puzzles_per_second': repeat * len(grids) / total_time,
+        'counters': counters,
+    }
+
+    if memory:
+        peak_memory = 0
+        for grid in grids:
+            tracemalloc.start()
+            solution.solve(grid, geometry=geometry, **options)
+            peak_memory = max(peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results['peak_memory'] = peak_memory
+
+    if profile:
+        profiler = solution_profiling.StrategyProfiler()
+        for grid in grids:
+            solution.solve(grid, geometry=geometry, profiler=profiler, **options)
+        results['profile'] = profiler.as_dict()
+
+    return results
+
+
+def import_times(modules=startup_modules, repeat=5):
+    """The seconds a fresh interpreter takes to import each module, the least of repeat tries.
+
+    Every try runs in a new python process, so nothing the module needs is imported already.
+    Returns:
+        A dict mapping each module to its import time.
+    """
+    code = 'from time import perf_counter; t0 = perf_counter(); import {}; print(perf_counter() - t0)'
+    directory = os.path.dirname(os.path.abspath(__file__))
+    times = {}
+    for module in modules:
+        times[module] = min(float(subprocess.run([sys.executable, '-c', code.format(module)], cwd=directory,
+                                                 capture_output=True, check=True, text=True).stdout)
+                            for _ in range(repeat))
+    return times
+
+
+def run(names=None, repeat=3, warmup=1, memory=False, profile=False, startup=False, **options):
+    """Benchmark every corpus in names (all corpora by default) and return the results for saving.
+
+    With startup=True the import times of startup_modules are kept under 'startup'.
+    """
+    results = {
+        'options': options,
+        'repeat': repeat,
+        'warmup': warmup,
+        'corpora': {name: run_corpus(name, repeat, warmup, memory, profile, **options)
+                    for name in names or sorted(corpora)},
+    }
+    if startup:
+        results['startup'] = import_times()
+    return results
+
+
+def report(results, out=sys.stdout):
+    """Print a table of results, as returned by run."""
+    # Options may be objects, e.g., a Geometry or a DeadEnds table, which are shown by their repr.
+    print('options: {}'.format(json.dumps(results['options'], sort_keys=True, default=repr)), file=out)
+    for name,corpus in sorted(results['corpora'].items()):
+        print('{:>9}: {:3d}/{:3d} solved; p50 {:.2f} ms, p95 {:.2f} ms, max {:.2f} ms; {:.1f} puzzles per second'.format(
+            name, corpus['n_solved'], corpus['n_puzzles'], 1000 * corpus['p50'], 1000 * corpus['p95'],
+            1000 * corpus['max'], corpus['puzzles_per_second']), file=out)
+        if 'peak_memory' in corpus:
+            print('{:>9}  peak memory of a single solve: {:.1f} KiB'.format('', corpus['peak_memory'] / 1024), file=out)
+        print('{:>9}  {}'.format('', '; '.join('{}: {}'.format(name, count)
+                                               for name,count in sorted(corpus['counters'].items()))), file=out)
+        if 'profile' in corpus:
+            profile = corpus['profile']
+            for strategy,stats in sorted(profile['strategies'].items(), key=lambda item: -item[1]['seconds']):
+                print('{:>9}  {:>12}: {:.4f} s in {} calls, {} candidates removed, {:.1%} of calls idle'.format(
+                    '', strategy, stats['seconds'], stats['calls'], stats['eliminated'],
+                    stats['idle_calls'] / stats['calls']), file=out)
+            print('{:>9}  search: {} nodes, {} backtracks, max depth {}'.format(
+                '', profile['nodes'], profile['backtracks'], profile['max_depth']), file=out)
+    if 'startup' in results:
+        print('{:>9}: {}'.format('startup', '; '.join('import {} {:.1f} ms'.format(module, 1000 * seconds)
+                                                      for module,seconds in results['startup'].items())), file=out)
+
+
+def compare(baseline, current, threshold=0.10):
+    """Compare two saved runs.
+    Args:
+        baseline, current(dict): results as returned by run.
+        threshold(float): relative change beyond which a metric counts as a regression.
+    Returns:
+        A list of (corpus, metric, baseline_value, current_value, relative_change) tuples, one for
+        every metric of every corpus the runs have in common, and a list of the ones that regressed.
+    """
+    changes, regressions = [], []
+    for name in sorted(set(baseline['corpora']) & set(current['corpora'])):
+        before, after = baseline['corpora'][name], current['corpora'][name]
+        metrics = latency_metrics + throughput_metrics
+        counters = sorted(set(before['counters']) & set(after['counters']))
+        values = [(m, before[m], after[m]) for m in metrics] + \
+                 [(c, before['counters'][c], after['counters'][c]) for c in counters]
+
+        for metric,old,new in values:
+            change = (new - old) / old if old else 0.0
+            changes.append((name, metric, old, new, change))
+            if (metric in latency_metrics and change > threshold or
+                    metric in throughput_metrics and change < -threshold):
+                regressions.append((name, metric, old, new, change))
+
+    before, after = baseline.get('startup', {}), current.get('startup', {})
+    for module in sorted(set(before) & set(after)):
+        old, new = before[module], after[module]
+        change = (new - old) / old if old else 0.0
+        changes.append(('startup', 'import ' + module, old, new, change))
+        if change > threshold:
+            regressions.append(changes[-1])
+
+    return changes, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Sudoku solver.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    run_parser = subparsers.add_parser('run', help='benchmark the solver on the bundled corpora')
+    run_parser.add_argument('--corpus', action='append', choices=sorted(corpora),
+                            help='corpus to run; may be repeated (default: all)')
+    run_parser.add_argument('--repeat', type=int, default=3, help='timed passes over each corpus')
+    run_parser.add_argument('--warmup', type=int, default=1, help='untimed passes before timing')
+    run_parser.add_argument('--memory', action='store_true', help='also measure peak memory per solve')
+    run_parser.add_argument('--profile', action='store_true', help='also profile each strategy and the search')
+    run_parser.add_argument('--startup', action='store_true', help='also time the cold import of the main modules')
+    run_parser.add_argument('--out', help='save the results as JSON to this file')
+    run_parser.add_argument('--bitmask', action='store_true', help='use the bitmask engine')
+    run_parser.add_argument('--incremental', action='store_true', help='use worklist-driven propagation')
+    run_parser.add_argument('--trail', action='store_true', help='use the in-place search with an undo trail')
+    run_parser.add_argument('--adaptive', action='store_true', help='only run costly strategies once cheap ones stall')
+    run_parser.add_argument('--backend', choices=solution.backends, default='propagation',
+                            help='search with constraint propagation or with Dancing Links (default: propagation)')
+    run_parser.add_argument('--strategy', action='append', choices=sorted(solution.strategy_registry),
+                            dest='strategies', help='strategy to use; may be repeated (default: the default strategies)')
+    run_parser.add_argument('--branching', choices=sorted(solution.branching_policies),
+                            help='branching policy of the search (default: mrv)')
+
+    compare_parser = subparsers.add_parser('compare', help='compare two saved runs and flag regressions')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10,
+                                help='relative slowdown that counts as a regression (default: 0.10)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        options = {name: True for name in ('bitmask', 'incremental', 'trail', 'adaptive') if getattr(args, name)}
+        if args.strategies:
+            options['strategies'] = args.strategies
+        if args.branching:
+            options['branching'] = args.branching
+        if args.backend != 'propagation':
+            options['backend'] = args.backend
+        results = run(args.corpus, args.repeat, args.warmup, args.memory, args.profile, args.startup, **options)
+        report(results)
+        if args.out:
+            with open(args.out, 'w') as f:
+                json.dump(results, f, indent=2, sort_keys=True, default=repr)
+
+    elif args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        changes, regressions = compare(baseline, current, args.threshold)
+        for name,metric,old,new,change in changes:
+            flag = '  REGRESSION' if (name, metric, old, new, change) in regressions else ''
+            print('{:>9} {:>20}: {:>12.6g} -> {:>12.6g} ({:+.1%}){}'.format(name, metric, old, new, change, flag))
+        return 1 if regressions else 0
+
+    else:
+        parser.print_help()
+        return 2
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
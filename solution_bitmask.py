@@ -0,0 +1,321 @@
+"""Bitmask candidate engine.
+
+An alternative solver core to the string-valued `values` dicts used in solution.py. Each box's
+permissible digits are stored as an integer with one bit per digit (bit 0 is digit '1', bit 8 is
+digit '9') in a flat list of cells, indexed in the same row-wise order as `geometry.boxes`. Removing
+candidates is then a bitwise AND rather than a `str.replace` that allocates a new string, and
+boards up to 25x25 need no more than an int per box. The unit and peer tables come from the index
+tables of a solution_utils.Geometry.
+"""
+from solution_utils import diagonal_geometry
+
+from collections import defaultdict
+from functools import lru_cache
+from time import perf_counter
+
+
+only_choice_uses = 0
+naked_twins_uses = 0
+hidden_twins_uses = 0
+search_invocations = 0
+
+
+class WidePopcounts:
+    """Popcounts of masks wider than 16 bits, looked up 16 bits at a time."""
+
+    def __init__(self, low_popcounts):
+        self.low_popcounts = low_popcounts
+
+    def __getitem__(self, mask):
+        return self.low_popcounts[mask & 0xFFFF] + self.low_popcounts[mask >> 16]
+
+
+@lru_cache(maxsize=None)
+def popcount_table(n_digits):
+    "Table indexed by candidate masks of n_digits bits, giving the number of permissible digits."
+    if n_digits > 16:
+        return WidePopcounts(popcount_table(16))
+    return tuple(bin(mask).count('1') for mask in range(1 << n_digits))
+
+
+def popcount(mask):
+    "Number of permissible digits in mask."
+    return bin(mask).count('1')
+
+
+def lowest_bit(mask):
+    "The lowest set bit of mask, i.e., the mask of its smallest permissible digit."
+    return mask & -mask
+
+
+def cells_from_values(values, geometry=diagonal_geometry):
+    """Convert a values dictionary into a list of candidate bitmasks.
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        geometry(Geometry): the board the values are for.
+    Returns:
+        A list of ints, where cells[i] holds the candidates of geometry.boxes[i].
+    """
+    digit_bits = {d: 1 << i for i,d in enumerate(geometry.digits)}
+    return [sum(digit_bits[d] for d in values[box]) for box in geometry.boxes]
+
+
+def values_from_cells(cells, geometry=diagonal_geometry):
+    """Convert a list of candidate bitmasks back into a values dictionary.
+    Args:
+        cells(list): a list of ints as returned by cells_from_values.
+        geometry(Geometry): the board the cells are for.
+    Returns:
+        A dictionary of the form {'box_name': '123456789', ...}
+    """
+    digit_bits = [(d, 1 << i) for i,d in enumerate(geometry.digits)]
+    return {box: ''.join(d for d,bit in digit_bits if mask & bit) for box,mask in zip(geometry.boxes, cells)}
+
+
+def eliminate(cells, *indices, geometry=diagonal_geometry):
+    indices = indices or range(len(cells))
+    popcounts = popcount_table(len(geometry.digits))
+    filled_in = ((i, cells[i]) for i in indices if popcounts[cells[i]] == 1)
+    peer_indices = geometry.peer_indices
+
+    for i,bit in filled_in:
+        clear = ~bit
+        for peer in peer_indices[i]:
+            cells[peer] &= clear
+            # If cells[peer] is zero, then we're in an invalid state.
+
+    return cells
+
+
+def only_choice(cells, geometry=diagonal_geometry):
+    global only_choice_uses
+    popcounts = popcount_table(len(geometry.digits))
+
+    for unit in geometry.unit_indices:
+        # Fold the unit's masks into the digits seen at least once and the digits seen at least twice.
+        once = twice = 0
+        for i in unit:
+            twice |= once & cells[i]
+            once |= cells[i]
+        only_once = once & ~twice
+
+        if only_once:
+            for i in unit:
+                choice = cells[i] & only_once
+                if choice and cells[i] != choice:
+                    # If choice has more than one bit, two digits can only go in this box, and the
+                    # resulting invalid state will be caught upstream by reduce_puzzle.
+                    cells[i] = choice if popcounts[choice] == 1 else 0
+                    # Keep track of how many times this strategy makes a change on the board.
+                    only_choice_uses += 1
+
+    return cells
+
+
+def naked_twins(cells, geometry=diagonal_geometry):
+    """Eliminate values using the naked twins strategy.
+    Args:
+        cells(list): a list of 81 candidate bitmasks.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+
+    Returns:
+        the cells list with the naked twins eliminated from peers.
+    """
+    global naked_twins_uses
+    popcounts = popcount_table(len(geometry.digits))
+
+    for unit in geometry.unit_indices:
+        # 1) Find all instances of naked twins: maps a two-digit mask to the boxes that hold it.
+        twins_index = defaultdict(list)
+        for i in unit:
+            if popcounts[cells[i]] == 2:
+                twins_index[cells[i]].append(i)
+        twins = [(pair, indices) for pair,indices in twins_index.items() if len(indices) >= 2]
+
+        # 2) Eliminate the naked twins as possibilities for their peers. As in solution.naked_twins,
+        # only the first two boxes count as the twins; any excess boxes end up empty.
+        for pair,indices in twins:
+            first, second = indices[0], indices[1]
+            for i in unit:
+                if i != first and i != second and cells[i] & pair:
+                    cells[i] &= ~pair
+                    # Keep track of how many times this strategy makes a change on the board.
+                    naked_twins_uses += 1
+
+    return cells
+
+
+def hidden_twins(cells, geometry=diagonal_geometry):
+    """Eliminate values using the hidden twins strategy.
+
+    Args:
+        cells(list): a list of 81 candidate bitmasks.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+    Returns:
+        the cells list with the hidden twins eliminated from peers.
+    """
+    global hidden_twins_uses
+    popcounts = popcount_table(len(geometry.digits))
+    digit_bits = [1 << i for i in range(len(geometry.digits))]
+
+    for unit in geometry.unit_indices:
+        # 1) Find all instances of hidden twins: two digits permissible in exactly the same two boxes.
+        twins_index = defaultdict(int)  # Maps pairs of boxes to the mask of their common permissible digits.
+        for bit in digit_bits:
+            places = [i for i in unit if cells[i] & bit]
+            if len(places) == 2:
+                twins_index[tuple(places)] |= bit
+        twins = ((pair, places) for places,pair in twins_index.items() if popcounts[pair] == 2)
+
+        # 2) Assign the hidden twins to their boxes.
+        for pair,places in twins:
+            for i in places:
+                if cells[i] != pair:
+                    cells[i] = pair
+                    # Keep track of how many times this strategy makes a change on the board.
+                    hidden_twins_uses += 1
+
+    return cells
+
+
+def sudoku_strategies(cells, geometry=diagonal_geometry, profiler=None):
+    """Bitmask counterpart of solution.sudoku_strategies.
+
+    Args:
+        cells(list): a list of 81 candidate bitmasks.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        profiler: if given, told the time taken and the candidates removed by each strategy.
+
+    Returns:
+        the cells list.
+    """
+    strategies = (eliminate, only_choice, naked_twins, hidden_twins)
+
+    if profiler is None:
+        for strat in strategies:
+            cells = strat(cells, geometry=geometry)
+        return cells
+
+    popcounts = popcount_table(len(geometry.digits))
+    candidates = sum(popcounts[mask] for mask in cells)
+    for strat in strategies:
+        t0 = perf_counter()
+        cells = strat(cells, geometry=geometry)
+        seconds = perf_counter() - t0
+        remaining = sum(popcounts[mask] for mask in cells)
+        profiler.strategy(strat.__name__, seconds, candidates - remaining)
+        candidates = remaining
+
+    return cells
+
+
+def reduce_puzzle(cells, geometry=diagonal_geometry, profiler=None):
+    popcounts = popcount_table(len(geometry.digits))
+    stalled = False
+
+    while not stalled:
+        solved_before = sum(popcounts[mask] == 1 for mask in cells)
+        cells = sudoku_strategies(cells, geometry, profiler)
+        solved_after = sum(popcounts[mask] == 1 for mask in cells)
+
+        # If no new values were added, stop the loop.
+        stalled = (solved_before == solved_after)
+
+        # Sanity check, return False if there is a box with zero available values:
+        if 0 in cells:
+            return False
+
+    return cells
+
+
+def search(cells, geometry=diagonal_geometry, profiler=None, depth=0, budget=None):
+    global search_invocations
+    search_invocations += 1
+    if profiler is not None:
+        profiler.node(depth)
+    if budget is not None:
+        budget.node(depth)
+    popcounts = popcount_table(len(geometry.digits))
+
+    cells = reduce_puzzle(cells, geometry, profiler)
+
+    if cells is False:  # Base case: board in invalid state.
+        return False
+    elif all(popcounts[mask] == 1 for mask in cells):  # Base case: board solved.
+        return cells
+
+    # Choose one of the unfilled boxes with the fewest possibilities. Up to 9x9, indices are in the
+    # same order as box names, so ties are broken exactly as in solution.search.
+    _, best = min((popcounts[mask], i) for i,mask in enumerate(cells) if popcounts[mask] > 1)
+
+    # Try each permissible digit of the best box in ascending order.
+    remaining = cells[best]
+    while remaining:
+        bit = lowest_bit(remaining)
+        remaining ^= bit
+        new_cells = cells[:]
+        new_cells[best] = bit
+        solution = search(new_cells, geometry, profiler, depth + 1, budget)
+
+        if solution is not False:
+            return solution
+        if profiler is not None:
+            profiler.backtrack(depth)
+
+    return False
+
+
+def count_solutions(cells, geometry=diagonal_geometry, limit=2, budget=None, depth=0):
+    """Count the solutions of a board, stopping as soon as limit of them are found.
+    Args:
+        cells(list): a list of candidate bitmasks, which is changed in place.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        limit(int): the most solutions to count; None to count them all.
+        budget: if given, a solution_budget.Budget to report every node to.
+        depth(int): the depth of this board in the search tree, for the budget.
+    Returns:
+        The number of solutions, at most limit.
+    """
+    global search_invocations
+    if limit == 0:
+        return 0
+    search_invocations += 1
+    if budget is not None:
+        budget.node(depth)
+    popcounts = popcount_table(len(geometry.digits))
+
+    cells = reduce_puzzle(cells, geometry)
+
+    if cells is False:  # Base case: board in invalid state.
+        return 0
+    elif all(popcounts[mask] == 1 for mask in cells):  # Base case: board solved.
+        return 1
+
+    _, best = min((popcounts[mask], i) for i,mask in enumerate(cells) if popcounts[mask] > 1)
+
+    # The branches place different digits in the best box, so no solution is counted twice.
+    count = 0
+    remaining = cells[best]
+    while remaining and (limit is None or count < limit):
+        bit = lowest_bit(remaining)
+        remaining ^= bit
+        new_cells = cells[:]
+        new_cells[best] = bit
+        count += count_solutions(new_cells, geometry, None if limit is None else limit - count, budget, depth + 1)
+
+    return count
+
+
+def solve_values(values, geometry=diagonal_geometry, profiler=None, budget=None):
+    """
+    Solve a Sudoku in dictionary form with the bitmask engine.
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        profiler: if given, a solution_profiling.StrategyProfiler to report to.
+        budget: if given, a solution_budget.Budget to report every node to.
+    Returns:
+        The dictionary representation of the final sudoku grid. False if no solution exists.
+    """
+    cells = search(cells_from_values(values, geometry), geometry, profiler, budget=budget)
+    return cells and values_from_cells(cells, geometry)
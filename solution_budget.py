@@ -0,0 +1,107 @@
+"""Budgets that bound the search of a solve, and cooperative cancellation.
+
+A Budget is passed to solve like a profiler, and every search node of every backend reports to it.
+Once the search has visited more than max_nodes boards, has run past its deadline, or has been
+cancelled, the node raises BudgetExceeded, which unwinds the search and leaves solve with the
+partial statistics of the search so far. The budget is only checked between nodes, so a solve
+overruns its deadline by at most the time to reduce one board.
+
+Cancelling is safe from any thread: it sets a flag that the solving thread reads at its next node.
+A budget can also watch an event, e.g., a multiprocessing.Event shared by the searches of several
+processes, which cancels all of them at once when set (see solution_parallel). solve_async runs a
+solve on a thread for asyncio callers, and cancels it if they are cancelled.
+"""
+import solution
+
+from functools import partial
+from time import perf_counter
+
+
+class BudgetExceeded(Exception):
+    """Raised by a search that ran out of budget.
+
+    Attributes:
+        reason(string): 'max_nodes', 'deadline' or 'cancelled'.
+        nodes(int): the boards searched before stopping.
+        max_depth(int): the deepest level the search reached.
+        seconds(float): the wall time from the start of the budget to stopping.
+    """
+
+    def __init__(self, reason, budget):
+        self.reason = reason
+        self.nodes = budget.nodes
+        self.max_depth = budget.max_depth
+        self.seconds = perf_counter() - budget.started
+        super().__init__('budget exceeded ({}) after {} nodes, max depth {}, in {:.3f} seconds'.format(
+            reason, self.nodes, self.max_depth, self.seconds))
+
+
+class Budget:
+    """Limits on the search of one solve. The clock starts when the budget is made.
+
+    Attributes:
+        max_nodes(int): the most boards the search may visit, or None.
+        deadline(float): the most seconds the solve may take, or None.
+        nodes(int), max_depth(int): the boards searched so far, and the deepest level reached.
+        cancelled(bool): set by cancel.
+        event: an object with an is_set method, such as a threading.Event or a
+            multiprocessing.Event, that cancels the solve when set, or None.
+    """
+
+    def __init__(self, max_nodes=None, deadline=None, event=None):
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.event = event
+        self.nodes = 0
+        self.max_depth = 0
+        self.cancelled = False
+        self.started = perf_counter()
+        self.stop_at = None if deadline is None else self.started + deadline
+
+    def cancel(self):
+        """Stop the solve at its next node. Safe to call from another thread."""
+        self.cancelled = True
+
+    def node(self, depth):
+        """Called by search on entering a board at the given depth.
+        Raises:
+            BudgetExceeded: if the search must stop.
+        """
+        self.nodes += 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if self.cancelled or (self.event is not None and self.event.is_set()):
+            raise BudgetExceeded('cancelled', self)
+        if self.max_nodes is not None and self.nodes > self.max_nodes:
+            raise BudgetExceeded('max_nodes', self)
+        if self.stop_at is not None and perf_counter() > self.stop_at:
+            raise BudgetExceeded('deadline', self)
+
+
+async def solve_async(grid, executor=None, budget=None, **options):
+    """Run solution.solve on a thread of executor (the loop's default one if None).
+
+    If the awaiting task is cancelled, e.g., by asyncio.wait_for timing out, the budget is
+    cancelled so that the thread stops at its next node instead of running on.
+    Args:
+        grid(string): the grid, as for solution.solve.
+        executor: a concurrent.futures.ThreadPoolExecutor, or None.
+        budget(Budget): the budget of the solve. Defaults to a Budget of the max_nodes and
+            deadline in options, if any.
+        options: keyword arguments for solution.solve.
+    Returns:
+        The solution, as returned by solution.solve.
+    Raises:
+        BudgetExceeded: if the solve ran out of budget.
+    """
+    import asyncio  # Only asyncio callers pay for importing it.
+
+    if budget is None:
+        budget = Budget(options.pop('max_nodes', None), options.pop('deadline', None))
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, partial(solution.solve, grid, budget=budget, **options))
+    try:
+        return await future
+    except asyncio.CancelledError:
+        budget.cancel()
+        raise
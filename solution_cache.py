@@ -0,0 +1,276 @@
+"""A cache of solutions in front of solution.solve, keyed by the canonical form of each grid.
+
+Grids that are the same puzzle up to a symmetry share one entry. The symmetries are digit
+relabelings and, on standard boards, transposition and permutations of the rows within each band
+and of the columns within each stack. On diagonal boards only the symmetries that map the two
+diagonals onto themselves are used: the eight rotations and reflections of the board, and the
+permutations that move rows and columns together and commute with turning the board upside down.
+Boards with extra units are only canonicalized up to digit relabeling.
+
+The canonical form of a grid is the least of its transformed grids, comparing first where the
+clues are (blanks first) and then the clues themselves, with the digits relabeled in order of
+first appearance. The solution stored for a key is a solution of the canonical grid itself, so a
+hit is mapped back to the asking grid by undoing its own transformation.
+"""
+import solution
+import solution_utils
+
+from collections import OrderedDict
+from functools import lru_cache
+from itertools import permutations, product
+import dbm
+
+
+# Give up on a symmetric grid with more transformations than this tied for least clue layout, and
+# fall back to canonicalizing it up to digit relabeling only.
+max_candidates = 2048
+
+
+def stack_permutations(size):
+    """The permutations of range(size**2) that only move indices within their block of size."""
+    blocks = [[tuple(size * block + i for i in perm) for perm in permutations(range(size))] for block in range(size)]
+    return [sum(choice, ()) for choice in product(*blocks)]
+
+
+@lru_cache(maxsize=None)
+def column_tables(size):
+    """For each permutation p of stack_permutations(size), the permutation and a table that maps
+    the clue layout of a row (an int with a bit per column, the first column highest) to the
+    layout of the row with its columns taken in the order p.
+    """
+    side = size * size
+    bits = [1 << (side - 1 - j) for j in range(side)]
+    tables = []
+    for perm in stack_permutations(size):
+        table = [0] * (1 << side)
+        for j,source in enumerate(perm):
+            bit, source_bit = bits[j], bits[source]
+            for layout in range(1 << side):
+                if layout & source_bit:
+                    table[layout] |= bit
+        tables.append((perm, table))
+    return tuple(tables)
+
+
+@lru_cache(maxsize=None)
+def diagonal_transformations(size):
+    """The permutations of box indices that map a diagonal board of size onto itself: the
+    rotations and reflections of the board, after a permutation of the rows and the columns alike
+    that commutes with reversing their order.
+    """
+    side = size * size
+    last = side - 1
+    band_orders = [sum((tuple(size * band + i for i in range(size)) for band in order), ())
+                   for order in permutations(range(size))]
+    mirrored = {tuple(order[i] for i in perm) for order in band_orders for perm in stack_permutations(size)}
+    mirrored = [p for p in mirrored if all(p[last - i] == last - p[i] for i in range(side))]
+    symmetries = [lambda r, c: (r, c), lambda r, c: (c, r), lambda r, c: (last - r, c), lambda r, c: (r, last - c),
+                  lambda r, c: (last - r, last - c), lambda r, c: (c, last - r), lambda r, c: (last - c, r),
+                  lambda r, c: (last - c, last - r)]
+    transformations = set()
+    for p in mirrored:
+        for symmetry in symmetries:
+            # Target box (r, c) is taken from source box symmetry(p[r], p[c]).
+            transformations.add(tuple(side * sr + sc for r in range(side) for c in range(side)
+                                      for sr,sc in [symmetry(p[r], p[c])]))
+    return tuple(sorted(transformations))
+
+
+def relabel(grid, perm, geometry):
+    """The grid with its boxes taken in the order perm, and its digits relabeled in order of first appearance.
+    Returns:
+        The relabeled grid, and a dict mapping each original digit to its new label. Digits that do
+        not appear are mapped to the remaining labels in order, so that the dict is a bijection.
+    """
+    digits = geometry.digits
+    labels = {}
+    chars = []
+    for i in perm:
+        digit = grid[i]
+        if digit in '.0':
+            chars.append('.')
+        else:
+            if digit not in labels:
+                labels[digit] = digits[len(labels)]
+            chars.append(labels[digit])
+    unused = iter(label for label in digits if label not in labels.values())
+    for digit in digits:
+        if digit not in labels:
+            labels[digit] = next(unused)
+    return ''.join(chars), labels
+
+
+def canonical_form(grid, geometry=solution_utils.diagonal_geometry):
+    """The canonical form of a grid and the transformation that produces it.
+    Args:
+        grid(string): a grid in the form accepted by solution.solve.
+        geometry(Geometry): the Sudoku variant, which decides the symmetries that may be used.
+    Returns:
+        A triple (canonical, perm, labels): the canonical grid, the permutation such that
+        canonical box k comes from box perm[k] of grid, and the relabeling of the digits.
+    """
+    if geometry.extra_units or geometry.size > 3:
+        candidates = [tuple(range(len(grid)))]
+    elif geometry.diagonal:
+        candidates = _least_layouts(grid, diagonal_transformations(geometry.size))
+    else:
+        candidates = _standard_candidates(grid, geometry.size)
+
+    if candidates is None or len(candidates) > max_candidates:
+        candidates = [tuple(range(len(grid)))]
+
+    best = None
+    for perm in candidates:
+        canonical, labels = relabel(grid, perm, geometry)
+        if best is None or canonical < best[0]:
+            best = canonical, perm, labels
+    return best
+
+
+def _least_layouts(grid, transformations):
+    """The transformations under which the clue layout of grid is least."""
+    layout = ''.join('0' if digit in '.0' else '1' for digit in grid)
+    least, candidates = None, []
+    for perm in transformations:
+        transformed = ''.join([layout[i] for i in perm])
+        if least is None or transformed < least:
+            least, candidates = transformed, [perm]
+        elif transformed == least:
+            candidates.append(perm)
+    return candidates
+
+
+def _standard_candidates(grid, size):
+    """The transformations of a standard board under which the clue layout of grid is least.
+
+    For a given order of the columns, the least layout sorts the rows within each band by their
+    layout, so only the column orders (and transposition) are tried in full. Rows with the same
+    layout give ties, whose orders are all candidates.
+    """
+    side = size * size
+    layouts = [[0] * side, [0] * side]  # The layout of each row of grid, and of its transpose.
+    for i,digit in enumerate(grid):
+        if digit not in '.0':
+            r, c = divmod(i, side)
+            layouts[0][r] |= 1 << (side - 1 - c)
+            layouts[1][c] |= 1 << (side - 1 - r)
+
+    bands = range(0, side, size)
+    least, tied = None, []
+    for transposed in (0, 1):
+        rows = layouts[transposed]
+        for perm,table in column_tables(size):
+            mapped = [table[row] for row in rows]
+            key = [layout for b in bands for layout in sorted(mapped[b:b+size])]
+            if least is None or key < least:
+                least, tied = key, [(transposed, perm, mapped)]
+            elif key == least:
+                tied.append((transposed, perm, mapped))
+
+    candidates = []
+    for transposed,perm,mapped in tied:
+        # The orders of the rows of each band that sort it, trying every order among equal layouts.
+        band_orders = []
+        for b in bands:
+            band = sorted(range(b, b + size), key=mapped.__getitem__)
+            band_orders.append([order for order in permutations(band)
+                                if [mapped[r] for r in order] == [mapped[r] for r in band]])
+        n_orders = 1
+        for orders in band_orders:
+            n_orders *= len(orders)
+        if len(candidates) + n_orders > max_candidates:
+            return None
+        for choice in product(*band_orders):
+            row_order = sum(choice, ())
+            if transposed:
+                candidates.append(tuple(side * c + r for r in row_order for c in perm))
+            else:
+                candidates.append(tuple(side * r + c for r in row_order for c in perm))
+    return candidates
+
+
+class SolutionCache:
+    """A size-bounded LRU cache of solutions keyed by canonical form, in front of solution.solve.
+
+    Attributes:
+        maxsize(int): the most entries kept in memory; the least recently used are evicted first.
+        hits, misses(int): lookups answered from the cache, and lookups that had to solve.
+        disk_hits(int): the hits answered by the on-disk store rather than from memory.
+        evictions(int): entries evicted from memory.
+    """
+
+    def __init__(self, maxsize=4096, path=None):
+        """
+        Args:
+            maxsize(int): the most entries kept in memory.
+            path(string): if given, also keep every solution in a dbm file at this path, which
+                outlives the process and is shared by every cache opened on it.
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()  # Maps keys to solutions of the canonical grids, or '' for none.
+        self.store = dbm.open(path, 'c') if path else None
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+
+    def solve(self, grid, geometry=solution_utils.diagonal_geometry, **options):
+        """Solve a grid as solution.solve does, unless an equivalent grid has been solved before.
+        Args:
+            grid(string): a grid in the form accepted by solution.solve.
+            geometry(Geometry): the Sudoku variant.
+            options: keyword arguments for solution.solve when the grid has to be solved.
+        Returns:
+            The dictionary representation of the solution. False if no solution exists.
+        """
+        canonical, perm, labels = canonical_form(grid, geometry)
+        key = '{!r}:{}'.format(geometry, canonical)
+
+        solved = self.entries.get(key)
+        if solved is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        elif self.store is not None and key in self.store:
+            solved = self.store[key].decode()
+            self.hits += 1
+            self.disk_hits += 1
+            self._add(key, solved)
+        else:
+            self.misses += 1
+            values = solution.solve(canonical, geometry=geometry, **options)
+            solved = ''.join(values[box] for box in geometry.boxes) if values else ''
+            self._add(key, solved)
+            if self.store is not None:
+                self.store[key] = solved
+
+        if not solved:
+            return False
+        digits = {label: digit for digit,label in labels.items()}
+        boxes = geometry.boxes
+        return {boxes[perm[k]]: digits[label] for k,label in enumerate(solved)}
+
+    def _add(self, key, solved):
+        self.entries[key] = solved
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def cache_info(self):
+        """The hit and miss statistics of the cache, as a dict."""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits, 'evictions': self.evictions,
+                'size': len(self.entries), 'maxsize': self.maxsize,
+                'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        """Empty the in-memory cache and reset the statistics, leaving the on-disk store as it is."""
+        self.entries.clear()
+        self.hits = self.misses = self.disk_hits = self.evictions = 0
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
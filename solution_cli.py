@@ -0,0 +1,137 @@
+"""Command-line solver for files of puzzles.
+
+Reads one grid per line (81 characters for 9x9), with '.' or '0' for empty boxes and lines starting
+with '#' skipped as comments, from the given file or from stdin, or with --packed the grids of an
+archive written by solution_packed (whose header gives the board, and whose record numbers stand for
+line numbers), and writes one line per puzzle as soon as it is solved:
+
+    <line number> <solution, or - if there is none> <seconds>
+
+With --count, the solution is replaced by the number of solutions of the grid, counted up to
+--limit (2 by default, so that 1 means the grid is a well-formed puzzle). With --max-nodes or
+--deadline, the search of each grid is bounded, and a grid whose search runs out of budget gets ?
+in place of its solution.
+
+Every stage is a generator and only the chunks in flight are held in memory, so a file of millions
+of puzzles is solved in constant memory. A summary is written to stderr at the end.
+
+Usage: python solution_cli.py [FILE] [--workers N] [--chunksize N] [--unordered] [--standard] [--count] ...
+"""
+import solution
+import solution_batch
+import solution_packed
+import solution_utils
+
+from collections import Counter
+from time import perf_counter
+import argparse
+import sys
+
+
+def read_grids(lines, line_numbers, geometry):
+    """Yield the grids in lines, skipping blank lines and comments (lines starting with '#') and
+    reporting malformed ones on stderr.
+
+    The line number of each grid yielded is stored in line_numbers under the grid's index, so that
+    results can be matched back to their lines.
+    """
+    index = 0
+    for number,line in enumerate(lines, 1):
+        grid = line.strip()
+        if not grid or grid.startswith('#'):
+            continue
+        if len(grid) != len(geometry.boxes) or grid.strip('.0' + geometry.digits):
+            print('line {}: not a {}-character grid, skipped'.format(number, len(geometry.boxes)), file=sys.stderr)
+            continue
+        line_numbers[index] = number
+        index += 1
+        yield grid
+
+
+def read_packed(reader, line_numbers):
+    """Yield the grids of a solution_packed.PackedReader, numbering them from 1 like read_grids."""
+    for index,grid in enumerate(reader):
+        line_numbers[index] = index + 1
+        yield grid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Solve a file of Sudoku grids, one per line.')
+    parser.add_argument('file', nargs='?', type=argparse.FileType('r'), default=sys.stdin,
+                        help='file of grids (default: stdin)')
+    parser.add_argument('--packed', action='store_true', help='read FILE, which must be a path, as a packed archive')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes; 0 solves in this process (default: number of CPUs)')
+    parser.add_argument('--chunksize', type=int, default=64, help='grids sent to a worker at a time')
+    parser.add_argument('--unordered', action='store_true', help='write solutions as they finish')
+    parser.add_argument('--size', type=int, default=3, choices=(2, 3, 4, 5),
+                        help='side of a square: 2 for 4x4 boards, 3 for 9x9, 4 for 16x16, 5 for 25x25')
+    parser.add_argument('--standard', action='store_true', help='solve standard rather than diagonal Sudoku')
+    parser.add_argument('--bitmask', action='store_true', help='use the bitmask engine')
+    parser.add_argument('--incremental', action='store_true', help='use worklist-driven propagation')
+    parser.add_argument('--trail', action='store_true', help='use the in-place search with an undo trail')
+    parser.add_argument('--adaptive', action='store_true', help='only run costly strategies once cheap ones stall')
+    parser.add_argument('--backend', choices=solution.backends, default='propagation',
+                        help='search with constraint propagation or with Dancing Links (default: propagation)')
+    parser.add_argument('--strategy', action='append', choices=sorted(solution.strategy_registry),
+                        dest='strategies', help='strategy to use; may be repeated (default: the default strategies)')
+    parser.add_argument('--branching', choices=sorted(solution.branching_policies),
+                        help='branching policy of the search (default: mrv)')
+    parser.add_argument('--max-nodes', type=int, default=None, help='give up on a grid after searching this many boards')
+    parser.add_argument('--deadline', type=float, default=None, help='give up on a grid after this many seconds')
+    parser.add_argument('--count', action='store_true',
+                        help='write the number of solutions of each grid, up to --limit, instead of a solution')
+    parser.add_argument('--limit', type=int, default=2,
+                        help='with --count, stop counting at this many solutions (default: 2, enough to check uniqueness)')
+    args = parser.parse_args(argv)
+    if args.packed and args.file is sys.stdin:
+        parser.error('--packed needs the path of an archive; it cannot read stdin')
+
+    geometry = solution_utils.geometry(diagonal=not args.standard, size=args.size)
+    line_numbers = {}
+    counters = Counter()
+    if args.packed:
+        args.file.close()  # Opened as text by argparse; the archive is memory-mapped instead.
+        reader = solution_packed.PackedReader(args.file.name)
+        geometry = reader.geometry
+        grids = read_packed(reader, line_numbers)
+    else:
+        grids = read_grids(args.file, line_numbers, geometry)
+    batch = dict(workers=args.workers, chunksize=args.chunksize, ordered=not args.unordered, counters=counters,
+                 timed=True, backend=args.backend, geometry=geometry)
+    if args.count:
+        results = solution_batch.count_many(grids, limit=args.limit, **batch)
+    else:
+        results = solution_batch.solve_many(grids, bitmask=args.bitmask, incremental=args.incremental,
+                                            trail=args.trail, adaptive=args.adaptive, strategies=args.strategies,
+                                            branching=args.branching, max_nodes=args.max_nodes, deadline=args.deadline,
+                                            **batch)
+    if not args.unordered:
+        results = enumerate(results)
+
+    out = sys.stdout
+    n_solved = n_puzzles = n_exceeded = 0
+    t0 = perf_counter()
+    for index,(sol, seconds) in results:
+        if args.count:
+            out.write('{} {} {:.6f}\n'.format(line_numbers.pop(index), sol, seconds))
+            n_solved += sol == 1
+        else:
+            out.write('{} {} {:.6f}\n'.format(line_numbers.pop(index), sol or '-', seconds))
+            n_exceeded += sol == solution_batch.budget_exceeded
+            n_solved += sol is not None and sol != solution_batch.budget_exceeded
+        n_puzzles += 1
+    elapsed = perf_counter() - t0
+    if args.packed:
+        reader.close()
+
+    print('{} puzzles, {} {}{}, in {:.3f} seconds ({:.1f} puzzles per second)'.format(
+        n_puzzles, n_solved, 'with a unique solution' if args.count else 'solved',
+        ', {} out of budget'.format(n_exceeded) if n_exceeded else '', elapsed,
+        n_puzzles / elapsed if elapsed else 0), file=sys.stderr)
+    print('; '.join('{}: {}'.format(name, counters[name]) for name in solution_batch.counter_names),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Exact-cover backend: Knuth's Algorithm X with Dancing Links.
+
+Solving a Sudoku is an exact-cover problem. Each choice of a digit for a box is a row, and each
+row covers one column for its box and one column for every unit of the box paired with the digit.
+A solution is a set of rows covering every column exactly once. Every unit of
+solution_utils.Geometry becomes a set of columns, so diagonal and extra units need no special
+handling.
+
+The matrix is a toroidal doubly-linked list held in flat lists of node indices, so that covering
+and uncovering a column only relinks integers. Node 0 is the root, nodes 1 to n_columns are the
+column headers, and the nodes of the rows follow. The links of an empty board depend only on the
+geometry, so they are built once per geometry and copied for each solve.
+"""
+from solution_utils import diagonal_geometry
+
+from functools import lru_cache
+
+
+search_invocations = 0
+
+
+@lru_cache(maxsize=None)
+def empty_matrix(geometry):
+    """The links of the exact-cover matrix of an empty board.
+    Args:
+        geometry(Geometry): the units of the Sudoku variant.
+    Returns:
+        A tuple (left, right, up, down, column, row, size, row_nodes) of tuples, where column and
+        row give the column header and the row of each node, size gives the number of nodes in
+        each column (indexed by header), and row_nodes gives the first node of each row. Row
+        box_index * n_digits + digit_index places the digit at the box.
+    """
+    n_digits = len(geometry.digits)
+    n_boxes = len(geometry.boxes)
+    units_of_box = [[u for u,unit in enumerate(geometry.unit_indices) if i in unit] for i in range(n_boxes)]
+    n_columns = n_boxes + len(geometry.unit_indices) * n_digits
+
+    # The root and the column headers form a circular list.
+    left = [n_columns] + list(range(n_columns))
+    right = list(range(1, n_columns + 1)) + [0]
+    up = list(range(n_columns + 1))
+    down = list(range(n_columns + 1))
+    column = list(range(n_columns + 1))
+    row = [-1] * (n_columns + 1)
+    size = [0] * (n_columns + 1)
+    row_nodes = []
+
+    for box in range(n_boxes):
+        for digit in range(n_digits):
+            headers = [1 + box] + [1 + n_boxes + u * n_digits + digit for u in units_of_box[box]]
+            first = len(column)
+            row_nodes.append(first)
+            for k,header in enumerate(headers):
+                node = first + k
+                left.append(first + (k - 1) % len(headers))
+                right.append(first + (k + 1) % len(headers))
+                # Append the node at the bottom of its column.
+                up.append(up[header])
+                down.append(header)
+                down[up[header]] = node
+                up[header] = node
+                column.append(header)
+                row.append(box * n_digits + digit)
+                size[header] += 1
+
+    return tuple(map(tuple, (left, right, up, down, column, row, size, row_nodes)))
+
+
+class ExactCover:
+    """The exact-cover matrix of one board, whose links are changed in place by the search."""
+
+    def __init__(self, values, geometry=diagonal_geometry):
+        """Build the matrix of the board values, leaving out the rows of digits that are not permissible.
+        Args:
+            values(dict): a dictionary of the form {'box_name': '123456789', ...}
+            geometry(Geometry): the units of the Sudoku variant.
+        """
+        left, right, up, down, column, row, size, row_nodes = empty_matrix(geometry)
+        self.left, self.right, self.up, self.down = list(left), list(right), list(up), list(down)
+        self.column, self.row, self.size = column, row, list(size)
+        self.geometry = geometry
+
+        digits = geometry.digits
+        for box_index,box in enumerate(geometry.boxes):
+            permissible = values[box]
+            if len(permissible) < len(digits):
+                for digit_index,digit in enumerate(digits):
+                    if digit not in permissible:
+                        self.remove_row(row_nodes[box_index * len(digits) + digit_index])
+
+    def remove_row(self, node):
+        """Unlink every node of the row of node from its column."""
+        up, down, size, column = self.up, self.down, self.size, self.column
+        j = node
+        while True:
+            up[down[j]] = up[j]
+            down[up[j]] = down[j]
+            size[column[j]] -= 1
+            j = self.right[j]
+            if j == node:
+                break
+
+    def cover(self, header):
+        """Remove a column, and every row with a node in it, from the matrix."""
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                up[down[j]] = up[j]
+                down[up[j]] = down[j]
+                size[column[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, header):
+        """Undo cover(header), restoring the links in the reverse order."""
+        left, right, up, down, column, size = self.left, self.right, self.up, self.down, self.column, self.size
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                size[column[j]] += 1
+                up[down[j]] = j
+                down[up[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    def solutions(self, profiler=None, budget=None):
+        """Yield every exact cover of the matrix, each as a list of rows.
+
+        The search always branches on the column with the fewest rows left, and the matrix is
+        restored when the generator is exhausted or closed, or when the budget raises.
+        """
+        yield from self._search([], profiler, 0, budget)
+
+    def _search(self, chosen, profiler, depth, budget=None):
+        """Yield the covers that extend the rows in chosen, and return how many there were."""
+        global search_invocations
+        search_invocations += 1
+        if profiler is not None:
+            profiler.node(depth)
+        if budget is not None:
+            budget.node(depth)
+
+        right, left, down, size, column = self.right, self.left, self.down, self.size, self.column
+        if right[0] == 0:  # Every column is covered.
+            yield list(chosen)
+            return 1
+
+        # Choose the column with the fewest rows, stopping early at an empty or forced column.
+        header = best = right[0]
+        while header != 0:
+            if size[header] < size[best]:
+                best = header
+                if size[best] <= 1:
+                    break
+            header = right[header]
+        if size[best] == 0:
+            return 0
+
+        n_found = 0
+        self.cover(best)
+        try:
+            i = down[best]
+            while i != best:
+                chosen.append(self.row[i])
+                j = right[i]
+                while j != i:
+                    self.cover(column[j])
+                    j = right[j]
+                try:
+                    # yield from closes the deeper searches first if this generator is closed.
+                    found = yield from self._search(chosen, profiler, depth + 1, budget)
+                finally:
+                    j = left[i]
+                    while j != i:
+                        self.uncover(column[j])
+                        j = left[j]
+                    chosen.pop()
+
+                if not found and profiler is not None:
+                    profiler.backtrack(depth)
+                n_found += found
+                i = down[i]
+        finally:
+            self.uncover(best)
+
+        return n_found
+
+    def values(self, rows):
+        """The values dictionary of a solution, as yielded by solutions."""
+        digits, boxes = self.geometry.digits, self.geometry.boxes
+        return {boxes[r // len(digits)]: digits[r % len(digits)] for r in rows}
+
+
+def solve_values(values, geometry=diagonal_geometry, profiler=None, budget=None):
+    """
+    Solve a Sudoku in dictionary form with Dancing Links.
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        geometry(Geometry): the units of the Sudoku variant.
+        profiler: if given, a solution_profiling.StrategyProfiler to report the search to.
+        budget: if given, a solution_budget.Budget to report every node to.
+    Returns:
+        The dictionary representation of the final sudoku grid. False if no solution exists.
+    """
+    matrix = ExactCover(values, geometry)
+    for rows in matrix.solutions(profiler, budget):
+        return matrix.values(rows)
+    return False
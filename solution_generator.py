@@ -0,0 +1,219 @@
+"""Generate puzzles with a unique solution, built on the solver.
+
+A puzzle is made by filling an empty board at random with the bitmask engine, then removing clues
+in random order for as long as the solution stays unique, until a target number of clues or a
+target difficulty is reached, or no clue can be removed.
+
+Removing a clue from a puzzle whose solution is known leaves the solution unique exactly when the
+puzzle has no solution with a different digit in that box. So each removal is checked with a
+single search for such a solution, rather than by counting solutions. Every such search also
+starts from the propagated candidates of the clues found to be needed so far (every puzzle
+checked contains them), which are only propagated again when a clue is found to be needed.
+
+Puzzles are rated by the strategies they need: 'easy' puzzles are solved by eliminate and
+only_choice, 'medium' ones also need naked or hidden twins, 'hard' ones need one of the other
+strategies in solution.strategy_registry, and 'fiendish' ones cannot be solved without search.
+
+Usage: python solution_generator.py [-n N] [--clues N] [--difficulty LEVEL] [--standard] [--seed N] [--workers N]
+"""
+import solution
+import solution_batch
+import solution_bitmask
+import solution_profiling
+import solution_utils
+
+from collections import Counter, namedtuple
+from random import Random
+from time import perf_counter
+import argparse
+import sys
+
+
+Rating = namedtuple('Rating', 'level strategies search_invocations')
+Rating.__doc__ = """How hard a puzzle is.
+
+level: the first of difficulty_levels whose strategies solve the puzzle without search, or
+    'fiendish' if none do.
+strategies: the names of the strategies that removed candidates while solving it at that level.
+search_invocations: the number of boards solution.search visits to solve it.
+"""
+
+# The difficulty levels from easiest to hardest, with the strategies that solve puzzles of each.
+difficulty_levels = (
+    ('easy', ('eliminate', 'only_choice')),
+    ('medium', ('eliminate', 'only_choice', 'naked_twins', 'hidden_twins')),
+    ('hard', tuple(solution.strategy_registry)),
+    ('fiendish', None),
+)
+levels = tuple(level for level,_ in difficulty_levels)
+
+
+def rate(grid, geometry=solution_utils.diagonal_geometry):
+    """Rate a puzzle.
+    Args:
+        grid(string): a puzzle with a unique solution, in the form accepted by solution.solve.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+    Returns:
+        A Rating.
+    """
+    searched = solution_profiling.StrategyProfiler()
+    solution.solve(grid, geometry=geometry, profiler=searched)
+
+    for level,strategies in difficulty_levels:
+        profiler = searched
+        if strategies is not None:
+            profiler = solution_profiling.StrategyProfiler()
+            values = solution.reduce_puzzle(solution.grid_values(grid, geometry), incremental=True,
+                                            geometry=geometry, profiler=profiler,
+                                            strategies=solution.resolve_strategies(strategies))
+            if not values or any(len(vals) > 1 for vals in values.values()):
+                continue
+        used = tuple(name for name in profiler.calls if profiler.eliminated[name])
+        return Rating(level, used, searched.nodes)
+
+
+def random_solution(geometry, rng):
+    """A full board picked at random, as a list of candidate bitmasks with one bit each."""
+    n_digits = len(geometry.digits)
+    return _random_search([(1 << n_digits) - 1] * len(geometry.boxes), geometry, rng)
+
+
+def _random_search(cells, geometry, rng):
+    """solution_bitmask.search, but trying the digits of each box in random order."""
+    popcounts = solution_bitmask.popcount_table(len(geometry.digits))
+    cells = solution_bitmask.reduce_puzzle(cells, geometry)
+
+    if cells is False:
+        return False
+    unsolved = [(popcounts[mask], i) for i,mask in enumerate(cells) if popcounts[mask] > 1]
+    if not unsolved:
+        return cells
+
+    _, best = min(unsolved)
+    bits = [1 << k for k in range(len(geometry.digits)) if cells[best] >> k & 1]
+    rng.shuffle(bits)
+    for bit in bits:
+        new_cells = cells[:]
+        new_cells[best] = bit
+        solved = _random_search(new_cells, geometry, rng)
+        if solved is not False:
+            return solved
+
+    return False
+
+
+def grid_string(cells, clues, geometry):
+    """The grid of the board cells showing only the boxes in clues, with '.' for the others."""
+    digits = geometry.digits
+    return ''.join(digits[mask.bit_length() - 1] if i in clues else '.' for i,mask in enumerate(cells))
+
+
+def generate(geometry=solution_utils.diagonal_geometry, clues=0, difficulty=None, seed=None, attempts=20):
+    """Generate a puzzle with a unique solution.
+    Args:
+        geometry(Geometry): the Sudoku variant, e.g. solution_utils.standard_geometry.
+        clues(int): stop removing clues once the puzzle has this many. By default clues are
+            removed until none can be, which leaves a minimal puzzle.
+        difficulty(string): one of levels. If given, stop removing clues once the puzzle is rated
+            at least this hard, and start again from a new board (up to attempts times) if a
+            minimal puzzle is still too easy.
+        seed: seed for the random choices, so that the same seed gives the same puzzle.
+        attempts(int): number of boards to try for the difficulty.
+    Returns:
+        A pair of the puzzle, as a grid string, and its Rating. If no board gave a puzzle of the
+        difficulty, the hardest puzzle found is returned.
+    """
+    rng = Random(seed)
+    target = levels.index(difficulty) if difficulty else None
+    hardest = None
+    for _ in range(attempts if difficulty else 1):
+        grid, rating = _reduce(random_solution(geometry, rng), geometry, rng, clues, target)
+        if target is None or levels.index(rating.level) >= target:
+            return grid, rating
+        if hardest is None or levels.index(rating.level) > levels.index(hardest[1].level):
+            hardest = grid, rating
+    return hardest
+
+
+def _reduce(full, geometry, rng, clues, target):
+    """Remove the clues of the full board full in random order while the solution stays unique."""
+    n_boxes = len(full)
+    mask = (1 << len(geometry.digits)) - 1
+    order = list(range(n_boxes))
+    rng.shuffle(order)
+
+    remaining = set(order)  # The boxes that are still clues.
+    needed = [mask] * n_boxes  # The clues found to be needed, with every digit elsewhere.
+    base = needed[:]  # needed, propagated.
+    for box in order:
+        if len(remaining) <= clues:
+            break
+
+        # Look for a solution of the puzzle without box that has another digit in box.
+        cells = base[:]
+        for i in remaining:
+            cells[i] &= full[i]
+        cells[box] = base[box] & ~full[box]
+        if cells[box] and solution_bitmask.search(cells, geometry) is not False:
+            needed[box] = full[box]
+            base = solution_bitmask.reduce_puzzle(needed[:], geometry)
+            continue
+
+        remaining.remove(box)
+        if target is not None and levels.index(rate(grid_string(full, remaining, geometry), geometry).level) >= target:
+            break
+
+    grid = grid_string(full, remaining, geometry)
+    return grid, rate(grid, geometry)
+
+
+def generate_chunk(seeds, options):
+    """Generate a puzzle for each seed in this process, in the form of solution_batch.solve_chunk."""
+    puzzles, seconds = [], []
+    for seed in seeds:
+        t0 = perf_counter()
+        puzzles.append(generate(seed=seed, **options))
+        seconds.append(perf_counter() - t0)
+    return puzzles, seconds, {}
+
+
+def generate_many(n, seed=0, workers=None, ordered=True, **options):
+    """Generate n puzzles across a pool of worker processes.
+    Args:
+        n(int): number of puzzles.
+        seed(int): puzzle i is generated with seed + i, so runs with the same seed (and options)
+            give the same puzzles, whatever the number of workers.
+        workers(int): number of worker processes, as for solution_batch.solve_many.
+        ordered(bool): as for solution_batch.solve_many.
+        options: keyword arguments for generate.
+    Yields:
+        (grid, Rating) pairs.
+    """
+    return solution_batch.map_chunks(generate_chunk, range(seed, seed + n), workers, 1, ordered, None, False, options)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate Sudoku puzzles with a unique solution, one per line.')
+    parser.add_argument('-n', type=int, default=1, help='number of puzzles (default: 1)')
+    parser.add_argument('--clues', type=int, default=0, help='stop removing clues at this many (default: minimal)')
+    parser.add_argument('--difficulty', choices=levels, help='stop removing clues once this hard')
+    parser.add_argument('--size', type=int, default=3, choices=(2, 3, 4),
+                        help='side of a square: 2 for 4x4 boards, 3 for 9x9, 4 for 16x16')
+    parser.add_argument('--standard', action='store_true', help='generate standard rather than diagonal Sudoku')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the first puzzle (default: 0)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes; 0 generates in this process (default: number of CPUs)')
+    args = parser.parse_args(argv)
+
+    geometry = solution_utils.geometry(diagonal=not args.standard, size=args.size)
+    ratings = Counter()
+    for grid,rating in generate_many(args.n, args.seed, args.workers, geometry=geometry, clues=args.clues,
+                                     difficulty=args.difficulty):
+        print(grid)
+        ratings[rating.level] += 1
+
+    print('; '.join('{}: {}'.format(level, ratings[level]) for level in levels), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Vectorized batch engine: propagate constraints on many boards at once with NumPy.
+
+A batch of boards is a (batch, n_boxes) array of candidate bitmasks, one bit per digit as in
+solution_bitmask. eliminate and only_choice run as whole-array operations over every board of the
+batch, gathering peers and units through index arrays built from the index tables of a
+solution_utils.Geometry. The boards are propagated together until none of them changes; boards that
+are then solved or contradictory are done, and the boards that stalled are finished one at a time
+by solution_bitmask.search. Most easy and medium grids never reach the search.
+
+NumPy is optional: this module imports without it, but solving raises ImportError. Boards with more
+than 16 digits are not supported.
+"""
+import solution_bitmask
+import solution_budget
+from solution_utils import diagonal_geometry
+
+from collections import namedtuple
+from functools import lru_cache
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+stalled_boards = 0
+
+
+Tables = namedtuple('Tables', 'peers units units_of_box popcounts codes chars bits dtype')
+Tables.__doc__ = """The index arrays and lookup tables of a geometry.
+
+peers: (n_boxes, max_peers) array of the peers of each box, padded with n_boxes, the index of an
+    empty box appended to the boards before gathering.
+units: (n_units, max_unit) array of the boxes of each unit, padded the same way.
+units_of_box: (n_boxes, max_units) array of the units of each box, padded with n_units, the index
+    of a unit appended with no candidates.
+popcounts: the number of candidates of each mask.
+codes: maps the byte of each character of a grid to its mask.
+chars: maps each single-digit mask to the byte of its digit.
+bits: the mask of each digit.
+dtype: the dtype of the boards.
+"""
+
+
+def require_numpy():
+    if np is None:
+        raise ImportError('the numpy backend needs NumPy; install it with pip install numpy')
+
+
+@lru_cache(maxsize=None)
+def tables(geometry):
+    """The Tables of a geometry, built once per geometry."""
+    require_numpy()
+    n_digits, n_boxes, n_units = len(geometry.digits), len(geometry.boxes), len(geometry.unit_indices)
+    if n_digits > 16:
+        raise ValueError('the numpy backend supports boards of up to 16 digits, not {}'.format(n_digits))
+
+    def padded(rows, pad):
+        array = np.full((len(rows), max(map(len, rows))), pad, dtype=np.intp)
+        for i,row in enumerate(rows):
+            array[i, :len(row)] = row
+        return array
+
+    units_of_box = [[u for u,unit in enumerate(geometry.unit_indices) if i in unit] for i in range(n_boxes)]
+    dtype = np.uint16
+    codes = np.zeros(256, dtype=dtype)
+    codes[ord('.')] = codes[ord('0')] = (1 << n_digits) - 1
+    chars = np.full(1 << n_digits, ord('.'), dtype=np.uint8)
+    for k,digit in enumerate(geometry.digits):
+        codes[ord(digit)] = 1 << k
+        chars[1 << k] = ord(digit)
+    return Tables(peers=padded(geometry.peer_indices, n_boxes), units=padded(geometry.unit_indices, n_boxes),
+                  units_of_box=padded(units_of_box, n_units),
+                  popcounts=np.array(solution_bitmask.popcount_table(n_digits), dtype=np.uint8),
+                  codes=codes, chars=chars, bits=[dtype(1 << k) for k in range(n_digits)], dtype=dtype)
+
+
+def with_empty_column(array, value=0):
+    """array with one more column of value, for the padding indices of Tables to gather."""
+    return np.concatenate([array, np.full((len(array), 1), value, dtype=array.dtype)], axis=1)
+
+
+def eliminate(boards, t):
+    """Remove the digit of every solved box from its peers, on every board.
+    Args:
+        boards: a (batch, n_boxes) array of candidate masks.
+        t(Tables): the tables of the geometry.
+    Returns:
+        The new boards.
+    """
+    solved = np.where(t.popcounts[boards] == 1, boards, 0).astype(t.dtype)
+    taken = np.bitwise_or.reduce(with_empty_column(solved)[:, t.peers], axis=2)
+    return boards & ~taken
+
+
+def only_choice(boards, t):
+    """Fill in every box that is the only place left for a digit in one of its units, on every board."""
+    in_units = with_empty_column(boards)[:, t.units]
+    forced = np.zeros_like(boards)
+    for bit in t.bits:
+        once = (in_units & bit).astype(bool).sum(axis=2) == 1
+        only = with_empty_column(once, False)[:, t.units_of_box].any(axis=2) & (boards & bit).astype(bool)
+        forced |= np.where(only, bit, 0).astype(t.dtype)
+    # A box forced to two digits is emptied, as solution_bitmask.only_choice does.
+    return np.where(forced == 0, boards, np.where(t.popcounts[forced] == 1, forced, 0)).astype(t.dtype)
+
+
+def reduce_boards(boards, t):
+    """Apply eliminate and only_choice to every board until none changes, in place.
+
+    Each pass only works on the boards that changed in the previous one and have no empty box.
+    """
+    active = np.arange(len(boards))
+    while active.size:
+        before = boards[active]
+        after = only_choice(eliminate(before, t), t)
+        boards[active] = after
+        active = active[(after != before).any(axis=1) & (after != 0).all(axis=1)]
+    return boards
+
+
+def solve_boards(boards, geometry=diagonal_geometry, budget=None, max_nodes=None, deadline=None):
+    """Solve a batch of boards.
+    Args:
+        boards: a (batch, n_boxes) array of candidate masks, which is changed in place.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        budget: if given, a solution_budget.Budget shared by the searches of the boards that stall.
+        max_nodes(int), deadline(float): otherwise, the budget of the search of each board that
+            stalls, as for solution.solve.
+    Returns:
+        A list with the solution string of each board, None where there is none, and the
+        solution_budget.BudgetExceeded raised where the search ran out of budget.
+    """
+    global stalled_boards
+    t = tables(geometry)
+    boards = reduce_boards(boards, t)
+    counts = t.popcounts[boards]
+    failed = (counts == 0).any(axis=1)
+    solved = (counts == 1).all(axis=1)
+
+    digits = geometry.digits
+    solutions = []
+    for i in range(len(boards)):
+        if failed[i]:
+            solutions.append(None)
+        elif solved[i]:
+            solutions.append(t.chars[boards[i]].tobytes().decode())
+        else:
+            stalled_boards += 1
+            board_budget = budget
+            if budget is None and (max_nodes is not None or deadline is not None):
+                board_budget = solution_budget.Budget(max_nodes, deadline)
+            try:
+                cells = solution_bitmask.search(boards[i].tolist(), geometry, budget=board_budget)
+            except solution_budget.BudgetExceeded as e:
+                solutions.append(e)
+                continue
+            solutions.append(cells and ''.join(digits[mask.bit_length() - 1] for mask in cells) or None)
+    return solutions
+
+
+def solve_grids(grids, geometry=diagonal_geometry, max_nodes=None, deadline=None):
+    """Solve a list of grids, in the string form accepted by solution.solve, as one batch.
+    Returns:
+        A list as for solve_boards.
+    """
+    t = tables(geometry)
+    if not grids:
+        return []
+    data = np.frombuffer(''.join(grids).encode('ascii'), dtype=np.uint8).reshape(len(grids), len(geometry.boxes))
+    return solve_boards(t.codes[data], geometry, max_nodes=max_nodes, deadline=deadline)
+
+
+def solve_values(values, geometry=diagonal_geometry, budget=None):
+    """
+    Solve a Sudoku in dictionary form as a batch of one board.
+    Args:
+        values(dict): a dictionary of the form {'box_name': '123456789', ...}
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        budget: if given, a solution_budget.Budget for the search if the board stalls.
+    Returns:
+        The dictionary representation of the final sudoku grid. False if no solution exists.
+    """
+    t = tables(geometry)
+    boards = np.array([solution_bitmask.cells_from_values(values, geometry)], dtype=t.dtype)
+    solved = solve_boards(boards, geometry, budget)[0]
+    if isinstance(solved, solution_budget.BudgetExceeded):
+        raise solved
+    return solved and dict(zip(geometry.boxes, solved)) or False
@@ -0,0 +1,306 @@
+"""Packed binary archives of puzzles and their solutions.
+
+An archive is a header followed by fixed-size records. The header gives the board variant, so an
+archive can be read without knowing what it holds:
+
+    magic     4 bytes   b'SDKP'
+    version   1 byte    1
+    size      1 byte    the side of a square of the board (3 for 9x9)
+    flags     1 byte    1: diagonal board; 2: records hold a solution after the grid
+    cell_bits 1 byte    4, or 8 for boards with 16 or more digits
+    extra     4 bytes   little-endian length of the JSON list of extra units that follows
+
+Each box takes cell_bits bits, with 0 for an empty box and k for the k-th of geometry.digits, and a
+grid is padded to a whole byte, so a 9x9 grid takes 41 bytes instead of 81 and a record with its
+solution 82. A record whose solution is all zeros has no (known) solution.
+
+Grids are written and read in the string form accepted by solution.solve, with '.' for empty boxes
+('0' is written as an empty box too), so converting between the two forms is lossless.
+
+Usage:
+    python solution_packed.py pack FILE ARCHIVE [--size N] [--standard] [--solve] [--workers N]
+    python solution_packed.py unpack ARCHIVE [--solutions]
+"""
+import solution_batch
+import solution_utils
+
+from functools import lru_cache
+from itertools import tee
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+
+
+magic = b'SDKP'
+version = 1
+header = struct.Struct('<4sBBBBI')
+DIAGONAL, SOLUTIONS = 1, 2
+
+
+def cell_bits(geometry):
+    """The bits per box in an archive of the geometry: a nibble while the digits fit in one."""
+    return 4 if len(geometry.digits) < 16 else 8
+
+
+def grid_bytes(geometry):
+    """The bytes taken by one packed grid of the geometry."""
+    return (len(geometry.boxes) * cell_bits(geometry) + 7) // 8
+
+
+@lru_cache(maxsize=None)
+def _tables(geometry):
+    """The translations between the characters of a grid and the codes of its boxes, and a table
+    mapping each byte of a packed grid to the characters of its boxes.
+    """
+    codes = {digit: k for k,digit in enumerate(geometry.digits, 1)}
+    codes['.'] = codes['0'] = 0
+    chars = '.' + geometry.digits
+    if cell_bits(geometry) == 4:
+        chars = chars.ljust(16, '?')
+        byte_chars = tuple(chars[b >> 4] + chars[b & 15] for b in range(256))
+    else:
+        byte_chars = tuple(chars[b] if b < len(chars) else '?' for b in range(256))
+    return codes, byte_chars
+
+
+def is_grid(grid, geometry=solution_utils.diagonal_geometry):
+    """Whether grid is a string with one digit of the geometry, '.' or '0' for every box."""
+    return len(grid) == len(geometry.boxes) and not grid.strip('.0' + geometry.digits)
+
+
+def encode_grid(grid, geometry=solution_utils.diagonal_geometry):
+    """Pack a grid string, or the values dictionary of a solved board, into bytes.
+    Raises:
+        ValueError: if the grid does not fit the geometry.
+    """
+    if isinstance(grid, dict):
+        grid = ''.join(grid[box] for box in geometry.boxes)
+    if not is_grid(grid, geometry):
+        raise ValueError('not a {}-character grid: {!r}'.format(len(geometry.boxes), grid))
+    codes, _ = _tables(geometry)
+    cells = [codes[char] for char in grid]
+    if cell_bits(geometry) == 8:
+        return bytes(cells)
+    if len(cells) % 2:
+        cells.append(0)
+    return bytes(hi << 4 | lo for hi,lo in zip(cells[::2], cells[1::2]))
+
+
+def decode_grid(data, geometry=solution_utils.diagonal_geometry):
+    """The grid string of a packed grid, which may be any bytes-like object, e.g., a memoryview."""
+    _, byte_chars = _tables(geometry)
+    return ''.join(map(byte_chars.__getitem__, data))[:len(geometry.boxes)]
+
+
+class PackedWriter:
+    """Write records to an archive.
+
+    Use as a context manager, or call close, to make sure every record reaches the file.
+    """
+
+    def __init__(self, path, geometry=solution_utils.diagonal_geometry, solutions=False):
+        """
+        Args:
+            path(string): the archive, which is created or truncated.
+            geometry(Geometry): the Sudoku variant of every grid in the archive.
+            solutions(bool): whether records hold a solution after the grid.
+        """
+        self.geometry = geometry
+        self.solutions = solutions
+        self.count = 0
+        self.file = open(path, 'wb')
+        extra = json.dumps([list(unit) for unit in geometry.extra_units]).encode()
+        flags = (DIAGONAL if geometry.diagonal else 0) | (SOLUTIONS if solutions else 0)
+        self.file.write(header.pack(magic, version, geometry.size, flags, cell_bits(geometry), len(extra)))
+        self.file.write(extra)
+        self._empty = bytes(grid_bytes(geometry))
+
+    def write(self, grid, solved=None):
+        """Append a record.
+        Args:
+            grid(string): the grid, in the form accepted by solution.solve.
+            solved: its solution, as a grid string or a values dictionary, or a false value if it has
+                none. Only written if the archive holds solutions.
+        """
+        self.file.write(encode_grid(grid, self.geometry))
+        if self.solutions:
+            self.file.write(encode_grid(solved, self.geometry) if solved else self._empty)
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack(path, grids, geometry=solution_utils.diagonal_geometry, solutions=None):
+    """Write the grids, and their solutions if given (in the same order), to an archive at path.
+    Returns:
+        The number of records written.
+    Raises:
+        ValueError: if a grid does not fit the geometry. The archive is removed rather than left
+            half-written.
+    """
+    with PackedWriter(path, geometry, solutions is not None) as writer:
+        try:
+            if solutions is None:
+                for grid in grids:
+                    writer.write(grid)
+            else:
+                for grid,solved in zip(grids, solutions):
+                    writer.write(grid, solved)
+        except BaseException:
+            writer.close()
+            os.remove(path)
+            raise
+    return writer.count
+
+
+def read_grids(lines, geometry=solution_utils.diagonal_geometry):
+    """Yield the grids in lines, skipping blank lines and comments (lines starting with '#') and
+    reporting malformed ones on stderr, as solution_cli does.
+    """
+    for number,line in enumerate(lines, 1):
+        grid = line.strip()
+        if not grid or grid.startswith('#'):
+            continue
+        if not is_grid(grid, geometry):
+            print('line {}: not a {}-character grid, skipped'.format(number, len(geometry.boxes)), file=sys.stderr)
+            continue
+        yield grid
+
+
+class PackedReader:
+    """Read an archive through a memory map, so that records are only paged in as they are read.
+
+    Attributes:
+        geometry(Geometry): the Sudoku variant of the grids, from the header.
+        solutions(bool): whether records hold a solution.
+        record_size(int): the bytes of a record.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < header.size or self.map[:4] != magic:
+            self.map.close()
+            raise ValueError('{} is not a packed archive'.format(path))
+        _, file_version, size, flags, bits, n_extra = header.unpack_from(self.map)
+        if file_version != version:
+            self.map.close()
+            raise ValueError('{} has version {}, expected {}'.format(path, file_version, version))
+        extra = json.loads(bytes(self.map[header.size:header.size + n_extra]))
+        self.geometry = solution_utils.geometry(diagonal=flags & DIAGONAL, extra_units=extra, size=size)
+        if bits != cell_bits(self.geometry):
+            self.map.close()
+            raise ValueError('{} has {} bits per box, expected {}'.format(path, bits, cell_bits(self.geometry)))
+        self.solutions = bool(flags & SOLUTIONS)
+        self.grid_bytes = grid_bytes(self.geometry)
+        self.record_size = self.grid_bytes * (2 if self.solutions else 1)
+        self.start = header.size + n_extra
+        self.view = memoryview(self.map)
+
+    def __len__(self):
+        return (len(self.map) - self.start) // self.record_size
+
+    def record(self, index):
+        """The bytes of record index, as a memoryview of the map (not a copy). Release it, or drop
+        it, before closing the reader."""
+        if not 0 <= index < len(self):
+            raise IndexError('record {} out of range'.format(index))
+        offset = self.start + index * self.record_size
+        return self.view[offset:offset + self.record_size]
+
+    def records(self):
+        """Yield the bytes of every record, as memoryviews of the map like record."""
+        view, size = self.view, self.record_size
+        for offset in range(self.start, self.start + len(self) * size, size):
+            yield view[offset:offset + size]
+
+    def __getitem__(self, index):
+        """The grid string of record index."""
+        with self.record(index) as record:
+            return decode_grid(record[:self.grid_bytes], self.geometry)
+
+    def __iter__(self):
+        """Yield the grid string of every record, ready for solution.solve or grid_values."""
+        return (grid for grid,_ in self._decode(solutions=False))
+
+    def items(self):
+        """Yield a pair of the grid string and the solution string (None if unknown) of every record."""
+        return self._decode(self.solutions)
+
+    def _decode(self, solutions):
+        view, size, n, geometry = self.view, self.record_size, self.grid_bytes, self.geometry
+        for offset in range(self.start, self.start + len(self) * size, size):
+            # Decode from slices that are released at once, so that the reader can be closed
+            # between any two records.
+            with view[offset:offset + n] as packed:
+                grid = decode_grid(packed, geometry)
+            solved = None
+            if solutions:
+                with view[offset + n:offset + size] as packed:
+                    if any(packed):
+                        solved = decode_grid(packed, geometry)
+            yield grid, solved
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def is_packed(path):
+    """Whether the file at path starts like an archive."""
+    with open(path, 'rb') as f:
+        return f.read(len(magic)) == magic
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert between grid files, one grid per line, and packed archives.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    packer = commands.add_parser('pack', help='pack a file of grids')
+    packer.add_argument('file', type=argparse.FileType('r'),
+                        help="file of grids, one per line; lines starting with '#' are skipped ('-' for stdin)")
+    packer.add_argument('archive', help='archive to write')
+    packer.add_argument('--size', type=int, default=3, choices=(2, 3, 4, 5),
+                        help='side of a square: 2 for 4x4 boards, 3 for 9x9, 4 for 16x16, 5 for 25x25')
+    packer.add_argument('--standard', action='store_true', help='standard rather than diagonal Sudoku')
+    packer.add_argument('--solve', action='store_true', help='solve every grid and store its solution')
+    packer.add_argument('--workers', type=int, default=None,
+                        help='worker processes for --solve (default: one per CPU; 0 solves in this process)')
+    unpacker = commands.add_parser('unpack', help='write the grids of an archive, one per line')
+    unpacker.add_argument('archive', help='archive to read')
+    unpacker.add_argument('--solutions', action='store_true', help="write each solution ('-' if none) after its grid")
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        geometry = solution_utils.geometry(diagonal=not args.standard, size=args.size)
+        grids = read_grids(args.file, geometry)
+        solutions = None
+        if args.solve:
+            # solve_many reads ahead by a few chunks only, so the tee buffers no more than that.
+            grids, to_solve = tee(grids)
+            solutions = solution_batch.solve_many(to_solve, args.workers, geometry=geometry)
+        n = pack(args.archive, grids, geometry, solutions)
+        print('{} grids packed'.format(n), file=sys.stderr)
+    else:
+        with PackedReader(args.archive) as reader:
+            for grid,solved in reader.items():
+                print('{} {}'.format(grid, solved or '-') if args.solutions else grid)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Parallel search of a single puzzle: split the top of the search tree over a pool of processes.
+
+solution.search tries the digits of its branch box one after another, so a hard puzzle keeps one
+core busy however many there are. Here the top levels of the same search tree (fewest candidates
+first, with the bitmask engine of solution_bitmask) are expanded breadth first in this process,
+until there are enough open boards to keep every worker busy. The open boards are independent
+subproblems: they place different digits in the boxes branched on, so their solutions are disjoint.
+
+Each subproblem is searched by a worker with a solution_budget.Budget watching an event shared by
+the whole pool. When a solve finds its first solution, or a count reaches its limit, the event is
+set: the subproblems not yet started are cancelled, and the running ones stop at their next node.
+The solver waits for them before the next solve, so the workers are always free when it starts.
+
+Usage:
+    with ParallelSolver(workers=4) as solver:
+        values = solver.solve(grid)
+        n = solver.count(grid, limit=None)
+"""
+import solution
+import solution_bitmask
+import solution_budget
+import solution_utils
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+import os
+
+
+stop_event = None  # The event shared by the workers of a pool, set by _init_worker.
+
+
+def _init_worker(event):
+    global stop_event
+    stop_event = event
+
+
+def _solve_subproblem(cells, geometry):
+    """Search one subproblem in a worker. Returns its solved cells, False, or None if cancelled."""
+    try:
+        return solution_bitmask.search(cells, geometry, budget=solution_budget.Budget(event=stop_event))
+    except solution_budget.BudgetExceeded:
+        return None
+
+
+def _count_subproblem(cells, geometry, limit):
+    """Count the solutions of one subproblem in a worker, up to limit, or None if cancelled."""
+    try:
+        return solution_bitmask.count_solutions(cells, geometry, limit, solution_budget.Budget(event=stop_event))
+    except solution_budget.BudgetExceeded:
+        return None
+
+
+def split(cells, geometry=solution_utils.diagonal_geometry, target=8, first=False):
+    """Expand the top of the search tree of a board into at least target open boards, if it has that many.
+    Args:
+        cells(list): a list of candidate bitmasks, as for solution_bitmask.search.
+        geometry(Geometry): the units and peers of the Sudoku variant.
+        target(int): the number of open boards to stop at. Whole levels are expanded, so there may
+            be up to a branching factor more.
+        first(bool): stop at the first board solved while expanding.
+    Returns:
+        A pair of the list of the boards solved while expanding, and the list of the open boards,
+        reduced and stalled, in the order search would visit them.
+    """
+    popcounts = solution_bitmask.popcount_table(len(geometry.digits))
+    solved = []
+    cells = solution_bitmask.reduce_puzzle(cells, geometry)
+    frontier = [cells] if cells is not False else []
+    if frontier and all(popcounts[mask] == 1 for mask in cells):
+        return [cells], []
+
+    while frontier and len(frontier) < target:
+        next_frontier = []
+        for cells in frontier:
+            _, best = min((popcounts[mask], i) for i,mask in enumerate(cells) if popcounts[mask] > 1)
+            remaining = cells[best]
+            while remaining:
+                bit = solution_bitmask.lowest_bit(remaining)
+                remaining ^= bit
+                new_cells = cells[:]
+                new_cells[best] = bit
+                new_cells = solution_bitmask.reduce_puzzle(new_cells, geometry)
+                if new_cells is False:
+                    continue
+                if all(popcounts[mask] == 1 for mask in new_cells):
+                    solved.append(new_cells)
+                    if first:
+                        return solved, []
+                else:
+                    next_frontier.append(new_cells)
+        frontier = next_frontier
+    return solved, frontier
+
+
+class ParallelSolver:
+    """Solve single puzzles, or count their solutions, with the search split over a pool of workers.
+
+    Attributes:
+        workers(int): the number of worker processes, or 0 to search the subproblems one after
+            another in this process.
+        subproblems(int): the number of open boards handed to the workers by the last solve or count.
+    """
+
+    def __init__(self, workers=None, split_factor=4):
+        """
+        Args:
+            workers(int): number of worker processes. Defaults to the number of CPUs.
+            split_factor(int): the open boards to make per worker, so that a worker that finishes
+                an easy subproblem early has more to take.
+        """
+        self.workers = (os.cpu_count() or 1) if workers is None else workers
+        self.split_factor = split_factor
+        self.subproblems = 0
+        self.event = self.executor = None
+        self.pending = set()  # The futures of the subproblems of the current solve.
+        if self.workers:
+            context = multiprocessing.get_context()
+            self.event = context.Event()
+            self.executor = ProcessPoolExecutor(self.workers, context, initializer=_init_worker,
+                                                initargs=(self.event,))
+
+    def solve(self, grid, geometry=solution_utils.diagonal_geometry):
+        """Solve a grid as solution.solve does, searching its subproblems in parallel.
+        Returns:
+            The dictionary representation of a solution. False if no solution exists.
+        """
+        cells = solution_bitmask.cells_from_values(solution.grid_values(grid, geometry), geometry)
+        solved, frontier = split(cells, geometry, self.split_factor * max(self.workers, 1), first=True)
+        self.subproblems = len(frontier)
+        if solved:
+            return solution_bitmask.values_from_cells(solved[0], geometry)
+
+        if not self.workers:
+            for cells in frontier:
+                cells = solution_bitmask.search(cells, geometry)
+                if cells is not False:
+                    return solution_bitmask.values_from_cells(cells, geometry)
+            return False
+
+        found = False
+        try:
+            for result in self._run(_solve_subproblem, [(cells, geometry) for cells in frontier]):
+                if result:
+                    found = result
+                    break
+        finally:
+            self._stop()
+        return found and solution_bitmask.values_from_cells(found, geometry)
+
+    def count(self, grid, limit=2, geometry=solution_utils.diagonal_geometry):
+        """Count the solutions of a grid as solution.count_solutions does, with subproblems counted in parallel.
+        Returns:
+            The number of solutions, at most limit.
+        """
+        cells = solution_bitmask.cells_from_values(solution.grid_values(grid, geometry), geometry)
+        solved, frontier = split(cells, geometry, self.split_factor * max(self.workers, 1))
+        self.subproblems = len(frontier)
+        count = len(solved)
+
+        if not self.workers:
+            for cells in frontier:
+                if limit is not None and count >= limit:
+                    break
+                count += solution_bitmask.count_solutions(cells, geometry, None if limit is None else limit - count)
+        elif limit is None or count < limit:
+            try:
+                for result in self._run(_count_subproblem, [(cells, geometry, limit) for cells in frontier]):
+                    if result is None:  # Cancelled, e.g., by the stop of an earlier solve still in progress.
+                        continue
+                    count += result
+                    if limit is not None and count >= limit:
+                        break
+            finally:
+                self._stop()
+        return count if limit is None else min(count, limit)
+
+    def _run(self, function, jobs):
+        """Submit function(*job) for every job and yield the results in the order they finish."""
+        self.pending = {self.executor.submit(function, *job) for job in jobs}
+        while self.pending:
+            done, self.pending = wait(self.pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def _stop(self):
+        """Cancel the subproblems still pending, and wait for the running ones to notice."""
+        if not self.pending:
+            return
+        self.event.set()
+        for future in self.pending:
+            future.cancel()
+        wait(self.pending)
+        self.pending = set()
+        self.event.clear()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def solve_parallel(grid, geometry=solution_utils.diagonal_geometry, workers=None):
+    """Solve one grid on a pool of workers made for it. Keep a ParallelSolver to solve several."""
+    with ParallelSolver(workers) as solver:
+        return solver.solve(grid, geometry)
+
+
+def count_parallel(grid, limit=2, geometry=solution_utils.diagonal_geometry, workers=None):
+    """Count the solutions of one grid, up to limit, on a pool of workers made for it."""
+    with ParallelSolver(workers) as solver:
+        return solver.count(grid, limit, geometry)
@@ -0,0 +1,140 @@
+"""Recorders for the boards a solve goes through, for visualize_assignments.
+
+Recording is off unless a recorder is passed to solve, and each recorder only lives as long as the
+caller keeps it, so solving many puzzles does not accumulate history. A recorder is told about
+every change assign_value makes, before the change is applied, and boards() returns the recorded
+boards in order.
+
+A replay does not need whole boards: frame_changes turns a stream of boards into the changes each
+frame makes to the one before, and DeltaRecorder.frame_changes gets the same from its log of
+deltas without building a board at all, so a trace of any length is replayed in bounded memory.
+"""
+from collections import deque
+
+
+def frame_changes(boards):
+    """Yield the frames of a replay of boards, as the changes each makes to the frame before.
+
+    A box shows its digit once it has a single one, and nothing otherwise. A board makes a frame
+    if it shows a digit that the last frame does not, so boards that only empty boxes (or show
+    what is already shown) are folded into the next frame. boards may be any iterable, which is
+    read lazily.
+    Yields:
+        Dicts mapping each box that changed to the digit it now shows, or None if it is now empty.
+    """
+    shown = {}
+    for board in boards:
+        changes = {}
+        solved = False
+        for box,vals in board.items():
+            digit = vals if len(vals) == 1 else None
+            if shown.get(box) != digit:
+                changes[box] = digit
+                solved = solved or digit is not None
+        if solved:
+            shown.update(changes)
+            yield changes
+
+
+class FinalRecorder:
+    """Keep only the final board of the solve."""
+
+    def __init__(self):
+        self.final = None
+
+    def record(self, values, box, value):
+        pass
+
+    def sync(self, values):
+        pass
+
+    def finish(self, values):
+        self.final = values and dict(values)
+
+    def boards(self):
+        return [self.final] if self.final else []
+
+
+class RingRecorder:
+    """Keep the last n boards in which a box was assigned a single digit."""
+
+    def __init__(self, n):
+        self.ring = deque(maxlen=n)
+
+    def record(self, values, box, value):
+        if len(value) == 1:
+            board = dict(values)
+            board[box] = value
+            self.ring.append(board)
+
+    def sync(self, values):
+        pass
+
+    def finish(self, values):
+        pass
+
+    def boards(self):
+        return list(self.ring)
+
+
+class DeltaRecorder:
+    """Keep a log of (box, old_value, new_value) changes, which boards() replays into full boards.
+
+    search branches on copies of the board and search_in_place rolls its board back, so the board
+    being changed does not always continue from the last change logged. The recorder therefore
+    mirrors the logged board, and whenever it is handed a different board (or sync is called after
+    a rollback) it first logs the changes that bring the mirror in line with that board.
+    """
+
+    def __init__(self):
+        self.start = None  # The first board seen, which the deltas are replayed from.
+        self.deltas = []
+        self._mirror = None
+        self._source = None
+
+    def record(self, values, box, value):
+        if values is not self._source:
+            self.sync(values)
+        self.deltas.append((box, self._mirror[box], value))
+        self._mirror[box] = value
+
+    def sync(self, values):
+        if self._mirror is None:
+            self.start = dict(values)
+            self._mirror = dict(values)
+        else:
+            for box,value in values.items():
+                if self._mirror[box] != value:
+                    self.deltas.append((box, self._mirror[box], value))
+                    self._mirror[box] = value
+        self._source = values
+
+    def finish(self, values):
+        self._source = None  # Do not keep the solved board alive.
+
+    def frame_changes(self):
+        """The same frames as frame_changes(self.boards()), from the deltas one change at a time."""
+        if self.start is None:
+            return
+        shown = {}
+        pending = {box: vals for box,vals in self.start.items() if len(vals) == 1}  # Changes since the last frame.
+        for box,_,value in self.deltas:
+            digit = value if len(value) == 1 else None
+            if shown.get(box) != digit:
+                pending[box] = digit
+            else:
+                pending.pop(box, None)
+            if digit is not None and box in pending:
+                shown.update(pending)
+                yield pending
+                pending = {}
+
+    def boards(self):
+        """Replay the deltas, yielding the board after each change that leaves a single digit."""
+        if self.start is None:
+            return
+        board = dict(self.start)
+        for box,_,value in self.deltas:
+            board[box] = value
+            if len(value) == 1:
+                yield dict(board)
@@ -0,0 +1,310 @@
+"""Solving service: solve grids posted as JSON over HTTP, on a pool of worker processes.
+
+An asyncio HTTP/1.1 server, built on the standard library alone, with three endpoints:
+
+    POST /solve    {"grid": "..."} or {"grids": ["...", ...]}, with "standard": true and "size": N
+                   for boards other than 9x9 diagonal Sudoku. Answers {"solution": "..."} or
+                   {"solutions": [...]}, with null where a grid has no solution, and "?" where
+                   its search ran out of the budget set by --max-nodes or --deadline.
+    GET /metrics   counts of requests by status, of grids solved and coalesced, the latency of
+                   /solve requests (p50, p95, max), grids solved per second, and the strategy
+                   counters of the workers, as JSON.
+    GET /health    {"status": "ok"}.
+
+Every grid is a job on a bounded queue. A request whose grids do not fit in the queue is answered
+with 503 at once, rather than left waiting, so that clients back off. Dispatcher tasks take jobs off
+the queue, a chunk at a time, and solve them with solution_batch.solve_chunk in the process pool, so
+the module globals of the solver (its counters) are never shared by concurrent solves. A grid that
+is already queued or being solved for the same board is not queued again: the request waits on the
+job in flight. A request that is not answered within the timeout gets 504; its jobs still finish,
+and answer any other request waiting on them.
+
+The server listens on 127.0.0.1 unless told otherwise.
+
+Usage: python solution_service.py [--host HOST] [--port N] [--workers N] [--queue N] [--timeout SECONDS] ...
+"""
+import solution
+import solution_batch
+import solution_utils
+
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http import HTTPStatus
+from time import perf_counter
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+
+
+max_body = 1 << 24  # Largest request body accepted, in bytes.
+
+
+class ServiceMetrics:
+    """Counts and latencies of a SolverService.
+
+    Attributes:
+        statuses: maps each HTTP status to the number of responses with it.
+        grids: number of grids asked for by /solve requests.
+        coalesced: number of those grids that joined a job already in flight.
+        solved: number of jobs run by the workers.
+        latencies: the seconds taken by the latest /solve requests, up to window of them.
+        counters: the strategy counters of every job, added up.
+    """
+
+    def __init__(self, window=10000):
+        self.started = perf_counter()
+        self.statuses = Counter()
+        self.grids = self.coalesced = self.solved = 0
+        self.latencies = deque(maxlen=window)
+        self.counters = Counter()
+
+    def as_dict(self, queued=0, in_flight=0):
+        latencies = sorted(self.latencies)
+        elapsed = perf_counter() - self.started
+        return {
+            'statuses': {str(status): count for status,count in sorted(self.statuses.items())},
+            'grids': self.grids,
+            'coalesced': self.coalesced,
+            'solved': self.solved,
+            'queued': queued,
+            'in_flight': in_flight,
+            'p50': solution_utils.percentile(latencies, 0.50) if latencies else None,
+            'p95': solution_utils.percentile(latencies, 0.95) if latencies else None,
+            'max': latencies[-1] if latencies else None,
+            'grids_per_second': self.solved / elapsed if elapsed else 0.0,
+            'counters': dict(self.counters),
+        }
+
+
+class SolverService:
+    """Solve grids on a pool of workers behind a bounded queue, and serve them over HTTP."""
+
+    def __init__(self, workers=None, queue_size=256, timeout=30.0, chunksize=16, **options):
+        """
+        Args:
+            workers(int): number of worker processes. Defaults to the number of CPUs. With
+                workers=0 grids are solved one chunk at a time on a thread of this process.
+            queue_size(int): the most grids waiting to be solved; requests beyond it get 503.
+            timeout(float): seconds a request may wait for its solutions before it gets 504.
+            chunksize(int): the most queued grids sent to a worker at a time.
+            options: keyword arguments for solution.solve other than geometry, e.g. backend='dlx'.
+        """
+        self.workers = workers
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.chunksize = chunksize
+        self.options = options
+        self.metrics = ServiceMetrics()
+        self.in_flight = {}  # Maps (geometry, grid) to the future of its job.
+        self.queue = self.executor = self.server = None
+        self.dispatchers = []
+
+    async def start(self, host='127.0.0.1', port=0):
+        """Start the workers and the server. With port=0 a free port is picked; see self.port."""
+        if self.workers == 0:
+            self.executor, n_dispatchers = ThreadPoolExecutor(1), 1
+        else:
+            n_dispatchers = self.workers or os.cpu_count() or 1
+            # Forked workers would inherit the sockets of the connections open at the time, and
+            # keep them open after the server closes them.
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self.executor = ProcessPoolExecutor(n_dispatchers, multiprocessing.get_context(method))
+        self.queue = asyncio.Queue(self.queue_size)
+        self.dispatchers = [asyncio.create_task(self._dispatch()) for _ in range(n_dispatchers)]
+        self.server = await asyncio.start_server(self._handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def close(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for task in self.dispatchers:
+            task.cancel()
+        await asyncio.gather(*self.dispatchers, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def solve(self, grids, geometry=solution_utils.diagonal_geometry):
+        """Solve a list of grids.
+        Returns:
+            The list of their solution strings, with None where a grid has no solution.
+        Raises:
+            asyncio.QueueFull: if the grids that are not in flight do not fit in the queue.
+            asyncio.TimeoutError: if the solutions take longer than the timeout.
+        """
+        new = {grid for grid in grids if (geometry, grid) not in self.in_flight}
+        if len(new) > self.queue.maxsize - self.queue.qsize():
+            raise asyncio.QueueFull()
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for grid in grids:
+            key = (geometry, grid)
+            future = self.in_flight.get(key)
+            if future is None:
+                future = self.in_flight[key] = loop.create_future()
+                self.queue.put_nowait((key, future))
+            else:
+                self.metrics.coalesced += 1
+            futures.append(future)
+        self.metrics.grids += len(grids)
+        # Shield the jobs, so that a request that times out leaves them to the others waiting on them.
+        return await asyncio.wait_for(asyncio.gather(*map(asyncio.shield, futures)), self.timeout)
+
+    async def _dispatch(self):
+        """Take chunks of jobs off the queue and solve them on the executor, for ever."""
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.queue.get()]
+            while len(jobs) < self.chunksize and not self.queue.empty():
+                jobs.append(self.queue.get_nowait())
+
+            by_geometry = defaultdict(list)
+            for job in jobs:
+                (geometry, _), _ = job
+                by_geometry[geometry].append(job)
+            for geometry,group in by_geometry.items():
+                grids = [grid for (_, grid),_ in group]
+                try:
+                    solutions, _, counters = await loop.run_in_executor(
+                        self.executor, solution_batch.solve_chunk, grids, dict(self.options, geometry=geometry))
+                except Exception as e:
+                    solutions, counters = [e] * len(group), {}
+                self.metrics.solved += len(group)
+                self.metrics.counters.update(counters)
+                for (key, future),sol in zip(group, solutions):
+                    del self.in_flight[key]
+                    if future.done():
+                        continue
+                    if isinstance(sol, Exception):
+                        future.set_exception(sol)
+                    else:
+                        future.set_result(sol)
+
+            for _ in jobs:
+                self.queue.task_done()
+
+    async def _handle(self, reader, writer):
+        t0 = perf_counter()
+        try:
+            path, status, body = await self._respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+        self.metrics.statuses[status] += 1
+        if path == '/solve':
+            self.metrics.latencies.append(perf_counter() - t0)
+
+        data = json.dumps(body).encode()
+        head = 'HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: close\r\n\r\n'
+        writer.write(head.format(status, HTTPStatus(status).phrase, len(data)).encode() + data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, reader):
+        """Read one request and work out its response.
+        Returns:
+            A triple of the path, the HTTP status and the JSON body of the response.
+        """
+        try:
+            method, path, _ = (await reader.readline()).decode('latin-1').split(' ', 2)
+        except ValueError:
+            return None, 400, {'error': 'malformed request line'}
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            return path, 400, {'error': 'malformed Content-Length'}
+        if length > max_body:
+            return path, 413, {'error': 'request body over {} bytes'.format(max_body)}
+        body = await reader.readexactly(length)
+
+        if path == '/health':
+            return path, 200, {'status': 'ok'}
+        if path == '/metrics':
+            return path, 200, self.metrics.as_dict(self.queue.qsize(), len(self.in_flight))
+        if path != '/solve':
+            return path, 404, {'error': 'no such endpoint'}
+        if method != 'POST':
+            return path, 405, {'error': 'POST grids to /solve'}
+
+        try:
+            request = json.loads(body)
+            single = 'grid' in request
+            grids = [request['grid']] if single else request['grids']
+            size = request.get('size', 3)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return path, 400, {'error': 'expected {"grid": "..."} or {"grids": [...]}'}
+        if type(size) is not int or not 2 <= size <= 5:
+            return path, 400, {'error': 'size must be an integer from 2 to 5, not {!r}'.format(size)}
+        geometry = solution_utils.geometry(diagonal=not request.get('standard', False), size=size)
+        for grid in grids:
+            if not isinstance(grid, str) or len(grid) != len(geometry.boxes) or grid.strip('.0' + geometry.digits):
+                return path, 400, {'error': 'not a {}-character grid: {!r}'.format(len(geometry.boxes), grid)}
+
+        try:
+            solutions = await self.solve(grids, geometry)
+        except asyncio.QueueFull:
+            return path, 503, {'error': 'queue full, try again later'}
+        except asyncio.TimeoutError:
+            return path, 504, {'error': 'not solved within {} seconds'.format(self.timeout)}
+        except Exception as e:  # A worker failed, e.g., the pool broke.
+            return path, 500, {'error': '{}: {}'.format(type(e).__name__, e)}
+        return path, 200, {'solution': solutions[0]} if single else {'solutions': solutions}
+
+
+async def serve(host, port, **service_options):
+    service = SolverService(**service_options)
+    await service.start(host, port)
+    print('listening on http://{}:{}'.format(host, service.port), file=sys.stderr)
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a Sudoku solver over HTTP/JSON.')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8000, help='port to listen on (default: 8000)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of worker processes; 0 solves on a thread of this process (default: number of CPUs)')
+    parser.add_argument('--queue', type=int, default=256, help='most grids waiting to be solved (default: 256)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds before a request gets 504 (default: 30)')
+    parser.add_argument('--chunksize', type=int, default=16, help='most queued grids sent to a worker at a time')
+    parser.add_argument('--max-nodes', type=int, default=None, help='give up on a grid after searching this many boards')
+    parser.add_argument('--deadline', type=float, default=None, help='give up on a grid after this many seconds')
+    parser.add_argument('--bitmask', action='store_true', help='use the bitmask engine')
+    parser.add_argument('--backend', choices=solution.backends, default='propagation',
+                        help='search with constraint propagation or with Dancing Links (default: propagation)')
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, queue_size=args.queue, timeout=args.timeout,
+                          chunksize=args.chunksize, bitmask=args.bitmask, backend=args.backend,
+                          max_nodes=args.max_nodes, deadline=args.deadline))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,32 @@
 import solution
+import solution_batch
+import solution_benchmark
+import solution_cache
+import solution_bitmask
+import solution_budget
+import solution_cli
+import solution_dlx
+import solution_generator
+import solution_numpy
+import solution_packed
+import solution_parallel
+import solution_profiling
+import solution_recording
+import solution_service
+import solution_utils
+import visualize
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import io
+import json
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+import unittest.mock
 
 
 class TestNakedTwins(unittest.TestCase):
@@ -125,5 +152,1003 @@ class TestHiddenTwins(unittest.TestCase):
         self.assertEqual(solution.hidden_twins(self.before_hidden_twins), self.after_hidden_twins)
 
 
+class TestIncrementalPropagation(unittest.TestCase):
+    def test_solve(self):
+        self.assertEqual(solution.solve(TestDiagonalSudoku.diagonal_grid, incremental=True),
+                         TestDiagonalSudoku.solved_diag_sudoku)
+
+    def test_propagate_matches_sweep(self):
+        values = solution.grid_values(TestDiagonalSudoku.diagonal_grid)
+        swept = solution.reduce_puzzle(dict(values))
+        # The worklist runs to a fixpoint, so it is at least as reduced as the sweep.
+        propagated = solution.reduce_puzzle(dict(values), incremental=True)
+        self.assertTrue(all(set(propagated[box]) <= set(swept[box]) for box in values))
+
+    def test_propagate_from_changed_box(self):
+        values = solution.reduce_puzzle(solution.grid_values('.' * 81), incremental=True)
+        values['A1'], values['E5'] = '2', '9'
+        self.assertEqual(solution.reduce_puzzle(dict(values), incremental=True, changed=['A1', 'E5']),
+                         solution.reduce_puzzle(dict(values), incremental=True))
+
+
+class TestTrailSearch(unittest.TestCase):
+    grids = [TestDiagonalSudoku.diagonal_grid,
+             # Too few clues to have a unique solution, so search has to branch.
+             '.6......18......4..9....5....64..1......9......9..7....4...98......8.7.4..85..92.',
+             '..7...38..5.7.624....8......7.4.8.9...4....5.1......3...2....1..35281...7.......3']
+
+    def test_same_solutions_as_search(self):
+        for grid in self.grids:
+            for incremental in (False, True):
+                self.assertEqual(solution.solve(grid, incremental=incremental, trail=True),
+                                 solution.solve(grid, incremental=incremental))
+
+    def test_undo(self):
+        values = solution.TrailedValues(solution.grid_values(TestDiagonalSudoku.diagonal_grid))
+        before = dict(values)
+        mark = values.checkpoint()
+        solution.reduce_puzzle(values)
+        self.assertNotEqual(values, before)
+        values.undo(mark)
+        self.assertEqual(values, before)
+        self.assertEqual(values.trail, [])
+
+
+class TestStrategySchedule(unittest.TestCase):
+    grids = TestTrailSearch.grids
+
+    def test_same_solutions_as_fixed_pipeline(self):
+        for grid in self.grids:
+            for options in ({}, {'incremental': True}, {'trail': True}):
+                self.assertEqual(solution.solve(grid, adaptive=True, **options), solution.solve(grid, **options))
+
+    def test_configurable_strategies(self):
+        strategies = (solution.eliminate, solution.only_choice)
+        for adaptive in (False, True):
+            profiler = solution_profiling.StrategyProfiler()
+            solved = solution.solve(self.grids[1], strategies=strategies, adaptive=adaptive, profiler=profiler)
+            self.assertEqual(solved, solution.solve(self.grids[1]))
+            self.assertEqual(set(profiler.calls), {'eliminate', 'only_choice'})
+
+    def test_costly_strategies_run_less(self):
+        profiler = solution_profiling.StrategyProfiler()
+        solution.solve(self.grids[2], adaptive=True, profiler=profiler)
+        self.assertGreater(profiler.calls['eliminate'], profiler.calls['only_choice'])
+        self.assertGreater(profiler.calls['only_choice'], profiler.calls['hidden_twins'])
+
+    def test_idle_strategies_are_skipped(self):
+        calls = []
+
+        def never_fires(values, *boxes, geometry):
+            calls.append(1)
+            return values
+
+        schedule = solution.StrategySchedule((solution.eliminate, never_fires), patience=2, backoff=3)
+        values = solution.grid_values(TestDiagonalSudoku.diagonal_grid)
+        for _ in range(10):
+            schedule.run(values)
+        self.assertEqual(len(calls), 4)  # Run twice, skipped three times, run twice, skipped three times.
+
+
+def empty_board(geometry=solution_utils.standard_geometry):
+    """A board on which every digit is still permissible in every box."""
+    return {box: geometry.digits for box in geometry.boxes}
+
+
+def without(values, digits, boxes):
+    """A copy of values with digits removed from boxes."""
+    values = dict(values)
+    for box in boxes:
+        values[box] = ''.join(d for d in values[box] if d not in digits)
+    return values
+
+
+class TestPointingPairs(unittest.TestCase):
+    # In the top-left square, 5 can only go in A1 or A2, so it cannot go anywhere else on row A.
+    before_pointing_pairs = without(empty_board(), '5', ['A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3'])
+    after_pointing_pairs = without(before_pointing_pairs, '5', ['A4', 'A5', 'A6', 'A7', 'A8', 'A9'])
+
+    def test_pointing_pairs(self):
+        self.assertEqual(solution.pointing_pairs(dict(self.before_pointing_pairs),
+                                                 geometry=solution_utils.standard_geometry),
+                         self.after_pointing_pairs)
+
+    def test_diagonal(self):
+        # On a diagonal board, 5 in the top-left square only on the diagonal leaves the rest of it.
+        before = without(empty_board(), '5', ['A2', 'A3', 'B1', 'B3', 'C1', 'C2'])
+        after = without(before, '5', ['D4', 'E5', 'F6', 'G7', 'H8', 'I9'])
+        self.assertEqual(solution.pointing_pairs(dict(before), geometry=solution_utils.diagonal_geometry), after)
+
+
+class TestBoxLineReduction(unittest.TestCase):
+    # On row A, 5 can only go in A1 or A2, so it cannot go anywhere else in the top-left square.
+    before_box_line_reduction = without(empty_board(), '5', ['A3', 'A4', 'A5', 'A6', 'A7', 'A8', 'A9'])
+    after_box_line_reduction = without(before_box_line_reduction, '5', ['B1', 'B2', 'B3', 'C1', 'C2', 'C3'])
+
+    def test_box_line_reduction(self):
+        self.assertEqual(solution.box_line_reduction(dict(self.before_box_line_reduction),
+                                                     geometry=solution_utils.standard_geometry),
+                         self.after_box_line_reduction)
+
+
+class TestNakedSubsets(unittest.TestCase):
+    # A1, A2 and A3 hold 1, 2 and 3 between them, which therefore cannot go anywhere else on row A
+    # or in the top-left square.
+    before_naked_triples = dict(empty_board(), A1='12', A2='23', A3='13')
+    after_naked_triples = without(before_naked_triples, '123', ['A4', 'A5', 'A6', 'A7', 'A8', 'A9',
+                                                                'B1', 'B2', 'B3', 'C1', 'C2', 'C3'])
+
+    def test_naked_triples(self):
+        self.assertEqual(solution.naked_triples(dict(self.before_naked_triples),
+                                                geometry=solution_utils.standard_geometry),
+                         self.after_naked_triples)
+
+    def test_naked_quads(self):
+        before = dict(empty_board(), A1='12', D1='23', G1='34', I1='14')
+        after = without(before, '1234', ['B1', 'C1', 'E1', 'F1', 'H1'])
+        self.assertEqual(solution.naked_quads(dict(before), geometry=solution_utils.standard_geometry), after)
+
+    def test_matches_naked_twins(self):
+        before = dict(TestNakedTwins.before_naked_twins_1)
+        self.assertIn(solution.naked_subsets(before, k=2), TestNakedTwins.possible_solutions_1)
+
+
+class TestHiddenSubsets(unittest.TestCase):
+    # On row A, 1, 2 and 3 can only go in A1, A2 or A3, which therefore cannot hold anything else.
+    before_hidden_triples = without(empty_board(), '123', ['A4', 'A5', 'A6', 'A7', 'A8', 'A9'])
+    after_hidden_triples = dict(before_hidden_triples, A1='123', A2='123', A3='123')
+
+    def test_hidden_triples(self):
+        self.assertEqual(solution.hidden_triples(dict(self.before_hidden_triples),
+                                                 geometry=solution_utils.standard_geometry),
+                         self.after_hidden_triples)
+
+    def test_hidden_quads(self):
+        before = without(empty_board(), '1234', ['B1', 'C1', 'E1', 'F1', 'H1'])
+        after = dict(before, A1='1234', D1='1234', G1='1234', I1='1234')
+        self.assertEqual(solution.hidden_quads(dict(before), geometry=solution_utils.standard_geometry), after)
+
+    def test_matches_hidden_twins(self):
+        before = dict(TestHiddenTwins.before_hidden_twins)
+        self.assertEqual(solution.hidden_subsets(before, k=2), TestHiddenTwins.after_hidden_twins)
+
+
+class TestFish(unittest.TestCase):
+    # 5 can only go in columns 1 and 5 on rows A and E, so it cannot go anywhere else in those columns.
+    before_x_wing = without(empty_board(), '5', ['A2', 'A3', 'A4', 'A6', 'A7', 'A8', 'A9',
+                                                 'E2', 'E3', 'E4', 'E6', 'E7', 'E8', 'E9'])
+    after_x_wing = without(before_x_wing, '5', ['B1', 'C1', 'D1', 'F1', 'G1', 'H1', 'I1',
+                                                'B5', 'C5', 'D5', 'F5', 'G5', 'H5', 'I5'])
+
+    # 5 can only go in columns 1, 4 and 7 on rows A, D and G.
+    before_swordfish = without(empty_board(), '5', ['A2', 'A3', 'A5', 'A6', 'A7', 'A8', 'A9',
+                                                    'D1', 'D2', 'D3', 'D5', 'D6', 'D8', 'D9',
+                                                    'G2', 'G3', 'G4', 'G5', 'G6', 'G8', 'G9'])
+    after_swordfish = without(before_swordfish, '5', [r + c for r in 'BCEFHI' for c in '147'])
+
+    def test_x_wing(self):
+        self.assertEqual(solution.x_wing(dict(self.before_x_wing), geometry=solution_utils.standard_geometry),
+                         self.after_x_wing)
+
+    def test_x_wing_in_columns(self):
+        transpose = lambda values: {r + c: values['ABCDEFGHI'[int(c) - 1] + str('ABCDEFGHI'.index(r) + 1)]
+                                    for r,c in values}
+        self.assertEqual(solution.x_wing(transpose(self.before_x_wing), geometry=solution_utils.standard_geometry),
+                         transpose(self.after_x_wing))
+
+    def test_swordfish(self):
+        self.assertEqual(solution.swordfish(dict(self.before_swordfish), geometry=solution_utils.standard_geometry),
+                         self.after_swordfish)
+
+    def test_written(self):
+        written = set()
+        solution.x_wing(dict(self.before_x_wing), geometry=solution_utils.standard_geometry, written=written)
+        self.assertEqual(written, {box for box in self.before_x_wing if self.before_x_wing[box] != self.after_x_wing[box]})
+
+    def test_propagate_follows_far_changes(self):
+        passes = []
+
+        def checked(values, *boxes, geometry):
+            passes.append(set(boxes))
+            return values
+
+        # Starting from A1, x_wing removes 5 from column 5 too, beyond the peers of A1.
+        values = solution.propagate(dict(self.before_x_wing), 'A1', geometry=solution_utils.standard_geometry,
+                                    strategies=[solution.x_wing, checked])
+        self.assertEqual(values, self.after_x_wing)
+        self.assertTrue({'B5', 'I5'} <= passes[1])
+
+
+class TestStrategyRegistry(unittest.TestCase):
+    grid = TestTrailSearch.grids[2]
+
+    def test_solve_by_name(self):
+        for options in ({}, {'incremental': True}, {'adaptive': True}):
+            self.assertEqual(solution.solve(self.grid, strategies=list(solution.strategy_registry), **options),
+                             solution.solve(self.grid))
+
+    def test_register_strategy(self):
+        calls = []
+
+        def counted(values, *boxes, geometry):
+            calls.append(boxes)
+            return values
+
+        solution.register_strategy(counted, 'counted')
+        try:
+            solution.solve(self.grid, strategies=['eliminate', 'only_choice', 'counted'])
+        finally:
+            del solution.strategy_registry['counted']
+        self.assertTrue(calls)
+
+
+class TestDancingLinks(unittest.TestCase):
+    grids = TestTrailSearch.grids
+
+    def test_solve(self):
+        self.assertEqual(solution.solve(TestDiagonalSudoku.diagonal_grid, backend='dlx'),
+                         TestDiagonalSudoku.solved_diag_sudoku)
+
+    def test_solves_what_propagation_solves(self):
+        # These grids have several solutions, and the backends need not find the same one.
+        for grid in self.grids[1:]:
+            for geometry in (solution_utils.standard_geometry, solution_utils.diagonal_geometry):
+                TestBoardSizes.assertSolved(self, solution.solve(grid, backend='dlx', geometry=geometry),
+                                            grid, geometry)
+
+    def test_board_sizes(self):
+        for grid,size in ((TestBoardSizes.shidoku, 2), (TestBoardSizes.hexadoku, 4)):
+            geometry = solution_utils.geometry(size=size)
+            TestBoardSizes.assertSolved(self, solution.solve(grid, backend='dlx', geometry=geometry), grid, geometry)
+
+    def test_no_solution(self):
+        self.assertFalse(solution.solve('11' + '.' * 79, backend='dlx'))
+        self.assertFalse(solution.solve('1' * 81, backend='dlx'))
+
+    def test_all_solutions(self):
+        # The 288 shidoku (4x4) boards.
+        geometry = solution_utils.geometry(size=2)
+        matrix = solution_dlx.ExactCover(solution.grid_values('.' * 16, geometry), geometry)
+        boards = {tuple(sorted(matrix.values(rows).items())) for rows in matrix.solutions()}
+        self.assertEqual(len(boards), 288)
+
+    def test_matrix_restored(self):
+        geometry = solution_utils.standard_geometry
+        matrix = solution_dlx.ExactCover(solution.grid_values('.' * 81, geometry), geometry)
+        solutions = matrix.solutions()
+        next(solutions), next(solutions)
+        solutions.close()
+        empty = solution_dlx.empty_matrix(geometry)
+        self.assertEqual((matrix.left, matrix.right, matrix.up, matrix.down, matrix.size),
+                         tuple(map(list, (empty[0], empty[1], empty[2], empty[3], empty[6]))))
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            solution.solve(TestDiagonalSudoku.diagonal_grid, backend='quantum')
+
+
+@unittest.skipIf(solution_numpy.np is None, 'NumPy is not installed')
+class TestNumpyEngine(unittest.TestCase):
+    def test_solve(self):
+        self.assertEqual(solution.solve(TestDiagonalSudoku.diagonal_grid, backend='numpy'),
+                         TestDiagonalSudoku.solved_diag_sudoku)
+
+    def test_batch(self):
+        geometry = solution_utils.standard_geometry
+        grids = solution_benchmark.load_corpus('easy') + solution_benchmark.load_corpus('hard')[:5] + ['11' + '.' * 79]
+        solutions = solution_numpy.solve_grids(grids, geometry)
+        self.assertIsNone(solutions[-1])
+        for grid,solved in zip(grids[:-1], solutions):
+            TestBoardSizes.assertSolved(self, dict(zip(geometry.boxes, solved)), grid, geometry)
+        self.assertEqual(list(solution_batch.solve_many(grids, workers=0, geometry=geometry, backend='numpy')),
+                         solutions)
+
+    def test_strategies(self):
+        geometry = solution_utils.standard_geometry
+        t = solution_numpy.tables(geometry)
+
+        def run(strategy, values):
+            boards = solution_numpy.np.array([solution_bitmask.cells_from_values(values, geometry)], dtype=t.dtype)
+            return solution_bitmask.values_from_cells(strategy(boards, t)[0].tolist(), geometry)
+
+        values = dict(empty_board(), A1='5')
+        after = run(solution_numpy.eliminate, values)
+        self.assertEqual(after, without(values, '5', geometry.peers['A1']))
+        values = without(empty_board(), '7', solution_utils.cross('A', '12345689'))
+        after = run(solution_numpy.only_choice, values)
+        self.assertEqual(after, dict(values, A7='7'))
+        values = without(values, '8', solution_utils.cross('A', '12345689'))
+        self.assertEqual(run(solution_numpy.only_choice, values)['A7'], '')
+
+
+class TestNumpyMissing(unittest.TestCase):
+    def test_import_error(self):
+        with unittest.mock.patch('solution_numpy.np', None):
+            solution_numpy.tables.cache_clear()
+            self.assertRaises(ImportError, solution.solve, TestDiagonalSudoku.diagonal_grid, backend='numpy')
+        solution_numpy.tables.cache_clear()
+
+
+class TestRecording(unittest.TestCase):
+    branching_grid = TestTrailSearch.grids[1]
+
+    def test_final(self):
+        recorder = solution_recording.FinalRecorder()
+        solved = solution.solve(TestDiagonalSudoku.diagonal_grid, recorder=recorder)
+        self.assertEqual(recorder.boards(), [solved])
+
+    def test_ring(self):
+        recorder = solution_recording.RingRecorder(5)
+        solved = solution.solve(TestDiagonalSudoku.diagonal_grid, recorder=recorder)
+        self.assertEqual(len(recorder.boards()), 5)
+        self.assertEqual(recorder.boards()[-1], solved)
+
+    def test_deltas_replay_history(self):
+        ring = solution_recording.RingRecorder(None)
+        deltas = solution_recording.DeltaRecorder()
+        solution.solve(TestDiagonalSudoku.diagonal_grid, recorder=ring)
+        solution.solve(TestDiagonalSudoku.diagonal_grid, recorder=deltas)
+        self.assertEqual(list(deltas.boards()), ring.boards())
+
+    def test_deltas_follow_branches(self):
+        for trail in (False, True):
+            recorder = solution_recording.DeltaRecorder()
+            solved = solution.solve(self.branching_grid, trail=trail, recorder=recorder)
+            self.assertEqual(list(recorder.boards())[-1], solved)
+
+    def test_frame_changes(self):
+        boards = [{'A1': '12', 'A2': '3'}, {'A1': '1', 'A2': '3'}, {'A1': '12', 'A2': '3'},
+                  {'A1': '12', 'A2': '34'}, {'A1': '2', 'A2': '34'}, {'A1': '2', 'A2': '3'}]
+        self.assertEqual(list(solution_recording.frame_changes(iter(boards))),
+                         [{'A2': '3'}, {'A1': '1'}, {'A1': '2', 'A2': None}, {'A2': '3'}])
+
+    def test_deltas_frame_changes(self):
+        for trail in (False, True):
+            recorder = solution_recording.DeltaRecorder()
+            solved = solution.solve(self.branching_grid, trail=trail, recorder=recorder)
+            frames = list(recorder.frame_changes())
+            self.assertEqual(frames, list(solution_recording.frame_changes(recorder.boards())))
+            shown = {}
+            for changes in frames:
+                shown.update(changes)
+            self.assertEqual(shown, solved)
+
+    def test_export_path(self):
+        for path in ('replay.gif', 'REPLAY.GIF', 'frames/%05d.png'):
+            visualize.check_path(path)
+        # Checked before pygame is imported, so this runs without it.
+        for path in ('out.png', 'frames/%05d-%d.png'):
+            self.assertRaises(ValueError, visualize.export_assignments, [], path)
+
+    def test_off_by_default(self):
+        values = solution.grid_values(TestDiagonalSudoku.diagonal_grid)
+        self.assertIs(solution.assign_value(values, 'A2', '6'), values)
+        self.assertFalse(hasattr(solution, 'assignments'))
+
+
+class TestProfiling(unittest.TestCase):
+    branching_grid = TestTrailSearch.grids[1]
+
+    def test_profile_is_consistent(self):
+        for options in ({}, {'incremental': True}, {'trail': True}, {'bitmask': True}):
+            profiler = solution_profiling.StrategyProfiler()
+            solved = solution.solve(self.branching_grid, profiler=profiler, **options)
+            self.assertEqual(solved, solution.solve(self.branching_grid, **options))
+            strategies = {'eliminate', 'only_choice', 'naked_twins', 'hidden_twins'}
+            self.assertEqual(set(profiler.calls), strategies)
+            self.assertEqual(len(set(profiler.calls.values())), 1)  # Strategies are called together.
+            self.assertTrue(all(profiler.eliminated[name] >= 0 for name in strategies))
+            self.assertTrue(all(profiler.idle_calls[name] <= profiler.calls[name] for name in strategies))
+            self.assertEqual(profiler.nodes, sum(profiler.depths.values()))
+            self.assertEqual(profiler.depths[0], 1)
+            self.assertGreater(profiler.backtracks, 0)
+            self.assertEqual(max(profiler.depths), profiler.max_depth)
+
+    def test_eliminated_adds_up(self):
+        # Every candidate removed from the grid, apart from the given and the solved digits, is
+        # removed by some strategy.
+        profiler = solution_profiling.StrategyProfiler()
+        solution.solve(TestDiagonalSudoku.diagonal_grid, profiler=profiler)
+        n_blank = TestDiagonalSudoku.diagonal_grid.count('.')
+        self.assertEqual(profiler.nodes, 1)
+        self.assertEqual(sum(profiler.eliminated.values()), 8 * n_blank)
+
+    def test_report(self):
+        profiler = solution_profiling.StrategyProfiler()
+        solution.solve(self.branching_grid, profiler=profiler)
+        out = io.StringIO()
+        profiler.report(out)
+        self.assertIn('hidden_twins', out.getvalue())
+        self.assertEqual(profiler.as_dict()['nodes'], profiler.nodes)
+
+
+class TestBudget(unittest.TestCase):
+    grid = solution_benchmark.load_corpus('hard')[2]  # Searches 5 boards, 2 levels deep.
+    geometry = solution_utils.standard_geometry
+
+    def test_max_nodes(self):
+        options = [{}, {'bitmask': True}, {'trail': True}, {'backend': 'dlx'}]
+        if solution_numpy.np is not None:
+            options.append({'backend': 'numpy'})
+        for kwargs in options:
+            with self.assertRaises(solution_budget.BudgetExceeded) as raised:
+                solution.solve(self.grid, geometry=self.geometry, max_nodes=2, **kwargs)
+            self.assertEqual(raised.exception.reason, 'max_nodes')
+            self.assertEqual(raised.exception.nodes, 3)
+            self.assertGreaterEqual(raised.exception.max_depth, 1)
+
+    def test_within_budget(self):
+        solved = solution.solve(self.grid, geometry=self.geometry, max_nodes=100000, deadline=60.0)
+        TestBoardSizes.assertSolved(self, solved, self.grid, self.geometry)
+
+    def test_deadline(self):
+        with self.assertRaises(solution_budget.BudgetExceeded) as raised:
+            solution.solve(self.grid, geometry=self.geometry, deadline=0.0)
+        self.assertEqual(raised.exception.reason, 'deadline')
+
+    def test_cancel(self):
+        budget = solution_budget.Budget()
+        budget.cancel()
+        with self.assertRaises(solution_budget.BudgetExceeded) as raised:
+            solution.solve(self.grid, geometry=self.geometry, budget=budget)
+        self.assertEqual(raised.exception.reason, 'cancelled')
+
+    def test_solve_async_cancelled(self):
+        class SlowBudget(solution_budget.Budget):
+            def node(self, depth):
+                time.sleep(0.05)
+                super().node(depth)
+
+        budget = SlowBudget()
+
+        async def main():
+            with ThreadPoolExecutor(1) as executor:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(solution_budget.solve_async(
+                        self.grid, executor, budget, geometry=self.geometry), 0.01)
+        asyncio.run(main())
+        self.assertTrue(budget.cancelled)
+        self.assertLess(budget.nodes, 5)
+
+    def test_batch(self):
+        grids = [self.grid, solution_benchmark.load_corpus('easy')[0]]
+        solutions, _, _ = solution_batch.solve_chunk(grids, {'geometry': self.geometry, 'max_nodes': 2})
+        self.assertEqual(solutions[0], solution_batch.budget_exceeded)
+        self.assertEqual(solutions[1], solution_batch.solution_string(solution.solve(grids[1], geometry=self.geometry),
+                                                                      self.geometry))
+
+
+class TestBranching(unittest.TestCase):
+    geometry = solution_utils.standard_geometry
+    grids = solution_benchmark.load_corpus('hardest')[:4]
+
+    def test_policies_solve(self):
+        for name in solution.branching_policies:
+            for grid in self.grids:
+                for trail in (False, True):
+                    TestBoardSizes.assertSolved(self, solution.solve(grid, geometry=self.geometry, branching=name,
+                                                                     trail=trail), grid, self.geometry)
+
+    def test_degree(self):
+        # A1 and I9 both have two candidates, but I9 has more unsolved peers once row A and column 1 are solved.
+        values = dict(empty_board(), **{box: '9' for box in solution_utils.cross('A', '23456789')},
+                      **{box: '9' for box in solution_utils.cross('BCDEFGHI', '1')})
+        values.update(A1='12', I9='12')
+        self.assertEqual(solution.Branching().choose(values, self.geometry), 'A1')
+        self.assertEqual(solution.DegreeBranching().choose(values, self.geometry), 'I9')
+
+    def test_least_constraining_value(self):
+        values = dict(empty_board(), A1='123', A2='1', B1='24', B2='24')
+        values = without(values, '3', [box for box in self.geometry.peers['A1'] if len(values[box]) > 1])
+        self.assertEqual(solution.LeastConstrainingValue().order(values, 'A1', self.geometry), ['3', '1', '2'])
+
+    def test_weighted_degree(self):
+        policy = solution.WeightedDegree()
+        values = dict(empty_board(), A1='12', I9='12')
+        self.assertEqual(policy.choose(values, self.geometry), 'A1')
+        policy.failed(['I9'], self.geometry)
+        self.assertEqual(policy.choose(values, self.geometry), 'I9')
+
+    def test_dead_ends(self):
+        grid = self.grids[1]
+        dead_ends = solution.DeadEnds(maxsize=100)
+        solution.solve(grid, geometry=self.geometry, dead_ends=dead_ends)
+        self.assertGreater(dead_ends.stores, 0)
+        before = solution.search_invocations
+        solution.solve(grid, geometry=self.geometry)
+        fresh = solution.search_invocations - before
+        before = solution.search_invocations
+        solved = solution.solve(grid, geometry=self.geometry, dead_ends=dead_ends, trail=True)
+        self.assertLess(solution.search_invocations - before, fresh)
+        self.assertGreater(dead_ends.hits, 0)
+        TestBoardSizes.assertSolved(self, solved, grid, self.geometry)
+
+    def test_dead_ends_bounded(self):
+        dead_ends = solution.DeadEnds(maxsize=2)
+        solution.solve(self.grids[1], geometry=self.geometry, dead_ends=dead_ends)
+        self.assertLessEqual(len(dead_ends.boards), 2)
+        self.assertEqual(dead_ends.evictions, dead_ends.stores - len(dead_ends.boards))
+
+
+class TestParallelSearch(unittest.TestCase):
+    geometry = solution_utils.standard_geometry
+    grids = solution_benchmark.load_corpus('hardest')
+
+    def test_split(self):
+        cells = solution_bitmask.cells_from_values(solution.grid_values('.' * 81, self.geometry), self.geometry)
+        solved, frontier = solution_parallel.split(cells, self.geometry, target=8)
+        self.assertEqual(solved, [])
+        self.assertGreaterEqual(len(frontier), 8)
+        self.assertEqual(len({tuple(cells) for cells in frontier}), len(frontier))
+
+    def test_in_process(self):
+        with solution_parallel.ParallelSolver(workers=0) as solver:
+            for grid in self.grids[:3]:
+                TestBoardSizes.assertSolved(self, solver.solve(grid, self.geometry), grid, self.geometry)
+            self.assertFalse(solver.solve('1' * 81, self.geometry))
+            self.assertEqual(solver.count('.' * 16, None, solution_utils.geometry(size=2)), 288)
+            self.assertEqual(solver.count('.' * 81, 10, self.geometry), 10)
+
+    def test_pool(self):
+        with solution_parallel.ParallelSolver(workers=2) as solver:
+            # The empty board has a solution in every subproblem, so the others are cancelled.
+            TestBoardSizes.assertSolved(self, solver.solve('.' * 81, self.geometry), '.' * 81, self.geometry)
+            self.assertGreater(solver.subproblems, 1)
+            self.assertEqual(solver.count('.' * 16, None, solution_utils.geometry(size=2)), 288)
+            self.assertEqual(solver.count('.' * 81, 50, self.geometry), 50)
+            self.assertEqual(solver.count(self.grids[5], None, self.geometry), 1)
+            self.assertFalse(solver.event.is_set())
+
+    def test_cancelled_count(self):
+        with solution_parallel.ParallelSolver(workers=2) as solver:
+            solver.event.set()  # Every subproblem is cancelled as it starts, and counts nothing.
+            self.assertEqual(solver.count('.' * 81, 50, self.geometry), 0)
+
+
+class TestSolveMany(unittest.TestCase):
+    grids = TestTrailSearch.grids + ['1' * 81]  # The last grid has no solution.
+    solutions = [solution_batch.solution_string(solution.solve(grid)) for grid in grids]
+
+    def test_in_process(self):
+        counters = solution_batch.Counter()
+        self.assertEqual(list(solution_batch.solve_many(self.grids, workers=0, counters=counters)), self.solutions)
+        self.assertEqual(self.solutions[-1], None)
+        self.assertGreaterEqual(counters['search_invocations'], len(self.grids))
+
+    def test_pool_ordered(self):
+        counters = solution_batch.Counter()
+        solved = solution_batch.solve_many(self.grids, workers=2, chunksize=1, counters=counters, trail=True)
+        self.assertEqual(list(solved), self.solutions)
+        self.assertGreaterEqual(counters['search_invocations'], len(self.grids))
+
+    def test_pool_unordered(self):
+        solved = solution_batch.solve_many(self.grids, workers=2, chunksize=1, ordered=False, bitmask=True)
+        self.assertEqual(sorted(solved, key=lambda pair: pair[0]), list(enumerate(self.solutions)))
+
+
+class TestCommandLine(unittest.TestCase):
+    def test_main(self):
+        lines = [TestDiagonalSudoku.diagonal_grid.replace('.', '0'), '', '  # an indented comment', 'not a grid',
+                 '1' * 81]
+        stdin = io.StringIO('\n'.join(lines) + '\n')
+        with unittest.mock.patch('sys.stdin', stdin), unittest.mock.patch('sys.stdout', io.StringIO()) as stdout, \
+                unittest.mock.patch('sys.stderr', io.StringIO()) as stderr:
+            solution_cli.main(['--workers', '0'])
+        output = [line.split() for line in stdout.getvalue().splitlines()]
+        self.assertEqual([(number, sol) for number,sol,_ in output],
+                         [('1', TestSolveMany.solutions[0]), ('5', '-')])
+        self.assertIn('line 4:', stderr.getvalue())
+        self.assertNotIn('line 3:', stderr.getvalue())
+
+    def test_packed_stdin(self):
+        with unittest.mock.patch('sys.stderr', io.StringIO()):
+            self.assertRaises(SystemExit, solution_cli.main, ['--packed'])
+            self.assertRaises(SystemExit, solution_cli.main, ['-', '--packed'])
+
+
+class TestService(unittest.TestCase):
+    hard = solution_benchmark.load_corpus('hard')[:3]
+
+    @staticmethod
+    async def request(port, method, path, body=b''):
+        """Send an HTTP request to the service on localhost, and return the status and the JSON body."""
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write('{} {} HTTP/1.1\r\nContent-Length: {}\r\n\r\n'.format(method, path, len(body)).encode() + body)
+        response = await reader.read()
+        writer.close()
+        head, _, payload = response.partition(b'\r\n\r\n')
+        return int(head.split()[1]), json.loads(payload)
+
+    def serve(self, test, **options):
+        async def run():
+            async with solution_service.SolverService(workers=0, **options) as service:
+                return await test(service)
+        return asyncio.run(run())
+
+    def test_solve(self):
+        async def test(service):
+            single = await self.request(service.port, 'POST', '/solve', {'grid': TestDiagonalSudoku.diagonal_grid})
+            batch = await self.request(service.port, 'POST', '/solve', {'grids': self.hard + ['1' * 81], 'standard': True})
+            _, metrics = await self.request(service.port, 'GET', '/metrics')
+            return single, batch, metrics
+        single, batch, metrics = self.serve(test)
+        self.assertEqual(single, (200, {'solution': TestSolveMany.solutions[0]}))
+        status, body = batch
+        self.assertEqual(status, 200)
+        expected = [solution_batch.solution_string(solution.solve(grid, geometry=solution_utils.standard_geometry),
+                                                   solution_utils.standard_geometry) for grid in self.hard]
+        self.assertEqual(body['solutions'], expected + [None])
+        self.assertEqual((metrics['statuses'], metrics['grids'], metrics['solved']), ({'200': 2}, 5, 5))
+
+    def test_coalescing(self):
+        async def test(service):
+            grids = self.hard[:2]
+            results = await asyncio.gather(service.solve(grids, solution_utils.standard_geometry),
+                                           service.solve(grids[::-1], solution_utils.standard_geometry))
+            return results, service.metrics
+        (first, second), metrics = self.serve(test)
+        self.assertEqual(first, second[::-1])
+        self.assertEqual((metrics.grids, metrics.coalesced, metrics.solved), (4, 2, 2))
+
+    def test_errors(self):
+        async def test(service):
+            return [await self.request(service.port, 'POST', '/solve', b'not json'),
+                    await self.request(service.port, 'POST', '/solve', {'grid': '123'}),
+                    await self.request(service.port, 'POST', '/solve', {'grid': '.' * 81, 'size': 7}),
+                    await self.request(service.port, 'POST', '/solve', {'grid': '.' * 16, 'size': True}),
+                    await self.request(service.port, 'GET', '/solve'),
+                    await self.request(service.port, 'GET', '/nowhere'),
+                    await self.request(service.port, 'POST', '/solve', {'grids': self.hard[:2], 'standard': True})]
+        statuses = [status for status,_ in self.serve(test, queue_size=1)]
+        self.assertEqual(statuses, [400, 400, 400, 400, 405, 404, 503])
+
+    def test_timeout(self):
+        async def test(service):
+            return await self.request(service.port, 'POST', '/solve', {'grid': self.hard[0], 'standard': True})
+        self.assertEqual(self.serve(test, timeout=0)[0], 504)
+
+
+class TestSolutionCounting(unittest.TestCase):
+    grids = TestSolveMany.grids  # A well-formed puzzle, two with several solutions and one with none.
+
+    def test_count_solutions(self):
+        for backend in solution.backends:
+            self.assertEqual([solution.count_solutions(grid, backend=backend) for grid in self.grids], [1, 2, 2, 0])
+            self.assertEqual([solution.is_unique(grid, backend=backend) for grid in self.grids],
+                             [True, False, False, False])
+
+    def test_limit(self):
+        shidoku = solution_utils.geometry(size=2)
+        for backend in solution.backends:
+            self.assertEqual(solution.count_solutions('.' * 16, None, shidoku, backend), 288)
+            self.assertEqual(solution.count_solutions('.' * 16, 10, shidoku, backend), 10)
+            self.assertEqual(solution.count_solutions('.' * 81, 3, backend=backend), 3)
+            self.assertEqual(solution.count_solutions('.' * 16, 0, shidoku, backend), 0)
+            self.assertEqual(solution.count_solutions('1' * 16, 0, shidoku, backend), 0)
+            self.assertEqual(solution.count_solutions(TestDiagonalSudoku.diagonal_grid, 0, backend=backend), 0)
+
+    def test_count_many(self):
+        self.assertEqual(list(solution_batch.count_many(self.grids, workers=0)), [1, 2, 2, 0])
+        counted = solution_batch.count_many(self.grids, workers=2, chunksize=1, ordered=False, backend='dlx')
+        self.assertEqual(sorted(counted), [(0, 1), (1, 2), (2, 2), (3, 0)])
+
+    def test_command_line(self):
+        stdin = io.StringIO('\n'.join(self.grids) + '\n')
+        with unittest.mock.patch('sys.stdin', stdin), unittest.mock.patch('sys.stdout', io.StringIO()) as stdout, \
+                unittest.mock.patch('sys.stderr', io.StringIO()):
+            solution_cli.main(['--workers', '0', '--count', '--limit', '5'])
+        output = [line.split() for line in stdout.getvalue().splitlines()]
+        self.assertEqual([count for _,count,_ in output[:1] + output[3:]], ['1', '0'])
+        self.assertTrue(all(int(count) > 2 for _,count,_ in output[1:3]))
+
+
+class TestGenerator(unittest.TestCase):
+    geometry = solution_utils.standard_geometry
+
+    def test_minimal_and_unique(self):
+        grid, rating = solution_generator.generate(self.geometry, seed=1)
+        self.assertTrue(solution.is_unique(grid, self.geometry))
+        for i,clue in enumerate(grid):
+            if clue != '.':
+                self.assertFalse(solution.is_unique(grid[:i] + '.' + grid[i+1:], self.geometry))
+        self.assertEqual(rating, solution_generator.rate(grid, self.geometry))
+        self.assertEqual(solution_generator.generate(self.geometry, seed=1), (grid, rating))
+
+    def test_targets(self):
+        grid, _ = solution_generator.generate(self.geometry, clues=40, seed=2)
+        self.assertEqual(81 - grid.count('.'), 40)
+        self.assertTrue(solution.is_unique(grid, self.geometry))
+        grid, rating = solution_generator.generate(solution_utils.diagonal_geometry, difficulty='medium', seed=3)
+        self.assertIn(rating.level, ('medium', 'hard', 'fiendish'))
+        self.assertTrue(solution.is_unique(grid))
+
+    def test_rate(self):
+        easy = solution_generator.rate(solution_benchmark.load_corpus('easy')[0], self.geometry)
+        self.assertEqual(easy.level, 'easy')
+        self.assertEqual(easy.search_invocations, 1)
+        medium = solution_generator.rate(solution_benchmark.load_corpus('easy')[25], self.geometry)
+        self.assertEqual(medium, solution_generator.Rating('medium', ('eliminate', 'only_choice', 'hidden_twins'), 1))
+        fiendish = solution_generator.rate(solution_benchmark.load_corpus('hard')[0], self.geometry)
+        self.assertEqual(fiendish.level, 'fiendish')
+        self.assertGreater(fiendish.search_invocations, 1)
+
+    def test_generate_many(self):
+        puzzles = list(solution_generator.generate_many(2, seed=5, workers=0, geometry=self.geometry, clues=50))
+        self.assertEqual(puzzles, [solution_generator.generate(self.geometry, clues=50, seed=seed) for seed in (5, 6)])
+
+
+class TestSolutionCache(unittest.TestCase):
+    grid = solution_benchmark.load_corpus('hard')[0]
+
+    @staticmethod
+    def transform(grid, rows, cols, digits, transpose=False):
+        """The grid with its rows and columns taken in the given orders, and its digits renamed."""
+        boxes = [grid[9 * r + c] for r in rows for c in cols]
+        if transpose:
+            boxes = [boxes[9 * c + r] for r in range(9) for c in range(9)]
+        return ''.join(dict(zip('123456789', digits)).get(digit, '.') for digit in boxes)
+
+    def test_equivalent_grids_hit(self):
+        geometry = solution_utils.standard_geometry
+        cache = solution_cache.SolutionCache()
+        equivalent = self.transform(self.grid, [2, 0, 1, 3, 5, 4, 8, 7, 6], [1, 2, 0, 3, 4, 5, 7, 6, 8],
+                                    '574913628', transpose=True)
+        self.assertEqual(solution_cache.canonical_form(self.grid, geometry)[0],
+                         solution_cache.canonical_form(equivalent, geometry)[0])
+        self.assertEqual(cache.solve(self.grid, geometry=geometry), solution.solve(self.grid, geometry=geometry))
+        TestBoardSizes.assertSolved(self, cache.solve(equivalent, geometry=geometry), equivalent, geometry)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_diagonal_symmetries(self):
+        cache = solution_cache.SolutionCache()
+        grid = TestDiagonalSudoku.diagonal_grid
+        # Swapping rows 0 and 1 (a symmetry of standard Sudoku) moves the diagonals, whereas
+        # turning the board a quarter turn keeps them.
+        swapped = self.transform(grid, [1, 0, 2, 3, 4, 5, 6, 7, 8], range(9), '123456789')
+        turned = ''.join(grid[9 * (8 - c) + r] for r in range(9) for c in range(9))
+        geometry = solution_utils.diagonal_geometry
+        self.assertNotEqual(solution_cache.canonical_form(grid)[0], solution_cache.canonical_form(swapped)[0])
+        self.assertEqual(solution_cache.canonical_form(grid)[0], solution_cache.canonical_form(turned)[0])
+        self.assertEqual(cache.solve(grid), TestDiagonalSudoku.solved_diag_sudoku)
+        TestBoardSizes.assertSolved(self, cache.solve(turned), turned, geometry)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction_and_no_solution(self):
+        geometry = solution_utils.standard_geometry
+        cache = solution_cache.SolutionCache(maxsize=1)
+        clue = next(digit for digit in self.grid[:9] if digit != '.')
+        broken = self.grid[:9].replace('.', clue, 1) + self.grid[9:]
+        self.assertFalse(cache.solve(broken, geometry=geometry))
+        self.assertFalse(cache.solve(self.transform(broken, range(9), range(9), '987654321'), geometry=geometry))
+        cache.solve(self.grid, geometry=geometry)
+        self.assertEqual(cache.cache_info()['evictions'], 1)
+        self.assertEqual(cache.cache_info()['size'], 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_persistent_store(self):
+        geometry = solution_utils.standard_geometry
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'solutions')
+            with solution_cache.SolutionCache(path=path) as cache:
+                expected = cache.solve(self.grid, geometry=geometry)
+            with solution_cache.SolutionCache(path=path) as cache:
+                self.assertEqual(cache.solve(self.grid, geometry=geometry), expected)
+                self.assertEqual((cache.hits, cache.disk_hits, cache.misses), (1, 1, 0))
+
+
+class TestPackedArchive(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'grids.sdk')
+
+    def test_round_trip(self):
+        grids = [TestDiagonalSudoku.diagonal_grid, '.' * 81, TestDiagonalSudoku.diagonal_grid.replace('.', '0')]
+        solutions = [TestDiagonalSudoku.solved_diag_sudoku, False, None]
+        self.assertEqual(solution_packed.pack(self.path, grids, solutions=solutions), 3)
+        self.assertEqual(os.path.getsize(self.path), solution_packed.header.size + 2 + 3 * 82)
+        solved = ''.join(TestDiagonalSudoku.solved_diag_sudoku[box] for box in solution_utils.boxes)
+        with solution_packed.PackedReader(self.path) as reader:
+            self.assertIs(reader.geometry, solution_utils.diagonal_geometry)
+            self.assertEqual(len(reader), 3)
+            self.assertEqual(list(reader.items()), [(TestDiagonalSudoku.diagonal_grid, solved), ('.' * 81, None),
+                                                    (TestDiagonalSudoku.diagonal_grid, None)])
+            self.assertEqual(solution.solve(reader[0]), TestDiagonalSudoku.solved_diag_sudoku)
+
+    def test_board_variants(self):
+        for geometry,grid in ((solution_utils.geometry(size=2), TestBoardSizes.shidoku),
+                              (solution_utils.geometry(size=4), TestBoardSizes.hexadoku),
+                              (solution_utils.geometry(extra_units=[solution_utils.boxes[:9]]), '.' * 81)):
+            solution_packed.pack(self.path, [grid], geometry)
+            with solution_packed.PackedReader(self.path) as reader:
+                self.assertIs(reader.geometry, geometry)
+                self.assertEqual(list(reader), [grid])
+
+    def test_not_an_archive(self):
+        with open(self.path, 'w') as f:
+            f.write(TestDiagonalSudoku.diagonal_grid)
+        self.assertFalse(solution_packed.is_packed(self.path))
+        self.assertRaises(ValueError, solution_packed.PackedReader, self.path)
+
+    def test_pack_command(self):
+        lines = ['# a comment', TestDiagonalSudoku.diagonal_grid, '', 'X' * 81, '1' * 81]
+        stdin = io.StringIO('\n'.join(lines) + '\n')
+        with unittest.mock.patch('sys.stdin', stdin), unittest.mock.patch('sys.stderr', io.StringIO()) as stderr:
+            solution_packed.main(['pack', '-', self.path, '--solve', '--workers', '0'])
+        with solution_packed.PackedReader(self.path) as reader:
+            self.assertEqual(list(reader.items()), [(TestDiagonalSudoku.diagonal_grid, TestSolveMany.solutions[0]),
+                                                    ('1' * 81, None)])
+        self.assertIn('line 4:', stderr.getvalue())
+
+    def test_malformed_grid(self):
+        for grid in ('X' * 81, '1' * 80):
+            self.assertRaises(ValueError, solution_packed.pack, self.path, [TestDiagonalSudoku.diagonal_grid, grid])
+            self.assertFalse(os.path.exists(self.path))
+
+    def test_command_line(self):
+        solution_packed.pack(self.path, [TestDiagonalSudoku.diagonal_grid, '1' * 81])
+        with unittest.mock.patch('sys.stdout', io.StringIO()) as stdout, unittest.mock.patch('sys.stderr', io.StringIO()):
+            solution_cli.main([self.path, '--packed', '--workers', '0'])
+        output = [line.split() for line in stdout.getvalue().splitlines()]
+        self.assertEqual([(number, sol) for number,sol,_ in output],
+                         [('1', TestSolveMany.solutions[0]), ('2', '-')])
+
+
+class TestGeometry(unittest.TestCase):
+    hardest = '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......'
+
+    def test_cached(self):
+        self.assertIs(solution_utils.geometry(diagonal=True), solution_utils.diagonal_geometry)
+        self.assertIs(pickle.loads(pickle.dumps(solution_utils.standard_geometry)), solution_utils.standard_geometry)
+        windoku = [solution_utils.cross(rs, cs) for rs in ('BCD', 'FGH') for cs in ('234', '678')]
+        self.assertIs(solution_utils.geometry(extra_units=windoku), solution_utils.geometry(extra_units=windoku))
+        self.assertEqual(len(solution_utils.geometry(extra_units=windoku).unitlist), 31)
+
+    def test_tables(self):
+        self.assertEqual(len(solution_utils.standard_geometry.unitlist), 27)
+        self.assertEqual(len(solution_utils.standard_geometry.peers['A1']), 20)
+        self.assertEqual(len(solution_utils.diagonal_geometry.peers['A1']), 26)
+        self.assertEqual(set(solution_utils.diagonal_geometry.peers['A1']),
+                         set(solution_utils.peers['A1']))
+
+    def test_mixed_workload_in_threads(self):
+        jobs = [(self.hardest, solution_utils.standard_geometry),
+                (TestDiagonalSudoku.diagonal_grid, solution_utils.diagonal_geometry)] * 4
+        expected = [solution.solve(grid, geometry=geometry) for grid,geometry in jobs]
+        self.assertTrue(expected[0] and expected[1])
+        with ThreadPoolExecutor(4) as executor:
+            solved = list(executor.map(lambda job: solution.solve(job[0], geometry=job[1]), jobs))
+        self.assertEqual(solved, expected)
+        self.assertEqual(solution.solve(self.hardest, bitmask=True, geometry=solution_utils.standard_geometry),
+                         expected[0])
+
+
+class TestStartup(unittest.TestCase):
+    def imported(self, module):
+        """The heavy modules a fresh interpreter has imported after importing module."""
+        code = ('import sys, {}; print(" ".join(m for m in ("asyncio", "multiprocessing", "numpy", "pygame", '
+                '"solution_numpy") if m in sys.modules))').format(module)
+        directory = os.path.dirname(os.path.abspath(__file__))
+        return subprocess.run([sys.executable, '-c', code], cwd=directory, capture_output=True, check=True,
+                              text=True).stdout.split()
+
+    def test_light_imports(self):
+        for module in ('solution', 'solution_batch', 'visualize'):
+            self.assertEqual(self.imported(module), [], module)
+
+    def test_lazy_tables(self):
+        geometry = solution_utils.Geometry(size=2)
+        self.assertEqual(len(geometry.peers['A1']), 7)
+        self.assertEqual(geometry.unit_indices[0], (0, 1, 2, 3))
+        self.assertRaises(AttributeError, getattr, geometry, 'no_such_table')
+        self.assertEqual(len(solution_utils.peers['A1']), 26)
+        self.assertIs(solution.units, solution_utils.units)
+        self.assertIs(solution.peers, solution_utils.peers)
+
+    def test_import_times(self):
+        times = solution_benchmark.import_times(['solution'], repeat=1)
+        self.assertGreater(times['solution'], 0)
+
+
+class TestBoardSizes(unittest.TestCase):
+    shidoku = '1...' '..2.' '.3..' '...4'
+    hexadoku = ('C...7.E...6..D9B' '.4.1....2..BC.F.' 'GA63..9.C8.5..E1' '2D9BC8F5.......3'
+                '...7.E1G.63.D.B.' '4.1GA.32D.BC.F..' 'A63..9...F5..E1G' 'D.BC....4...A...'
+                'F5.4...A63.D9B.8' '.1.A.32.9....574' '..2D........E1.A' '9B...57.E1.A6..D'
+                '574...A6...9BC.F' '..A632D9BC8F.7.E' '..D..C...74..G.6' '.C......1G..32..')
+
+    def test_tables(self):
+        for size,n_units,n_peers in ((2, 12, 7), (3, 27, 20), (4, 48, 39), (5, 75, 64)):
+            geometry = solution_utils.geometry(size=size)
+            self.assertEqual(len(geometry.boxes), size**4)
+            self.assertEqual(len(geometry.unitlist), n_units)
+            self.assertEqual({len(peers) for peers in geometry.peers.values()}, {n_peers})
+        self.assertIs(solution_utils.geometry(size=4), solution_utils.geometry(size=4))
+
+    def assertSolved(self, solved, grid, geometry):
+        self.assertTrue(solved)
+        self.assertTrue(all(sorted(solved[box] for box in unit) == sorted(geometry.digits)
+                            for unit in geometry.unitlist))
+        self.assertTrue(all(solved[box] == clue for box,clue in zip(geometry.boxes, grid) if clue != '.'))
+
+    def test_solve(self):
+        for grid,size in ((self.shidoku, 2), (self.hexadoku, 4)):
+            geometry = solution_utils.geometry(size=size)
+            # Past 9x9 the cores break ties between boxes in different orders, so check each solution.
+            for bitmask in (False, True):
+                self.assertSolved(solution.solve(grid, bitmask=bitmask, geometry=geometry), grid, geometry)
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_corpora(self):
+        for name,(_, geometry) in solution_benchmark.corpora.items():
+            grids = solution_benchmark.load_corpus(name)
+            self.assertTrue(grids)
+            self.assertTrue(all(len(grid) == len(geometry.boxes) for grid in grids))
+
+    def test_counters_reset_per_run(self):
+        first = solution_benchmark.run(['17clue'], repeat=1, warmup=1, bitmask=True)
+        second = solution_benchmark.run(['17clue'], repeat=1, warmup=0, bitmask=True)
+        self.assertEqual(first['corpora']['17clue']['counters'], second['corpora']['17clue']['counters'])
+        self.assertEqual(first['corpora']['17clue']['n_solved'], 13)
+
+    def test_report_object_options(self):
+        results = solution_benchmark.run(['easy'], repeat=1, warmup=0, dead_ends=solution.DeadEnds())
+        out = io.StringIO()
+        solution_benchmark.report(results, out)
+        self.assertIn('DeadEnds', out.getvalue())
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(solution_benchmark.percentile(values, 0.50), 50)
+        self.assertEqual(solution_benchmark.percentile(values, 0.95), 95)
+        self.assertEqual(solution_benchmark.percentile([7], 0.95), 7)
+
+    def test_compare(self):
+        def results(p50, pps):
+            corpus = {'p50': p50, 'p95': p50, 'max': p50, 'puzzles_per_second': pps, 'counters': {'search_invocations': 1}}
+            return {'corpora': {'easy': corpus}}
+        _, regressions = solution_benchmark.compare(results(1.0, 100), results(1.05, 96))
+        self.assertEqual(regressions, [])
+        _, regressions = solution_benchmark.compare(results(1.0, 100), results(1.5, 60))
+        self.assertEqual({metric for _,metric,_,_,_ in regressions}, {'p50', 'p95', 'max', 'puzzles_per_second'})
+
+
+def bitmask_strategy(strategy, values):
+    """Run a solution_bitmask strategy on a values dictionary and return a values dictionary."""
+    return solution_bitmask.values_from_cells(strategy(solution_bitmask.cells_from_values(values)))
+
+
+class TestBitmaskNakedTwins(unittest.TestCase):
+    before_naked_twins_1 = dict(TestNakedTwins.before_naked_twins_1)
+    before_naked_twins_2 = dict(TestNakedTwins.before_naked_twins_2)
+
+    def test_naked_twins(self):
+        self.assertTrue(bitmask_strategy(solution_bitmask.naked_twins, self.before_naked_twins_1)
+                        in TestNakedTwins.possible_solutions_1,
+                        "Your naked_twins function produced an unexpected board.")
+
+    def test_naked_twins2(self):
+        self.assertTrue(bitmask_strategy(solution_bitmask.naked_twins, self.before_naked_twins_2)
+                        in TestNakedTwins.possible_solutions_2,
+                        "Your naked_twins function produced an unexpected board.")
+
+
+class TestBitmaskDiagonalSudoku(unittest.TestCase):
+    def test_solve(self):
+        self.assertEqual(solution.solve(TestDiagonalSudoku.diagonal_grid, bitmask=True),
+                         TestDiagonalSudoku.solved_diag_sudoku)
+
+
+class TestBitmaskHiddenTwins(unittest.TestCase):
+    before_hidden_twins = dict(TestHiddenTwins.before_hidden_twins)
+
+    def test_hidden_twins(self):
+        self.assertEqual(bitmask_strategy(solution_bitmask.hidden_twins, self.before_hidden_twins),
+                         TestHiddenTwins.after_hidden_twins)
+
+
 if __name__ == '__main__':
     unittest.main()
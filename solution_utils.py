@@ -1,3 +1,8 @@
+from functools import lru_cache
+from types import MappingProxyType
+import math
+
+
 def cross(A, B):
     "Cross product of elements in A and elements in B."
     return [s+t for s in A for t in B]
@@ -12,5 +17,115 @@ column_units = [cross(rows, c) for c in cols]
 square_units = [cross(rs, cs) for rs in ('ABC','DEF','GHI') for cs in ('123','456','789')]
 diagonal_units = [[r+c for r,c in zip(rows, cols)], [r+c for r,c in zip(reversed(rows), cols)]]
 unitlist = row_units + column_units + square_units + diagonal_units
-units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
-peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
+# units and peers, the costly tables, are built on first use by __getattr__ below. Being lazy, they
+# are not brought in by `from solution_utils import *`; solution forwards them the same way.
+
+
+@lru_cache(maxsize=None)
+def _box_tables():
+    units = dict((s, [u for u in unitlist if s in u]) for s in boxes)
+    peers = dict((s, set(sum(units[s],[]))-set([s])) for s in boxes)
+    return {'units': units, 'peers': peers}
+
+
+def __getattr__(name):
+    if name in ('units', 'peers'):
+        return _box_tables()[name]
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+symbols = '123456789ABCDEFGHIJKLMNOP'  # Digits of boards up to 25x25, one character each.
+
+
+class Geometry:
+    """The boxes, units and peers of a Sudoku variant, precomputed once.
+
+    Build geometries with `geometry`, which caches them, rather than directly. A geometry is never
+    changed once its tables are built, and building them only fills in the same values, so one can
+    be shared by any number of solves running at the same time.
+
+    Attributes:
+        size: the side of a square; the board has size**2 rows, columns and digits.
+        rows, cols, digits: row labels, column labels (strings, since they may run past '9') and
+            the one-character digits of the board. For size 3 these are the module-level ones.
+        boxes: list of box names, row-wise, e.g., ['A1', ..., 'P16'] for size 4.
+        unitlist: tuple of units, each a tuple of box names.
+        units: mapping from each box to the tuple of units that contain it.
+        peers: mapping from each box to the frozenset of its peers.
+        unit_indices, peer_indices: the same tables in terms of box indices (positions in `boxes`),
+            for the bitmask engine in solution_bitmask.
+
+    units, peers, unit_indices and peer_indices are built the first time one of them is used, by
+    __getattr__ writing them into their slots, so making a geometry (e.g., the module-level ones, on
+    import) is cheap.
+    """
+    __slots__ = ('size', 'diagonal', 'extra_units', 'rows', 'cols', 'digits', 'boxes',
+                 'unitlist', 'units', 'peers', 'unit_indices', 'peer_indices')
+
+    def __init__(self, diagonal=False, extra_units=(), size=3):
+        if not 2 <= size <= 5:
+            raise ValueError('boards from 4x4 to 25x25 are supported, not size {}'.format(size))
+        side = size * size
+        self.size = size
+        self.diagonal = diagonal
+        self.extra_units = extra_units
+        self.rows = 'ABCDEFGHIJKLMNOPQRSTUVWXY'[:side]
+        self.cols = [str(c) for c in range(1, side + 1)]
+        self.digits = symbols[:side]
+        self.boxes = cross(self.rows, self.cols)
+
+        bands = [self.rows[i:i+size] for i in range(0, side, size)]
+        stacks = [self.cols[i:i+size] for i in range(0, side, size)]
+        unitlist = ([cross(r, self.cols) for r in self.rows] +
+                    [cross(self.rows, [c]) for c in self.cols] +
+                    [cross(rs, cs) for rs in bands for cs in stacks])
+        if diagonal:
+            unitlist += [[r+c for r,c in zip(self.rows, self.cols)],
+                         [r+c for r,c in zip(reversed(self.rows), self.cols)]]
+        self.unitlist = tuple(tuple(unit) for unit in unitlist + list(extra_units))
+
+    def __getattr__(self, name):
+        # Only called while a slot is unset, i.e., before the first use of the tables below.
+        if name not in ('units', 'peers', 'unit_indices', 'peer_indices'):
+            raise AttributeError('{!r} object has no attribute {!r}'.format(type(self).__name__, name))
+        self.units = MappingProxyType({s: tuple(u for u in self.unitlist if s in u) for s in self.boxes})
+        self.peers = MappingProxyType({s: frozenset(sum(self.units[s], ())) - {s} for s in self.boxes})
+
+        box_index = {box: i for i,box in enumerate(self.boxes)}
+        self.unit_indices = tuple(tuple(box_index[box] for box in unit) for unit in self.unitlist)
+        self.peer_indices = tuple(tuple(sorted(box_index[peer] for peer in self.peers[box])) for box in self.boxes)
+        return getattr(self, name)
+
+    def __reduce__(self):
+        # Rebuild (or fetch from the cache) in the receiving process, e.g., a worker of solve_many.
+        return geometry, (self.diagonal, self.extra_units, self.size)
+
+    def __repr__(self):
+        return 'geometry(diagonal={!r}, extra_units={!r}, size={!r})'.format(self.diagonal, self.extra_units, self.size)
+
+
+@lru_cache(maxsize=None)
+def _geometry(diagonal, extra_units, size):
+    return Geometry(diagonal, extra_units, size)
+
+
+def geometry(diagonal=False, extra_units=(), size=3):
+    """The cached Geometry of a Sudoku variant.
+    Args:
+        diagonal(bool): include the two main diagonals as units.
+        extra_units: any further units, each an iterable of box names, e.g., for a Windoku.
+        size(int): the side of a square: 2 for 4x4 boards, 3 for 9x9, 4 for 16x16, 5 for 25x25.
+    Returns:
+        A Geometry, the same object for the same arguments.
+    """
+    return _geometry(bool(diagonal), tuple(tuple(unit) for unit in extra_units), size)
+
+
+standard_geometry = geometry()
+diagonal_geometry = geometry(diagonal=True)
+
+
+def percentile(sorted_values, fraction):
+    """The value below which the given fraction of sorted_values lie (nearest rank)."""
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
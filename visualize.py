@@ -1,17 +1,128 @@
-from PySudoku import play
+"""Replay the assignments of a solve, in a pygame window or exported to image files.
+
+Usage: python visualize.py GRID OUT [--standard] [--max-frames N]
+    solves GRID (a 9x9 grid in the form accepted by solution.solve) and writes its replay to OUT,
+    an animated GIF if OUT ends in .gif, or else a pattern such as frames/%05d.png for a sequence
+    of images. No display is needed.
+
+pygame is only imported once a replay is shown or exported, so importing this module is cheap.
+"""
+import solution_recording
+
+import argparse
+
+
+def assignment_frames(assignments):
+    """The frames of a replay of assignments, as changes from the frame before (see
+    solution_recording.frame_changes). assignments is an iterable of boards, or a DeltaRecorder."""
+    if isinstance(assignments, solution_recording.DeltaRecorder):
+        return assignments.frame_changes()
+    return solution_recording.frame_changes(assignments)
+
 
 def visualize_assignments(assignments):
     """ Visualizes the set of assignments created by the Sudoku AI"""
-    last_assignment = None
-    filtered_assignments = []
-
-    for i in range(len(assignments)):
-        if last_assignment:
-            last_assignment_items = [item for item in last_assignment.items() if len(item[1]) == 1]
-            current_assignment_items = [item for item in assignments[i].items() if len(item[1]) == 1]
-            shared_items = set(last_assignment_items) & set(current_assignment_items)
-            if len(shared_items) < len(current_assignment_items):
-                filtered_assignments.append(assignments[i])
-        last_assignment = assignments[i]
-
-    play(filtered_assignments)
+    from PySudoku import play
+
+    play(assignment_frames(assignments))
+
+
+def check_path(path):
+    """Raise ValueError unless path names a GIF or is a pattern with one field for the frame number."""
+    if path.lower().endswith('.gif'):
+        return
+    try:
+        path % 1
+    except (TypeError, ValueError):
+        raise ValueError("{!r} is neither a .gif file nor a pattern with a field for the frame number, "
+                         "e.g., 'frames/%05d.png'".format(path)) from None
+
+
+def export_assignments(assignments, path, max_frames=1000, scale=0.5, duration=200):
+    """Render a replay of assignments to image files, without a display.
+    Args:
+        assignments: the boards of a solve, or the DeltaRecorder that recorded it.
+        path(string): a file name ending in .gif for an animated GIF, which needs Pillow. Otherwise
+            a pattern with a field for the frame number, e.g., 'frames/%05d.png', for one image
+            per frame in any format pygame.image.save can write.
+        max_frames(int): the most frames kept for a GIF. Longer replays keep every other frame,
+            then every fourth, and so on, and always end on the last frame, so memory stays bounded.
+        scale(float): the size of GIF frames relative to the 700x700 board.
+        duration(int): the milliseconds each GIF frame is shown.
+    Returns:
+        The number of frames written.
+    Raises:
+        ValueError: if path is neither a GIF nor a pattern, checked before anything is rendered.
+    """
+    check_path(path)
+    from PySudoku import renderFrames
+    import pygame
+
+    frames = renderFrames(assignment_frames(assignments))
+    if path.lower().endswith('.gif'):
+        return export_gif(frames, path, max_frames, scale, duration)
+    n = 0
+    for n,surface in enumerate(frames, 1):
+        pygame.image.save(surface, path % n)
+    return n
+
+
+def export_gif(frames, path, max_frames=1000, scale=0.5, duration=200):
+    import pygame
+
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError('exporting a GIF needs Pillow; install it with pip install Pillow, '
+                          'or export a sequence of PNG images') from None
+    to_bytes = getattr(pygame.image, 'tobytes', None) or pygame.image.tostring
+
+    def image(surface):
+        size = [int(side * scale) for side in surface.get_size()]
+        return (Image.frombytes('RGB', surface.get_size(), to_bytes(surface, 'RGB'))
+                .resize(size).convert('P', palette=Image.ADAPTIVE))
+
+    kept = []  # (frame number, image) of every stride-th frame.
+    stride = 1
+    last = None
+    for i,surface in enumerate(frames):
+        last = i
+        if i % stride == 0:
+            kept.append((i, image(surface)))
+            if len(kept) > max_frames:
+                kept = kept[::2]
+                stride *= 2
+    if not kept:
+        return 0
+    if kept[-1][0] != last:
+        kept.append((last, image(surface)))
+
+    images = [img for _,img in kept]
+    images[0].save(path, save_all=True, append_images=images[1:], duration=duration, loop=0)
+    return len(images)
+
+
+def main(argv=None):
+    import solution
+    import solution_utils
+
+    parser = argparse.ArgumentParser(description='Solve a grid and export the replay of its assignments.')
+    parser.add_argument('grid', help='the 9x9 grid to solve')
+    parser.add_argument('out', help="animated GIF (.gif), or a pattern such as 'frames/%%05d.png'")
+    parser.add_argument('--standard', action='store_true', help='solve standard rather than diagonal Sudoku')
+    parser.add_argument('--max-frames', type=int, default=1000, help='most frames kept in a GIF')
+    args = parser.parse_args(argv)
+    try:
+        check_path(args.out)
+    except ValueError as e:
+        parser.error(str(e))
+
+    recorder = solution_recording.DeltaRecorder()
+    geometry = solution_utils.standard_geometry if args.standard else solution_utils.diagonal_geometry
+    solution.solve(args.grid, recorder=recorder, geometry=geometry)
+    n = export_assignments(recorder, args.out, args.max_frames)
+    print('{} frames written'.format(n))
+
+
+if __name__ == '__main__':
+    main()